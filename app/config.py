@@ -19,8 +19,16 @@ class Settings:
         self.gestaods_api_url = os.getenv('GESTAODS_API_URL', 'https://apidev.gestaods.com.br')
         self.gestaods_token = os.getenv('GESTAODS_TOKEN', '733a8e19a94b65d58390da380ac946b6d603a535')
 
+        self.gestaods_cache_ttl = float(os.getenv('GESTAODS_CACHE_TTL', '300'))
+        self.gestaods_negative_cache_ttl = float(os.getenv('GESTAODS_NEGATIVE_CACHE_TTL', '60'))
+        self.gestaods_cache_max_entries = int(os.getenv('GESTAODS_CACHE_MAX_ENTRIES', '5000'))
+        self.gestaods_cache_max_bytes = int(os.getenv('GESTAODS_CACHE_MAX_BYTES', '5000000'))
+
         # Database - Configuração inteligente baseada no ambiente
         self.database_url = self._get_database_url()
+        self.db_async_mode = os.getenv('DB_ASYNC_MODE', 'False').lower() == 'true'
+        self.db_async_pool_size = int(os.getenv('DB_ASYNC_POOL_SIZE', '10'))
+        self.db_async_max_overflow = int(os.getenv('DB_ASYNC_MAX_OVERFLOW', '10'))
         
         # Supabase
         self.supabase_url = os.getenv('SUPABASE_URL', '')
@@ -48,7 +56,62 @@ class Settings:
         self.clinic_address = os.getenv('CLINIC_ADDRESS', 'Rua Example, 123 - Savassi\nBelo Horizonte - MG')
         self.reminder_hour = int(os.getenv('REMINDER_HOUR', '18'))
         self.reminder_minute = int(os.getenv('REMINDER_MINUTE', '0'))
-        
+
+        # Ingestão assíncrona do webhook
+        self.webhook_async_ingestion = os.getenv('WEBHOOK_ASYNC_INGESTION', 'False').lower() == 'true'
+        self.webhook_queue_maxsize = int(os.getenv('WEBHOOK_QUEUE_MAXSIZE', '1000'))
+        self.webhook_queue_workers = int(os.getenv('WEBHOOK_QUEUE_WORKERS', '4'))
+
+        # Deduplicação de eventos do webhook (messageId)
+        self.webhook_dedup_ttl = int(os.getenv('WEBHOOK_DEDUP_TTL', '3600'))
+        self.webhook_dedup_max_entries = int(os.getenv('WEBHOOK_DEDUP_MAX_ENTRIES', '10000'))
+        self.webhook_dedup_inflight_ttl = int(os.getenv('WEBHOOK_DEDUP_INFLIGHT_TTL', '120'))
+        self.redis_url = os.getenv('REDIS_URL', '')
+
+        # Pool de conexões HTTP (Z-API / GestãoDS)
+        self.http_pool_max_connections = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', '20'))
+        self.http_pool_max_keepalive = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', '10'))
+        self.http_pool_keepalive_expiry = float(os.getenv('HTTP_POOL_KEEPALIVE_EXPIRY', '30'))
+        self.http_pool_http2 = os.getenv('HTTP_POOL_HTTP2', 'True').lower() == 'true'
+        self.zapi_timeout = float(os.getenv('ZAPI_TIMEOUT', '30'))
+        self.zapi_endpoint_timeouts = os.getenv('ZAPI_ENDPOINT_TIMEOUTS', 'status=10')
+
+        # Cache/prefetch de disponibilidade (dias e horários)
+        self.availability_cache_ttl = float(os.getenv('AVAILABILITY_CACHE_TTL', '60'))
+        self.availability_stale_ttl = float(os.getenv('AVAILABILITY_STALE_TTL', '900'))
+        self.availability_prefetch_enabled = os.getenv('AVAILABILITY_PREFETCH_ENABLED', 'False').lower() == 'true'
+        self.availability_prefetch_days = int(os.getenv('AVAILABILITY_PREFETCH_DAYS', '7'))
+        self.availability_prefetch_interval = float(os.getenv('AVAILABILITY_PREFETCH_INTERVAL', '120'))
+        self.availability_fanout_concurrency = int(os.getenv('AVAILABILITY_FANOUT_CONCURRENCY', '4'))
+
+        # Índice local de agendamentos por CPF
+        self.appointment_index_sync_enabled = os.getenv('APPOINTMENT_INDEX_SYNC_ENABLED', 'False').lower() == 'true'
+        self.appointment_index_horizon_days = int(os.getenv('APPOINTMENT_INDEX_HORIZON_DAYS', '365'))
+        self.appointment_index_sync_interval = float(os.getenv('APPOINTMENT_INDEX_SYNC_INTERVAL', '300'))
+        self.appointment_index_max_staleness = float(os.getenv('APPOINTMENT_INDEX_MAX_STALENESS', '3600'))
+        self.appointment_index_hint_ttl = float(os.getenv('APPOINTMENT_INDEX_HINT_TTL', '60'))
+
+        # Estado das conversas em memória (write-behind; 0 = grava no commit de cada turno)
+        self.conversation_store_enabled = os.getenv('CONVERSATION_STORE_ENABLED', 'False').lower() == 'true'
+        self.conversation_store_max_entries = int(os.getenv('CONVERSATION_STORE_MAX_ENTRIES', '5000'))
+        self.conversation_store_idle_ttl = float(os.getenv('CONVERSATION_STORE_IDLE_TTL', '1800'))
+        self.conversation_store_flush_interval = float(os.getenv('CONVERSATION_STORE_FLUSH_INTERVAL', '0'))
+
+        # Memo LRU do NLU (mensagens curtas e repetidas: "1", "oi", "sim"...)
+        self.nlu_memo_size = int(os.getenv('NLU_MEMO_SIZE', '2048'))
+        self.nlu_memo_max_length = int(os.getenv('NLU_MEMO_MAX_LENGTH', '32'))
+
+        # Auditoria (PatientTransaction/DecisionLog) gravada em lote fora do turno
+        self.audit_async_enabled = os.getenv('AUDIT_ASYNC_ENABLED', 'False').lower() == 'true'
+        self.audit_queue_maxsize = int(os.getenv('AUDIT_QUEUE_MAXSIZE', '10000'))
+        self.audit_batch_size = int(os.getenv('AUDIT_BATCH_SIZE', '200'))
+        self.audit_flush_interval = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1.0'))
+        self.audit_enqueue_timeout = float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', '0.5'))
+
+        # Cache de pacientes em memória (L1) na frente da tabela patient_cache (L2)
+        self.patient_cache_l1_ttl = float(os.getenv('PATIENT_CACHE_L1_TTL', '30'))
+        self.patient_cache_l1_max_entries = int(os.getenv('PATIENT_CACHE_L1_MAX_ENTRIES', '5000'))
+
         # Log da configuração
         self._log_configuration()
     
@@ -164,7 +227,14 @@ def create_fallback_settings():
             self.zapi_base_url = "https://api.z-api.io"
             self.gestaods_api_url = "https://apidev.gestaods.com.br"
             self.gestaods_token = ""
+            self.gestaods_cache_ttl = 300.0
+            self.gestaods_negative_cache_ttl = 60.0
+            self.gestaods_cache_max_entries = 5000
+            self.gestaods_cache_max_bytes = 5000000
             self.database_url = ""
+            self.db_async_mode = False
+            self.db_async_pool_size = 10
+            self.db_async_max_overflow = 10
             self.supabase_url = ""
             self.supabase_service_role_key = ""
             self.app_host = "https://chatbot-clincia.vercel.app"
@@ -174,7 +244,44 @@ def create_fallback_settings():
             self.clinic_phone = "+553198600366"
             self.clinic_email = "contato@clinicanassif.com.br"
             self.clinic_address = "Endereço não configurado"
-        
+            self.webhook_async_ingestion = False
+            self.webhook_queue_maxsize = 1000
+            self.webhook_queue_workers = 4
+            self.webhook_dedup_ttl = 3600
+            self.webhook_dedup_max_entries = 10000
+            self.webhook_dedup_inflight_ttl = 120
+            self.redis_url = ""
+            self.http_pool_max_connections = 20
+            self.http_pool_max_keepalive = 10
+            self.http_pool_keepalive_expiry = 30.0
+            self.http_pool_http2 = True
+            self.zapi_timeout = 30.0
+            self.zapi_endpoint_timeouts = "status=10"
+            self.availability_cache_ttl = 60.0
+            self.availability_stale_ttl = 900.0
+            self.availability_prefetch_enabled = False
+            self.availability_prefetch_days = 7
+            self.availability_prefetch_interval = 120.0
+            self.availability_fanout_concurrency = 4
+            self.appointment_index_sync_enabled = False
+            self.appointment_index_horizon_days = 365
+            self.appointment_index_sync_interval = 300.0
+            self.appointment_index_max_staleness = 3600.0
+            self.appointment_index_hint_ttl = 60.0
+            self.conversation_store_enabled = False
+            self.conversation_store_max_entries = 5000
+            self.conversation_store_idle_ttl = 1800.0
+            self.conversation_store_flush_interval = 0.0
+            self.nlu_memo_size = 2048
+            self.nlu_memo_max_length = 32
+            self.audit_async_enabled = False
+            self.audit_queue_maxsize = 10000
+            self.audit_batch_size = 200
+            self.audit_flush_interval = 1.0
+            self.audit_enqueue_timeout = 0.5
+            self.patient_cache_l1_ttl = 30.0
+            self.patient_cache_l1_max_entries = 5000
+
         def is_vercel(self):
             return bool(os.getenv('VERCEL'))
         
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from app.models.database import get_db
 from app.config import settings
+from app.utils.http_clients import get_http_client_pool
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,109 @@ def get_conversation_manager():
             raise
     return _conversation_manager
 
+# Fila de ingestão assíncrona (WEBHOOK_ASYNC_INGESTION=true)
+_webhook_queue = None
+
+def get_webhook_queue():
+    """Retorna instância singleton da fila de ingestão do webhook"""
+    global _webhook_queue
+    if _webhook_queue is None:
+        from app.services.webhook_queue import WebhookIngestionQueue
+        _webhook_queue = WebhookIngestionQueue(
+            processor=_process_queued_event,
+            workers=settings.webhook_queue_workers,
+            maxsize=settings.webhook_queue_maxsize
+        )
+    return _webhook_queue
+
+# Deduplicação de redeliveries da Z-API pelo messageId
+_dedup_store = None
+
+def get_dedup_store():
+    """Retorna instância singleton do store de deduplicação"""
+    global _dedup_store
+    if _dedup_store is None:
+        from app.utils.dedup_store import MessageDedupStore, RedisDedupBackend
+        backend = RedisDedupBackend(settings.redis_url) if settings.redis_url else None
+        _dedup_store = MessageDedupStore(
+            max_entries=settings.webhook_dedup_max_entries,
+            ttl_seconds=settings.webhook_dedup_ttl,
+            inflight_ttl=settings.webhook_dedup_inflight_ttl,
+            backend=backend
+        )
+    return _dedup_store
+
+# Processamento inline (fila desligada ou cheia): limite para responder à Z-API
+INLINE_PROCESSING_TIMEOUT = 30.0
+
+async def _process_queued_event(data: dict):
+    """
+    Processa evento retirado da fila com sessão de banco própria
+
+    A fila é em memória: o messageId só é marcado como processado depois do
+    turno. Falha ou timeout do worker (CancelledError) liberam o ID; evento
+    perdido em crash/restart volta a ser aceito quando o inflight_ttl expira.
+    """
+    message_id = data.get("messageId", "")
+    dedup_store = get_dedup_store()
+
+    # A sessão da requisição já foi encerrada quando o worker roda
+    try:
+        await process_message_event(data, get_db())
+    except BaseException:
+        await asyncio.shield(dedup_store.release(message_id))
+        raise
+    await dedup_store.complete(message_id)
+
+def _duplicate_response() -> Dict[str, Any]:
+    return {
+        "status": "duplicate",
+        "message": "Mensagem já recebida, ignorando redelivery",
+        "timestamp": datetime.now().isoformat() + "Z"
+    }
+
+async def _ingest_received_callback(data: dict) -> Dict[str, Any]:
+    """Enfileira o ReceivedCallback (modo assíncrono) ou processa inline com timeout"""
+    message_id = data.get("messageId", "")
+    dedup_store = get_dedup_store()
+
+    # Curto-circuito antes de qualquer trabalho de banco/rede (ID fica "em andamento")
+    if await dedup_store.claim(message_id):
+        logger.info(f"🔁 Mensagem {message_id} duplicada, ignorando")
+        return _duplicate_response()
+
+    if settings.webhook_async_ingestion and get_webhook_queue().enqueue(data):
+        return {
+            "status": "queued",
+            "message": "Mensagem recebida para processamento",
+            "timestamp": datetime.now().isoformat() + "Z"
+        }
+
+    try:
+        await asyncio.wait_for(
+            process_message_event(data, get_db()),
+            timeout=INLINE_PROCESSING_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        # Libera o ID: a redelivery da Z-API processa o evento de novo
+        await dedup_store.release(message_id)
+        logger.error("❌ Timeout no processamento da mensagem")
+        return {
+            "status": "timeout",
+            "message": f"Processamento demorou mais que {INLINE_PROCESSING_TIMEOUT:.0f} segundos",
+            "timestamp": datetime.now().isoformat() + "Z"
+        }
+    except Exception:
+        await dedup_store.release(message_id)
+        raise
+
+    await dedup_store.complete(message_id)
+    return {
+        "status": "success",
+        "message": "Mensagem processada com sucesso",
+        "timestamp": datetime.now().isoformat() + "Z"
+    }
+
 @router.get("/")
 async def webhook_health():
     """Endpoint de saúde do webhook"""
@@ -73,7 +177,7 @@ async def webhook_health_check():
         }
 
 @router.post("/message")
-async def webhook_message(request: Request, db: Session = Depends(get_db)):
+async def webhook_message(request: Request):
     """Handler principal para mensagens recebidas"""
     try:
         logger.info("=== WEBHOOK MESSAGE RECEBIDO ===")
@@ -91,26 +195,8 @@ async def webhook_message(request: Request, db: Session = Depends(get_db)):
             logger.warning("❌ Dados do webhook inválidos")
             raise HTTPException(status_code=400, detail="Dados do webhook inválidos")
         
-        # Processar mensagem com timeout
-        try:
-            await asyncio.wait_for(
-                process_message_event(data, db),
-                timeout=30.0
-            )
-            
-            return {
-                "status": "success",
-                "message": "Mensagem processada com sucesso",
-                "timestamp": datetime.now().isoformat() + "Z"
-            }
-            
-        except asyncio.TimeoutError:
-            logger.error("❌ Timeout no processamento da mensagem")
-            return {
-                "status": "timeout",
-                "message": "Processamento demorou mais que 30 segundos",
-                "timestamp": datetime.now().isoformat() + "Z"
-            }
+        # Enfileirar ou processar mensagem com timeout
+        return await _ingest_received_callback(data)
         
     except HTTPException:
         raise
@@ -188,7 +274,7 @@ async def webhook_connected(request: Request):
         }
 
 @router.post("/")
-async def webhook_handler_root(request: Request, db: Session = Depends(get_db)):
+async def webhook_handler_root(request: Request):
     """Handler principal para webhook - endpoint raiz"""
     try:
         logger.info("=== WEBHOOK PRINCIPAL RECEBIDO ===")
@@ -205,24 +291,10 @@ async def webhook_handler_root(request: Request, db: Session = Depends(get_db)):
         event_type = data.get("type", "")
         
         if event_type == "ReceivedCallback":
-            # Processar mensagem recebida
-            try:
-                await asyncio.wait_for(
-                    process_message_event(data, db),
-                    timeout=30.0
-                )
-                return {
-                    "status": "success",
-                    "message": "Mensagem processada com sucesso",
-                    "event_type": event_type,
-                    "timestamp": datetime.now().isoformat() + "Z"
-                }
-            except asyncio.TimeoutError:
-                return {
-                    "status": "timeout",
-                    "message": "Processamento demorou mais que 30 segundos",
-                    "timestamp": datetime.now().isoformat() + "Z"
-                }
+            # Enfileirar ou processar mensagem recebida
+            result = await _ingest_received_callback(data)
+            result["event_type"] = event_type
+            return result
         elif event_type == "DeliveryCallback":
             # Processar confirmação de entrega
             logger.info("📬 Confirmação de entrega recebida")
@@ -307,12 +379,12 @@ async def process_message_event(data: dict, db: Session):
         # Processar mensagem
         conversation_manager = get_conversation_manager()
         
-        # 🔧 CORREÇÃO CRÍTICA: Passar db corretamente
+        # 🔧 CORREÇÃO CRÍTICA: Passar db corretamente (sessão ou generator de get_db)
         await conversation_manager.processar_mensagem(
-            phone=phone,
-            message=message_text,
-            message_id=message_id,
-            db=db
+            phone,
+            message_text,
+            message_id,
+            db
         )
         
         logger.info("=== PROCESSAMENTO CONCLUÍDO ===")
@@ -457,6 +529,43 @@ async def webhook_status_info():
         logger.error(f"❌ Erro no status info: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro interno")
 
+@router.get("/metrics")
+async def webhook_metrics():
+    """Métricas de desempenho do pipeline de mensagens"""
+    try:
+        from app.services.gestaods import get_request_stats as get_gestaods_request_stats
+        from app.services.gestaods import get_cache_stats as get_gestaods_cache_stats
+        from app.services.availability_cache import get_availability_cache
+        from app.services.appointment_index import get_appointment_index
+        from app.services.conversation_state_store import get_conversation_state_store
+        from app.models.context_tracking import conversation_write_stats
+        from app.services.audit_writer import get_audit_writer
+        from app.services.audit_blobs import get_audit_blob_store
+        from app.services.patient_cache import get_tiered_patient_cache
+        return {
+            "ingestion_queue": get_webhook_queue().get_stats(),
+            "phone_locks": get_conversation_manager().phone_locks.get_stats(),
+            "state_dispatch": get_conversation_manager().dispatcher.get_stats(),
+            "nlu_by_state": get_conversation_manager().nlu.get_stats(),
+            "nlu_memo": get_conversation_manager().nlu.get_memo_stats(),
+            "dedup": get_dedup_store().get_stats(),
+            "http_pool": get_http_client_pool().get_stats(),
+            "gestaods": get_gestaods_request_stats(),
+            "gestaods_cache": get_gestaods_cache_stats(),
+            "availability_cache": get_availability_cache().get_stats(),
+            "appointment_index": get_appointment_index().get_stats(),
+            "conversation_store": get_conversation_state_store().get_stats(),
+            "conversation_writes": conversation_write_stats.get_stats(),
+            "audit_writer": get_audit_writer().get_stats(),
+            "audit_blobs": get_audit_blob_store().get_stats(),
+            "patient_cache": get_tiered_patient_cache().get_stats(),
+            "async_ingestion": settings.webhook_async_ingestion,
+            "timestamp": datetime.now().isoformat() + "Z"
+        }
+    except Exception as e:
+        logger.error(f"❌ Erro nas métricas: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erro interno")
+
 # Fallback para rotas não encontradas (compatibilidade)
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def webhook_fallback(request: Request, path: str, db: Session = Depends(get_db)):
@@ -475,7 +584,19 @@ async def webhook_fallback(request: Request, path: str, db: Session = Depends(ge
                 # Se é um evento de mensagem, processar
                 event_type = data.get("type", "")
                 if event_type == "ReceivedCallback":
-                    await process_message_event(data, db)
+                    message_id = data.get("messageId", "")
+                    dedup_store = get_dedup_store()
+                    if await dedup_store.claim(message_id):
+                        logger.info(f"🔁 Mensagem {message_id} duplicada, ignorando")
+                        result = _duplicate_response()
+                        result["path"] = path
+                        return result
+                    try:
+                        await process_message_event(data, db)
+                    except Exception:
+                        await dedup_store.release(message_id)
+                        raise
+                    await dedup_store.complete(message_id)
                     return {
                         "status": "success",
                         "message": "Webhook processado via fallback",
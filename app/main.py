@@ -44,6 +44,38 @@ async def lifespan(app: FastAPI):
         app.state.db_health = db_health
         app.state.settings = settings
         
+        # Cliente HTTP compartilhado da Z-API (keep-alive entre requisições)
+        from app.utils.http_clients import get_http_client_pool
+        get_http_client_pool().get_client(f"zapi:{settings.zapi_instance_id}")
+        
+        # Prefetch de dias/horários para servir o agendamento da memória
+        if settings.availability_prefetch_enabled:
+            from app.services.availability_cache import get_availability_cache
+            get_availability_cache().start()
+        
+        # Sincronização do índice local de agendamentos por CPF
+        if settings.appointment_index_sync_enabled:
+            from app.services.appointment_index import get_appointment_index
+            get_appointment_index().start()
+        
+        # Flush em lote do estado das conversas (modo write-behind)
+        if settings.conversation_store_enabled:
+            from app.services.conversation_state_store import get_conversation_state_store
+            get_conversation_state_store().start()
+        
+        # Gravação em lote da auditoria (PatientTransaction/DecisionLog)
+        if settings.audit_async_enabled:
+            from app.services.audit_writer import audit_async_enabled, get_audit_writer
+            if audit_async_enabled():
+                get_audit_writer().start()
+            else:
+                logger.error("❌ Esquema da auditoria não migrado: gravação em lote desativada")
+        
+        # Workers da fila de ingestão do webhook
+        if settings.webhook_async_ingestion:
+            from app.handlers.webhook import get_webhook_queue
+            get_webhook_queue().start()
+        
         logger.info("✅ Aplicação iniciada com sucesso")
         
     except Exception as e:
@@ -55,6 +87,62 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🔄 Finalizando aplicação...")
+    
+    try:
+        from app.handlers.webhook import get_webhook_queue
+        await get_webhook_queue().stop()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar fila de ingestão: {str(e)}")
+
+    try:
+        from app.handlers.webhook import get_dedup_store
+        dedup_store = get_dedup_store()
+        if dedup_store.backend is not None:
+            await dedup_store.backend.close()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar store de deduplicação: {str(e)}")
+
+    try:
+        # Depois da fila: grava o estado dos últimos turnos processados
+        from app.config import settings
+        if settings.conversation_store_enabled:
+            from app.services.conversation_state_store import get_conversation_state_store
+            await get_conversation_state_store().stop()
+    except Exception as e:
+        logger.error(f"❌ Erro ao gravar estado das conversas: {str(e)}")
+
+    try:
+        # Depois da fila: drena a auditoria dos últimos turnos
+        from app.services.audit_writer import get_audit_writer
+        await get_audit_writer().stop()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar gravação de auditoria: {str(e)}")
+
+    try:
+        from app.services.availability_cache import get_availability_cache
+        await get_availability_cache().stop()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar prefetch de disponibilidade: {str(e)}")
+
+    try:
+        from app.services.appointment_index import get_appointment_index
+        await get_appointment_index().stop()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar sincronização do índice de agendamentos: {str(e)}")
+
+    try:
+        # Depois da fila: os workers ainda usam os clientes ao drenar
+        from app.utils.http_clients import get_http_client_pool
+        await get_http_client_pool().aclose()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar clientes HTTP: {str(e)}")
+    
+    try:
+        from app.models.async_database import dispose_async_engine
+        await dispose_async_engine()
+    except Exception as e:
+        logger.error(f"❌ Erro ao finalizar engine assíncrona: {str(e)}")
+    
     logger.info("👋 Aplicação finalizada")
 
 # Criar aplicação FastAPI
@@ -177,6 +265,17 @@ async def health_check():
             components["database"] = {"status": "unhealthy", "error": str(e)}
             overall_status = "unhealthy"
         
+        # Auditoria em lote: registros perdidos (lote com erro ou fila cheia) degradam o status
+        try:
+            from app.services.audit_writer import audit_async_enabled, get_audit_writer
+            if audit_async_enabled():
+                components["audit_writer"] = get_audit_writer().health()
+                if components["audit_writer"]["status"] != "healthy":
+                    overall_status = "degraded"
+        except Exception as e:
+            components["audit_writer"] = {"status": "unhealthy", "error": str(e)}
+            overall_status = "degraded"
+        
         # Verificar ConversationManager
         try:
             from app.services.conversation import ConversationManager
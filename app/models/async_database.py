@@ -0,0 +1,75 @@
+from typing import Optional
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Engine assíncrona (asyncpg) criada sob demanda quando DB_ASYNC_MODE=true
+_async_engine = None
+_async_sessionmaker = None
+_async_unavailable = False
+
+def to_async_url(url: str) -> Optional[str]:
+    """
+    Converte URL síncrona do PostgreSQL para o driver asyncpg
+
+    Retorna None para bancos sem driver assíncrono instalado (ex.: SQLite).
+    """
+    if not url:
+        return None
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("postgresql+asyncpg://"):
+        return url
+    return None
+
+def get_async_sessionmaker():
+    """Retorna a fábrica de AsyncSession ou None se o modo assíncrono não estiver disponível"""
+    global _async_engine, _async_sessionmaker, _async_unavailable
+
+    if _async_sessionmaker is not None or _async_unavailable:
+        return _async_sessionmaker
+
+    try:
+        # Mesma URL escolhida (e testada) pela engine síncrona
+        from app.models.database import engine
+        if engine is None:
+            raise RuntimeError("engine síncrona indisponível")
+
+        async_url = to_async_url(engine.url.render_as_string(hide_password=False))
+        if async_url is None:
+            raise RuntimeError(f"sem driver assíncrono para {engine.url.drivername}")
+
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        _async_engine = create_async_engine(
+            async_url,
+            pool_pre_ping=True,
+            pool_recycle=60,
+            pool_timeout=5,
+            pool_size=settings.db_async_pool_size,
+            max_overflow=settings.db_async_max_overflow,
+            connect_args={
+                "timeout": 3,
+                "server_settings": {"statement_timeout": "10000"}
+            },
+            echo=False
+        )
+        # expire_on_commit=False: atributos continuam acessíveis após o commit sem I/O implícito
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+        logger.info("✅ Engine assíncrona (asyncpg) configurada")
+    except Exception as e:
+        _async_unavailable = True
+        logger.warning(f"⚠️ Modo assíncrono do banco indisponível, usando sessão síncrona: {str(e)}")
+
+    return _async_sessionmaker
+
+async def dispose_async_engine():
+    """Fecha o pool assíncrono (shutdown da aplicação)"""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
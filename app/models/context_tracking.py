@@ -0,0 +1,135 @@
+import copy
+import json
+import logging
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm.attributes import flag_modified
+
+from app.models.database import Conversation
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_ATTR = "_context_snapshot"
+
+def context_size(context: Any) -> int:
+    """Bytes do contexto serializado como vai para a coluna JSON"""
+    try:
+        return len(json.dumps(context or {}, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(context))
+
+def diff_context(old: Dict, new: Dict) -> Dict[str, List[str]]:
+    """Chaves de primeiro nível adicionadas, removidas e alteradas entre dois contextos"""
+    old = old or {}
+    new = new or {}
+    return {
+        "added": sorted(k for k in new if k not in old),
+        "removed": sorted(k for k in old if k not in new),
+        "changed": sorted(k for k in new if k in old and new[k] != old[k])
+    }
+
+def snapshot_context(conversa: Conversation):
+    """Guarda cópia do contexto como está no banco (base do diff no commit)"""
+    setattr(conversa, _SNAPSHOT_ATTR, copy.deepcopy(conversa.context or {}))
+
+@event.listens_for(Conversation, "load")
+def _on_load(conversa, _context):
+    snapshot_context(conversa)
+
+@event.listens_for(Conversation, "refresh")
+def _on_refresh(conversa, _context, attrs):
+    if attrs is None or "context" in attrs:
+        snapshot_context(conversa)
+
+class TurnWriteReport:
+    """Quanto um turno gravou em Conversation (estado/contexto)"""
+
+    __slots__ = ("conversations", "state_bytes", "context_bytes", "keys_changed")
+
+    def __init__(self):
+        self.conversations = 0
+        self.state_bytes = 0
+        self.context_bytes = 0
+        self.keys_changed: List[str] = []
+
+    @property
+    def total_bytes(self) -> int:
+        return self.state_bytes + self.context_bytes
+
+    def add(self, state: Any = None, context: Any = None, diff: Dict[str, List[str]] = None):
+        self.conversations += 1
+        if state is not None:
+            self.state_bytes += len(str(state).encode("utf-8"))
+        if context is not None:
+            self.context_bytes += context_size(context)
+        if diff:
+            self.keys_changed.extend(k for keys in diff.values() for k in keys)
+
+def track_conversation_writes(conversas: Iterable[Conversation], report: TurnWriteReport):
+    """
+    Marca a coluna context das conversas cujo conteúdo mudou desde o load
+
+    Coluna JSON não rastreia mutação in-place (handlers alteram o dict e
+    reatribuem o mesmo objeto): sem o diff a escrita se perde; com ele,
+    contexto igual ao carregado não gera UPDATE da coluna.
+    """
+    for conversa in conversas:
+        insp = inspect(conversa)
+        if insp.pending:
+            # INSERT grava tudo
+            report.add(state=conversa.state, context=conversa.context or {})
+            continue
+        if not insp.persistent:
+            continue
+
+        state_changed = insp.attrs.state.history.has_changes()
+        context = conversa.context or {}
+        snapshot = getattr(conversa, _SNAPSHOT_ATTR, None)
+        if snapshot is None:
+            context_changed = insp.attrs.context.history.has_changes()
+            diff = None
+        else:
+            context_changed = context != snapshot
+            diff = diff_context(snapshot, context) if context_changed else None
+            if context_changed:
+                flag_modified(conversa, "context")
+
+        if state_changed or context_changed:
+            report.add(state=conversa.state if state_changed else None,
+                       context=context if context_changed else None, diff=diff)
+
+class ConversationWriteStats:
+    """Agregado dos relatórios de escrita por turno (exposto em /webhook/metrics)"""
+
+    def __init__(self):
+        self.turns = 0
+        self.turns_without_write = 0
+        self.state_writes = 0
+        self.context_writes = 0
+        self.bytes_written = 0
+        self.max_turn_bytes = 0
+
+    def record(self, report: TurnWriteReport):
+        self.turns += 1
+        if report.total_bytes == 0:
+            self.turns_without_write += 1
+            return
+        self.state_writes += 1 if report.state_bytes else 0
+        self.context_writes += 1 if report.context_bytes else 0
+        self.bytes_written += report.total_bytes
+        self.max_turn_bytes = max(self.max_turn_bytes, report.total_bytes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        writing_turns = self.turns - self.turns_without_write
+        return {
+            "turns": self.turns,
+            "turns_without_write": self.turns_without_write,
+            "state_writes": self.state_writes,
+            "context_writes": self.context_writes,
+            "bytes_written": self.bytes_written,
+            "avg_turn_bytes": round(self.bytes_written / writing_turns, 1) if writing_turns else 0.0,
+            "max_turn_bytes": self.max_turn_bytes
+        }
+
+conversation_write_stats = ConversationWriteStats()
@@ -0,0 +1,266 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import logging
+
+from sqlalchemy import select, update
+
+from app.models.database import Conversation, WaitingList
+from app.models.context_tracking import TurnWriteReport, conversation_write_stats, track_conversation_writes
+
+logger = logging.getLogger(__name__)
+
+class ConversationRepository(ABC):
+    """
+    Acesso a Conversation/Appointment/WaitingList usado pelo ConversationManager
+
+    A interface é assíncrona nas duas implementações, então os handlers rodam
+    igual com sessão síncrona (SessionLocal/MockDB) ou AsyncSession (asyncpg).
+
+    Unit of work por turno: commit() dos handlers só marca que há alterações;
+    estado, contexto e inserts de Appointment/WaitingList vão para o banco
+    num único COMMIT em complete(), chamado no fim de processar_mensagem.
+    O contexto é comparado com o snapshot do load: sem mudança real não há
+    UPDATE (nem COMMIT), e cada turno registra quantos bytes gravou.
+    """
+
+    is_async = False
+
+    def __init__(self):
+        self._pending = False
+        self._statements_written = False
+        self.write_report = TurnWriteReport()
+
+        # Métricas do turno
+        self.commit_requests = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    @property
+    def pending(self) -> bool:
+        return self._pending
+
+    @abstractmethod
+    def add(self, obj: Any):
+        ...
+
+    @abstractmethod
+    async def get_conversation(self, phone: str) -> Optional[Conversation]:
+        ...
+
+    @abstractmethod
+    async def get_waiting_list_entry(self, patient_id: str) -> Optional[WaitingList]:
+        ...
+
+    async def write_conversation_state(self, conversation_id: str, phone: str, state: Optional[str] = None,
+                                       context: Optional[Dict] = None, insert: bool = False):
+        """
+        Grava estado/contexto de conversa que não está na sessão (store em memória)
+
+        No UPDATE, campos None não são escritos; o INSERT grava os dois.
+        """
+        if insert:
+            self.add(Conversation(id=conversation_id, phone=phone, state=state, context=context or {}))
+            self.write_report.add(state=state, context=context or {})
+        else:
+            values = {}
+            if state is not None:
+                values["state"] = state
+            if context is not None:
+                values["context"] = context
+            if not values:
+                return
+            values["updated_at"] = datetime.utcnow()
+            await self._execute(update(Conversation).where(Conversation.id == conversation_id).values(**values))
+            self._statements_written = True
+            self.write_report.add(state=state, context=context)
+        self._pending = True
+
+    async def commit(self):
+        """Marca alterações do turno; o COMMIT real acontece em complete()"""
+        self._pending = True
+        self.commit_requests += 1
+
+    async def complete(self) -> bool:
+        """Grava tudo que o turno acumulou numa única transação (rollback se falhar)"""
+        if not self._pending:
+            self._finish_report()
+            return True
+        try:
+            track_conversation_writes(self._session_conversations(), self.write_report)
+            if self._has_writes():
+                await self._commit()
+                self.commits += 1
+        except Exception as e:
+            logger.error(f"❌ Erro no commit do turno, desfazendo alterações: {str(e)}")
+            await self.rollback()
+            return False
+        self._pending = False
+        self._finish_report()
+        return True
+
+    async def rollback(self):
+        """Descarta as alterações pendentes do turno"""
+        self._pending = False
+        self._statements_written = False
+        self.write_report = TurnWriteReport()
+        self.rollbacks += 1
+        try:
+            await self._rollback()
+        except Exception as e:
+            logger.error(f"❌ Erro no rollback: {str(e)}")
+
+    def _finish_report(self):
+        report = self.write_report
+        conversation_write_stats.record(report)
+        if report.total_bytes:
+            chaves = f", chaves: {', '.join(sorted(set(report.keys_changed)))}" if report.keys_changed else ""
+            logger.info(f"💾 Turno gravou {report.total_bytes} bytes (estado {report.state_bytes}, "
+                        f"contexto {report.context_bytes}{chaves})")
+        self._statements_written = False
+        self.write_report = TurnWriteReport()
+
+    def _session_conversations(self) -> List[Conversation]:
+        sync_session = self._sync_session()
+        if sync_session is None or not hasattr(sync_session, 'identity_map'):
+            return []
+        objetos = list(sync_session.identity_map.values()) + list(sync_session.new)
+        return [obj for obj in objetos if isinstance(obj, Conversation)]
+
+    def _has_writes(self) -> bool:
+        """Algo a gravar? (turno que só leu não vai ao banco para COMMIT)"""
+        sync_session = self._sync_session()
+        if sync_session is None or not hasattr(sync_session, 'identity_map'):
+            return True  # MockDB
+        if self._statements_written or sync_session.new or sync_session.deleted:
+            return True
+        return any(sync_session.is_modified(obj) for obj in sync_session.dirty)
+
+    @abstractmethod
+    def _sync_session(self):
+        ...
+
+    @abstractmethod
+    async def _execute(self, statement):
+        ...
+
+    @abstractmethod
+    async def _commit(self):
+        ...
+
+    @abstractmethod
+    async def _rollback(self):
+        ...
+
+    @abstractmethod
+    async def refresh(self, obj: Any):
+        ...
+
+    @abstractmethod
+    async def close(self):
+        ...
+
+class SyncConversationRepository(ConversationRepository):
+    """Sessão síncrona (SessionLocal ou MockDB); as chamadas bloqueiam o event loop"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def add(self, obj: Any):
+        self.session.add(obj)
+
+    async def get_conversation(self, phone: str) -> Optional[Conversation]:
+        return self.session.query(Conversation).filter_by(phone=phone).first()
+
+    async def get_waiting_list_entry(self, patient_id: str) -> Optional[WaitingList]:
+        return self.session.query(WaitingList).filter_by(patient_id=patient_id).first()
+
+    async def write_conversation_state(self, conversation_id: str, phone: str, state: Optional[str] = None,
+                                       context: Optional[Dict] = None, insert: bool = False):
+        # MockDB não executa statements: registra o objeto
+        await super().write_conversation_state(conversation_id, phone, state, context,
+                                               insert=insert or not hasattr(self.session, 'execute'))
+
+    def _sync_session(self):
+        return self.session
+
+    async def _execute(self, statement):
+        return self.session.execute(statement)
+
+    async def _commit(self):
+        self.session.commit()
+
+    async def _rollback(self):
+        if hasattr(self.session, 'rollback'):
+            self.session.rollback()
+
+    async def refresh(self, obj: Any):
+        self.session.refresh(obj)
+
+    async def close(self):
+        if hasattr(self.session, 'close'):
+            self.session.close()
+
+class AsyncConversationRepository(ConversationRepository):
+    """AsyncSession (asyncpg): I/O do banco não bloqueia os outros pacientes"""
+
+    is_async = True
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def add(self, obj: Any):
+        self.session.add(obj)
+
+    async def get_conversation(self, phone: str) -> Optional[Conversation]:
+        result = await self.session.execute(
+            select(Conversation).where(Conversation.phone == phone).limit(1)
+        )
+        return result.scalars().first()
+
+    async def get_waiting_list_entry(self, patient_id: str) -> Optional[WaitingList]:
+        result = await self.session.execute(
+            select(WaitingList).where(WaitingList.patient_id == patient_id).limit(1)
+        )
+        return result.scalars().first()
+
+    def _sync_session(self):
+        return self.session.sync_session
+
+    async def _execute(self, statement):
+        return await self.session.execute(statement)
+
+    async def _commit(self):
+        await self.session.commit()
+
+    async def _rollback(self):
+        await self.session.rollback()
+
+    async def refresh(self, obj: Any):
+        await self.session.refresh(obj)
+
+    async def close(self):
+        await self.session.close()
+
+def open_conversation_repository(db_generator) -> ConversationRepository:
+    """
+    Abre o repositório do turno conforme DB_ASYNC_MODE
+
+    db_generator: generator de get_db() ou sessão já aberta. No modo
+    assíncrono o generator nem é iniciado (nenhuma sessão síncrona é aberta).
+    """
+    from app.config import settings
+
+    if settings.db_async_mode:
+        from app.models.async_database import get_async_sessionmaker
+        session_factory = get_async_sessionmaker()
+        if session_factory is not None:
+            if hasattr(db_generator, 'close') and hasattr(db_generator, '__next__'):
+                db_generator.close()
+            return AsyncConversationRepository(session_factory())
+
+    if hasattr(db_generator, '__next__'):
+        return SyncConversationRepository(next(db_generator))
+    return SyncConversationRepository(db_generator)
@@ -42,6 +42,7 @@ class ConversationDashboard(Base):
     sentiment_score = Column(Integer)  # -100 a 100
     ai_summary = Column(String)
     ai_suggested_action = Column(String)
+    classifier_state = Column(JSON)  # Estado incremental do ConversationClassifier
     
     # Métricas
     message_count = Column(Integer, default=0)
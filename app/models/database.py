@@ -11,7 +11,7 @@ from app.config import settings
 # Importar novas tabelas de auditoria
 from app.models.patient_transaction import (
     PatientTransaction, PatientCache, ContextHistory, 
-    DecisionLog, ValidationRule
+    DecisionLog, ValidationRule, Base as AuditBase, migrate_audit_schema
 )
 
 Base = declarative_base()
@@ -228,6 +228,9 @@ def create_database_engine():
             print(f"❌ Erro crítico no fallback: {fallback_error}")
             return None
 
+# Esquema da auditoria endereçada por conteúdo migrado (pré-requisito da gravação em lote)
+audit_schema_ready = False
+
 # Configurar banco de dados
 try:
     engine = create_database_engine()
@@ -238,11 +241,23 @@ try:
         # Criar tabelas
         try:
             Base.metadata.create_all(bind=engine)
+            # Tabelas de auditoria (declarative_base própria em patient_transaction.py)
+            AuditBase.metadata.create_all(bind=engine)
             print("✅ Tabelas criadas com sucesso")
         except Exception as table_error:
             print(f"⚠️ Erro ao criar tabelas: {table_error}")
             print("⚠️ Continuando sem tabelas - usando mock quando necessário")
         
+        # Migração: colunas novas da auditoria em tabelas criadas antes delas
+        try:
+            colunas = migrate_audit_schema(engine)
+            if colunas:
+                print(f"✅ Colunas de auditoria adicionadas: {', '.join(colunas)}")
+            audit_schema_ready = True
+        except Exception as migration_error:
+            print(f"❌ Migração da auditoria falhou: {migration_error}")
+            print("⚠️ Gravação de auditoria em lote desativada até a migração")
+        
         print("✅ Sistema de banco configurado com sucesso")
     else:
         print("❌ ERRO CRÍTICO: Não foi possível configurar nenhum banco")
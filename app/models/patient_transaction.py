@@ -54,8 +54,10 @@ class PatientTransaction(Base):
     # API Call (se houve)
     api_endpoint = Column(String)
     api_parameters = Column(JSON)
-    api_response = Column(JSON)
+    api_response = Column(JSON)  # Registros antigos; novos usam api_response_hash
+    api_response_hash = Column(String(64))  # AuditBlob.hash
     api_timestamp = Column(DateTime)
+    api_response_time_ms = Column(Integer)  # Fora do blob: o hash só cobre o payload estável
     api_success = Column(Boolean, default=False)
     
     # Validação
@@ -63,9 +65,11 @@ class PatientTransaction(Base):
     validation_details = Column(JSON)  # Detalhes do que passou/falhou
     validation_reasons = Column(JSON)  # Lista de motivos
     
-    # Contexto
+    # Contexto (registros antigos; novos guardam só o hash do AuditBlob)
     context_loaded = Column(JSON)  # Contexto que foi carregado
     context_updated = Column(JSON)  # Contexto após processamento
+    context_loaded_hash = Column(String(64))
+    context_updated_hash = Column(String(64))
     
     # Decisão tomada
     decision_type = Column(SQLEnum(DecisionType), nullable=False)
@@ -151,7 +155,8 @@ class DecisionLog(Base):
     
     # Base da decisão
     decision_factors = Column(JSON)  # Fatores que influenciaram
-    context_used = Column(JSON)  # Contexto usado na decisão
+    context_used = Column(JSON)  # Contexto usado na decisão (registros antigos)
+    context_used_hash = Column(String(64))  # AuditBlob.hash
     rules_applied = Column(JSON)  # Regras que foram aplicadas
     
     # Alternativas consideradas
@@ -167,6 +172,15 @@ class DecisionLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     decided_by = Column(String, default="system")  # system, user, escalation
 
+class AuditBlob(Base):
+    """Payload de auditoria (contexto, resposta da API) gravado uma vez por conteúdo"""
+    __tablename__ = "audit_blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 do JSON canônico
+    content = Column(JSON, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class ValidationRule(Base):
     """Regras de validação personalizáveis"""
     __tablename__ = "validation_rules"
@@ -191,4 +205,38 @@ class ValidationRule(Base):
     # Auditoria
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    created_by = Column(String, default="system")
\ No newline at end of file
+    created_by = Column(String, default="system")
+
+# Colunas adicionadas depois das tabelas (create_all não altera tabelas existentes)
+AUDIT_ADDED_COLUMNS = {
+    PatientTransaction: ("context_loaded_hash", "context_updated_hash", "api_response_hash", "api_response_time_ms"),
+    DecisionLog: ("context_used_hash",),
+}
+
+def migrate_audit_schema(engine) -> list:
+    """
+    Cria audit_blobs e as colunas *_hash (e api_response_time_ms) em bancos anteriores a elas
+
+    Sem a migração todo INSERT de PatientTransaction/DecisionLog falha
+    (o ORM grava todas as colunas mapeadas). Idempotente; erros sobem.
+
+    Returns:
+        Colunas adicionadas ("tabela.coluna")
+    """
+    from sqlalchemy import inspect, text
+    AuditBlob.__table__.create(bind=engine, checkfirst=True)
+    inspector = inspect(engine)
+    adicionadas = []
+    with engine.begin() as conn:
+        for model, colunas in AUDIT_ADDED_COLUMNS.items():
+            tabela = model.__tablename__
+            if not inspector.has_table(tabela):
+                model.__table__.create(bind=conn)
+                continue
+            existentes = {coluna["name"] for coluna in inspector.get_columns(tabela)}
+            for coluna in colunas:
+                if coluna not in existentes:
+                    tipo = model.__table__.c[coluna].type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+                    adicionadas.append(f"{tabela}.{coluna}")
+    return adicionadas
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _cpf_digits(cpf: Any) -> str:
+    return ''.join(filter(str.isdigit, str(cpf or '')))
+
+def _parse_data_hora(value: Any) -> Optional[datetime]:
+    """Aceita ISO (YYYY-MM-DDTHH:MM:SS) ou o formato da API (dd/mm/yyyy hh:mm:ss)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(str(value), "%d/%m/%Y %H:%M:%S")
+    except ValueError:
+        return None
+
+def _appointment_id(agendamento: Dict) -> Optional[str]:
+    for field in ("id", "agendamento", "agendamento_id"):
+        if agendamento.get(field):
+            return str(agendamento[field])
+    return None
+
+class AppointmentIndex:
+    """
+    Índice local de agendamentos por CPF e data
+
+    Evita varrer a listagem de um ano inteiro da clínica a cada "ver
+    agendamentos": a consulta é O(k) nos agendamentos do paciente.
+
+    - Sincronização incremental: janela curta (próximos dias) a cada ciclo e
+      reconciliação completa do horizonte a cada full_sync_every ciclos.
+    - Write-through: criar/reagendar atualizam o índice na hora.
+    - lookup() retorna None enquanto o índice não é confiável (nunca
+      sincronizado ou sincronização completa velha); o chamador faz a
+      varredura e alimenta o índice com load_listing().
+    - Só é fonte autoritativa (até max_staleness) com o job de sincronização
+      rodando. Sem o job, uma carga completa vale como dica de leitura por
+      hint_ttl segundos: cancelamentos feitos na clínica não chegam ao índice.
+    """
+
+    def __init__(self, gestaods=None, horizon_days: int = 365, near_days: int = 30,
+                 sync_interval: float = 300, full_sync_every: int = 12, max_staleness: float = 3600,
+                 hint_ttl: float = 60, clock: Callable[[], float] = time.monotonic):
+        self._gestaods = gestaods
+        self.horizon_days = horizon_days
+        self.near_days = near_days
+        self.sync_interval = sync_interval
+        self.full_sync_every = max(1, full_sync_every)
+        self.max_staleness = max_staleness
+        self.hint_ttl = hint_ttl
+        self._clock = clock
+
+        self._by_cpf: Dict[str, Dict[str, List[Dict]]] = {}   # cpf -> data -> agendamentos
+        self._by_date: Dict[str, Set[str]] = {}               # data -> cpfs
+        self._by_id: Dict[str, Tuple[str, str]] = {}          # id -> (cpf, data)
+        self._covered_from: Optional[date] = None
+        self._full_synced_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._cycles = 0
+
+        # Métricas
+        self.lookups = 0
+        self.index_hits = 0
+        self.fallbacks = 0
+        self.syncs = 0
+        self.full_syncs = 0
+        self.sync_failures = 0
+        self.write_throughs = 0
+        self.drift_corrections = 0
+
+    @property
+    def gestaods(self):
+        if self._gestaods is None:
+            from app.services.gestaods import GestaoDS
+            self._gestaods = GestaoDS()
+        return self._gestaods
+
+    @property
+    def sync_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def ready(self) -> bool:
+        """Índice pode responder sem consultar a GestãoDS"""
+        if self._full_synced_at is None or self._covered_from is None:
+            return False
+        staleness = self.max_staleness if self.sync_running else self.hint_ttl
+        if self._clock() - self._full_synced_at > staleness:
+            return False
+        return self._covered_from <= date.today()
+
+    # Consulta
+
+    def lookup(self, cpf: str) -> Optional[List[Dict]]:
+        """Agendamentos futuros do CPF em ordem cronológica; None se o índice não é confiável"""
+        self.lookups += 1
+        if not self.ready:
+            self.fallbacks += 1
+            return None
+
+        self.index_hits += 1
+        hoje = date.today().isoformat()
+        por_data = self._by_cpf.get(_cpf_digits(cpf), {})
+        agendamentos = [ag for dia, ags in por_data.items() if dia >= hoje for ag in ags]
+        # Listagem da API (dd/mm/yyyy) e write-through (ISO) convivem: ordenar pela data, não pelo texto
+        agendamentos.sort(key=lambda ag: _parse_data_hora(ag.get('data_hora')) or datetime.max)
+        return agendamentos
+
+    # Carga / sincronização
+
+    def load_listing(self, agendamentos: List[Dict], inicio: date, fim: date, full: bool = True):
+        """
+        Substitui o conteúdo do índice no intervalo [inicio, fim] pela listagem
+
+        Datas do intervalo que sumiram da listagem são removidas (corrige drift).
+        """
+        novos: Dict[str, List[Tuple[str, Dict]]] = {}
+        for ag in agendamentos:
+            dt = _parse_data_hora(ag.get('data_hora'))
+            cpf = _cpf_digits(ag.get('cpf'))
+            if dt is None or not cpf or not (inicio <= dt.date() <= fim):
+                continue
+            novos.setdefault(dt.date().isoformat(), []).append((cpf, ag))
+
+        dia = inicio
+        while dia <= fim:
+            chave = dia.isoformat()
+            antigos = self._count_date(chave)
+            self._clear_date(chave)
+            for cpf, ag in novos.get(chave, []):
+                self._add(cpf, chave, ag)
+            if self._full_synced_at is not None and antigos != len(novos.get(chave, [])):
+                self.drift_corrections += 1
+            dia += timedelta(days=1)
+
+        if full:
+            self._covered_from = inicio
+            self._full_synced_at = self._clock()
+
+    async def sync(self, full: bool = False) -> bool:
+        """Busca a listagem na GestãoDS (janela curta ou horizonte completo) e reconcilia"""
+        inicio = date.today()
+        fim = inicio + timedelta(days=(self.horizon_days if full else self.near_days))
+        try:
+            agendamentos = await self.gestaods._fetch_agendamentos_periodo(
+                inicio.strftime("%d/%m/%Y"), fim.strftime("%d/%m/%Y")
+            )
+        except Exception as e:
+            logger.error(f"❌ Erro ao sincronizar índice de agendamentos: {str(e)}")
+            agendamentos = None
+
+        if agendamentos is None:
+            # Falha da API não pode apagar o índice
+            self.sync_failures += 1
+            return False
+
+        self.load_listing(agendamentos, inicio, fim, full=full)
+        self._prune_past(inicio)
+        self.syncs += 1
+        if full:
+            self.full_syncs += 1
+        logger.info(f"📇 Índice de agendamentos sincronizado ({'completo' if full else 'incremental'}, {len(agendamentos)} itens)")
+        return True
+
+    def start(self):
+        """Inicia o job de sincronização em background (precisa de event loop ativo)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._sync_loop(), name="appointment-index-sync")
+        logger.info(f"✅ Sincronização do índice de agendamentos iniciada (a cada {self.sync_interval}s)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("🔄 Sincronização do índice de agendamentos finalizada")
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                # Primeiro ciclo e a cada full_sync_every ciclos: reconciliação completa
+                full = self._cycles % self.full_sync_every == 0
+                if await self.sync(full=full) or not full:
+                    self._cycles += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no job do índice de agendamentos: {str(e)}")
+            await asyncio.sleep(self.sync_interval)
+
+    # Write-through
+
+    def record_created(self, cpf: str, data_hora: datetime, agendamento: Optional[Dict] = None):
+        """Registra agendamento recém-criado na GestãoDS"""
+        entry = dict(agendamento or {})
+        entry.setdefault('cpf', _cpf_digits(cpf))
+        entry['data_hora'] = data_hora.isoformat()
+        entry.setdefault('status', 'Agendado')
+        self._add(_cpf_digits(cpf), data_hora.date().isoformat(), entry)
+        self.write_throughs += 1
+
+    def record_rescheduled(self, agendamento_id: str, data_hora: datetime):
+        """Move agendamento conhecido para a nova data (desconhecido: fica para o sync)"""
+        location = self._by_id.get(str(agendamento_id))
+        if location is None:
+            return
+        cpf, dia = location
+        ags = self._by_cpf.get(cpf, {}).get(dia, [])
+        for ag in ags:
+            if _appointment_id(ag) == str(agendamento_id):
+                self._remove(cpf, dia, ag)
+                ag = dict(ag, data_hora=data_hora.isoformat())
+                self._add(cpf, data_hora.date().isoformat(), ag)
+                self.write_throughs += 1
+                return
+
+    # Estrutura interna
+
+    def _add(self, cpf: str, dia: str, ag: Dict):
+        self._by_cpf.setdefault(cpf, {}).setdefault(dia, []).append(ag)
+        self._by_date.setdefault(dia, set()).add(cpf)
+        ag_id = _appointment_id(ag)
+        if ag_id:
+            self._by_id[ag_id] = (cpf, dia)
+
+    def _remove(self, cpf: str, dia: str, ag: Dict):
+        ags = self._by_cpf.get(cpf, {}).get(dia, [])
+        if ag in ags:
+            ags.remove(ag)
+        ag_id = _appointment_id(ag)
+        if ag_id and self._by_id.get(ag_id) == (cpf, dia):
+            del self._by_id[ag_id]
+        if not ags:
+            self._by_cpf.get(cpf, {}).pop(dia, None)
+            if not self._by_cpf.get(cpf):
+                self._by_cpf.pop(cpf, None)
+            cpfs = self._by_date.get(dia)
+            if cpfs is not None:
+                cpfs.discard(cpf)
+                if not cpfs:
+                    del self._by_date[dia]
+
+    def _count_date(self, dia: str) -> int:
+        return sum(len(self._by_cpf.get(cpf, {}).get(dia, [])) for cpf in self._by_date.get(dia, ()))
+
+    def _clear_date(self, dia: str):
+        for cpf in list(self._by_date.get(dia, ())):
+            for ag in list(self._by_cpf.get(cpf, {}).get(dia, [])):
+                self._remove(cpf, dia, ag)
+
+    def _prune_past(self, hoje: date):
+        for dia in [d for d in self._by_date if d < hoje.isoformat()]:
+            self._clear_date(dia)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "patients": len(self._by_cpf),
+            "dates": len(self._by_date),
+            "appointments": sum(len(ags) for por_data in self._by_cpf.values() for ags in por_data.values()),
+            "full_sync_age_s": round(self._clock() - self._full_synced_at, 1) if self._full_synced_at is not None else None,
+            "sync_running": self.sync_running,
+            "lookups": self.lookups,
+            "index_hits": self.index_hits,
+            "fallbacks": self.fallbacks,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "sync_failures": self.sync_failures,
+            "write_throughs": self.write_throughs,
+            "drift_corrections": self.drift_corrections
+        }
+
+_appointment_index: Optional[AppointmentIndex] = None
+
+def get_appointment_index() -> AppointmentIndex:
+    """Retorna instância singleton do índice de agendamentos"""
+    global _appointment_index
+    if _appointment_index is None:
+        _appointment_index = AppointmentIndex(
+            horizon_days=settings.appointment_index_horizon_days,
+            sync_interval=settings.appointment_index_sync_interval,
+            max_staleness=settings.appointment_index_max_staleness,
+            hint_ttl=settings.appointment_index_hint_ttl
+        )
+    return _appointment_index
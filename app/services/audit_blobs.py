@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.patient_transaction import AuditBlob
+
+logger = logging.getLogger(__name__)
+
+def canonical_payload(payload: Any) -> Tuple[str, Any, int]:
+    """
+    Forma canônica de um payload de auditoria
+
+    Returns:
+        (hash sha256 do JSON canônico, conteúdo como será lido do banco, tamanho em bytes)
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    encoded = canonical.encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest(), json.loads(canonical), len(encoded)
+
+class AuditBlobStore:
+    """
+    Payloads de auditoria (contextos, respostas da API) endereçados por conteúdo
+
+    O registro de auditoria guarda só o hash; o payload vai uma única vez
+    para audit_blobs. Os hashes já gravados por este processo ficam num LRU,
+    então um contexto repetido nem volta para a fila de gravação.
+    """
+
+    def __init__(self, known_size: int = 10000):
+        self.known_size = known_size
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+
+        # Métricas
+        self.refs = 0
+        self.known_hits = 0
+        self.stored = 0
+        self.bytes_referenced = 0
+        self.bytes_stored = 0
+
+    def ref(self, payload: Any, blobs: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        """
+        Hash do payload; se ainda não foi gravado, o blob é adicionado em blobs
+
+        Args:
+            payload: Contexto ou resposta da API (None/vazio não gera referência)
+            blobs: Blobs pendentes do turno, por hash
+        """
+        if not payload:
+            return None
+        digest, content, size = canonical_payload(payload)
+        self.refs += 1
+        self.bytes_referenced += size
+        if digest in self._known:
+            self._known.move_to_end(digest)
+            self.known_hits += 1
+        elif digest not in blobs:
+            blobs[digest] = dict(hash=digest, content=content, size_bytes=size, created_at=datetime.utcnow())
+        return digest
+
+    def save(self, session, blobs: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Insere na sessão os blobs que ainda não existem no banco (sem COMMIT)
+
+        Returns:
+            Hashes cobertos; passar para remember() depois do COMMIT
+        """
+        pending = {blob["hash"]: blob for blob in blobs if blob["hash"] not in self._known}
+        if not pending:
+            return []
+        existing = {digest for (digest,) in session.query(AuditBlob.hash).filter(AuditBlob.hash.in_(list(pending)))}
+        missing = [blob for digest, blob in pending.items() if digest not in existing]
+        if missing:
+            self._insert(session, missing)
+            self.stored += len(missing)
+            self.bytes_stored += sum(blob["size_bytes"] for blob in missing)
+        return list(pending)
+
+    def _insert(self, session, blobs: List[Dict[str, Any]]):
+        # Outro worker pode gravar o mesmo hash entre a consulta e o INSERT
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            session.bulk_insert_mappings(AuditBlob, blobs)
+            return
+        session.execute(insert(AuditBlob).on_conflict_do_nothing(index_elements=["hash"]), blobs)
+
+    def remember(self, hashes: Iterable[str]):
+        """Marca hashes como gravados (chamar só depois do COMMIT)"""
+        for digest in hashes:
+            self._known[digest] = None
+            self._known.move_to_end(digest)
+        while len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def load(self, session, hashes: Iterable[Optional[str]]) -> Dict[str, Any]:
+        """Conteúdo dos blobs por hash (hashes None são ignorados)"""
+        wanted = {digest for digest in hashes if digest}
+        if not wanted:
+            return {}
+        return dict(session.query(AuditBlob.hash, AuditBlob.content).filter(AuditBlob.hash.in_(wanted)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Referências, blobs gravados e economia em bytes"""
+        return {
+            "refs": self.refs,
+            "known": len(self._known),
+            "known_hits": self.known_hits,
+            "stored": self.stored,
+            "bytes_referenced": self.bytes_referenced,
+            "bytes_stored": self.bytes_stored,
+            "dedup_ratio": round(1 - self.bytes_stored / self.bytes_referenced, 3) if self.bytes_referenced else 0.0
+        }
+
+_audit_blob_store: Optional[AuditBlobStore] = None
+
+def get_audit_blob_store() -> AuditBlobStore:
+    """Retorna instância singleton dos payloads de auditoria"""
+    global _audit_blob_store
+    if _audit_blob_store is None:
+        _audit_blob_store = AuditBlobStore()
+    return _audit_blob_store
@@ -0,0 +1,275 @@
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.patient_transaction import AuditBlob
+from app.services.audit_blobs import get_audit_blob_store
+
+logger = logging.getLogger(__name__)
+
+# Enfileirado pelo stop(): acorda o job que espera o intervalo do lote
+_FLUSH_NOW = object()
+
+class AuditWriter:
+    """
+    Gravação dos registros de auditoria (PatientTransaction, DecisionLog) fora do turno
+
+    O turno só enfileira (submit) as colunas do registro, copiadas no momento
+    do turno. Um job junta até batch_size registros ou flush_interval segundos
+    e grava com um INSERT em lote por tabela, numa sessão própria e numa
+    thread (o INSERT síncrono não bloqueia o event loop dos outros turnos).
+
+    A fila é limitada: cheia, o submit espera até enqueue_timeout
+    (backpressure no turno) e então descarta o registro, contando em dropped.
+    Registros perdidos (lote com erro ou descartado) acionam o alerta de
+    health() até alert_window segundos depois da última perda.
+    stop() drena a fila antes de encerrar. Registros AuditBlob passam pelo
+    AuditBlobStore: só os hashes que ainda não existem no banco são inseridos.
+    """
+
+    def __init__(self, maxsize: int = 10000, batch_size: int = 200, flush_interval: float = 1.0,
+                 enqueue_timeout: float = 0.5, session_factory: Optional[Callable] = None,
+                 alert_window: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._session_factory = session_factory
+        self.alert_window = alert_window
+        self._clock = clock
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._draining = False
+
+        # Métricas
+        self.submitted = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self._last_loss_at: Optional[float] = None
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Inicia o job de gravação (precisa de event loop ativo)"""
+        if self.running:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._draining = False
+        self._task = asyncio.create_task(self._run(), name="audit-writer")
+        logger.info(f"✅ Gravação de auditoria em lote iniciada (lote {self.batch_size}, a cada {self.flush_interval}s)")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Para o job depois de gravar o que estiver na fila (até drain_timeout)"""
+        if self._task is None:
+            return
+        self._draining = True
+        try:
+            await asyncio.wait_for(self._queue.put(_FLUSH_NOW), timeout=drain_timeout)
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Auditoria não drenou em {drain_timeout}s, {self._queue.qsize()} registros descartados")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info(f"💾 Gravação de auditoria finalizada ({self.written} registros gravados)")
+
+    async def submit(self, model, values: Dict[str, Any], copy_values: bool = True) -> Optional[str]:
+        """
+        Enfileira um registro de auditoria
+
+        Args:
+            model: Classe do modelo (ex.: PatientTransaction)
+            values: Colunas do registro; id e created_at são preenchidos se ausentes
+            copy_values: False quando values já é uma cópia exclusiva (ex.: blob canônico)
+
+        Returns:
+            id do registro, ou None se foi descartado (fila cheia após enqueue_timeout)
+        """
+        if not self.running:
+            self.start()
+
+        # Cópia do turno: o contexto continua sendo alterado depois do submit
+        record = copy.deepcopy(values) if copy_values else values
+        if model is not AuditBlob:
+            record.setdefault("id", str(uuid.uuid4()))
+        record.setdefault("created_at", datetime.utcnow())
+
+        item = (model, record)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.blocked += 1
+            try:
+                await asyncio.wait_for(self._queue.put(item), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                self._last_loss_at = self._clock()
+                logger.warning(f"⚠️ Fila de auditoria cheia ({self.maxsize}), registro {model.__tablename__} descartado")
+                return None
+
+        self.submitted += 1
+        return record["id"] if model is not AuditBlob else record["hash"]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            taken = 1
+            batch = [] if item is _FLUSH_NOW else [item]
+            deadline = loop.time() + self.flush_interval
+            try:
+                # Lote fecha em batch_size ou no fim do intervalo; drenando, não espera
+                while len(batch) < self.batch_size:
+                    if not self._queue.empty():
+                        item = self._queue.get_nowait()
+                    elif self._draining:
+                        break
+                    else:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                        except asyncio.TimeoutError:
+                            break
+                    taken += 1
+                    if item is not _FLUSH_NOW:
+                        batch.append(item)
+                await self.flush(batch)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    async def flush(self, batch: List[Tuple[Any, Dict[str, Any]]]) -> int:
+        """Grava um lote (INSERT em lote por tabela, um COMMIT); retorna quantos registros"""
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, batch)
+            ok = True
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar {len(batch)} registros de auditoria: {str(e)}")
+            self.last_error = str(e)
+            ok = False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.last_flush_ms = round(elapsed_ms, 2)
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        if not ok:
+            self.failed += len(batch)
+            self.consecutive_failures += 1
+            self._last_loss_at = self._clock()
+            return 0
+
+        self.consecutive_failures = 0
+        self.batches += 1
+        self._total_flush_ms += elapsed_ms
+        self.written += len(batch)
+        return len(batch)
+
+    def _write(self, batch: List[Tuple[Any, Dict[str, Any]]]):
+        by_model: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        for model, record in batch:
+            by_model[model].append(record)
+
+        blobs = by_model.pop(AuditBlob, None)
+        store = get_audit_blob_store()
+        session = self._open_session()
+        try:
+            saved = store.save(session, blobs) if blobs else []
+            for model, records in by_model.items():
+                session.bulk_insert_mappings(model, records)
+            session.commit()
+            store.remember(saved)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _open_session(self):
+        if self._session_factory is not None:
+            return self._session_factory()
+        from app.models.database import SessionLocal
+        if SessionLocal is None:
+            raise RuntimeError("banco indisponível")
+        return SessionLocal()
+
+    @property
+    def alerting(self) -> bool:
+        """Último lote falhou ou houve registro perdido dentro de alert_window"""
+        if self.consecutive_failures:
+            return True
+        return self._last_loss_at is not None and self._clock() - self._last_loss_at < self.alert_window
+
+    def health(self) -> Dict[str, Any]:
+        """Componente do /health: "degraded" enquanto houver perda de auditoria recente"""
+        return {
+            "status": "degraded" if self.alerting else "healthy",
+            "running": self.running,
+            "lost": self.failed + self.dropped,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, registros gravados/descartados e latência do flush"""
+        return {
+            "running": self.running,
+            "alerting": self.alerting,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "batch_size": self.batch_size,
+            "submitted": self.submitted,
+            "blocked": self.blocked,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 2) if self.batches else 0.0,
+            "max_flush_ms": self.max_flush_ms
+        }
+
+def audit_async_enabled() -> bool:
+    """AUDIT_ASYNC_ENABLED e esquema da auditoria migrado (senão os lotes falhariam em silêncio)"""
+    if not settings.audit_async_enabled:
+        return False
+    from app.models.database import audit_schema_ready
+    return audit_schema_ready
+
+_audit_writer: Optional[AuditWriter] = None
+
+def get_audit_writer() -> AuditWriter:
+    """Retorna instância singleton da gravação de auditoria"""
+    global _audit_writer
+    if _audit_writer is None:
+        _audit_writer = AuditWriter(
+            maxsize=settings.audit_queue_maxsize,
+            batch_size=settings.audit_batch_size,
+            flush_interval=settings.audit_flush_interval,
+            enqueue_timeout=settings.audit_enqueue_timeout
+        )
+    return _audit_writer
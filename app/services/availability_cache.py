@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.gestaods import GestaoDS
+
+logger = logging.getLogger(__name__)
+
+class AvailabilityCache:
+    """
+    Cache de disponibilidade (dias e horários) com stale-while-revalidate
+
+    - Entrada fresca (< fresh_ttl): servida da memória.
+    - Entrada velha (< stale_ttl): servida da memória e revalidada em background.
+    - Sem entrada ou expirada: busca na GestãoDS e aguarda.
+
+    Um warmer opcional mantém os próximos N dias e seus horários sempre quentes,
+    então as etapas de agendamento são atendidas da memória no caso comum.
+    Falhas da API nunca são cacheadas: sem valor utilizável, cai no mock da GestãoDS.
+    """
+
+    def __init__(self, gestaods: Optional[GestaoDS] = None, fresh_ttl: float = 60,
+                 stale_ttl: float = 900, prefetch_days: int = 7, refresh_interval: float = 120,
+                 fanout_concurrency: int = 4, clock: Callable[[], float] = time.monotonic):
+        self._gestaods = gestaods
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.prefetch_days = prefetch_days
+        self.refresh_interval = refresh_interval
+        self.fanout_concurrency = max(1, fanout_concurrency)
+        self._clock = clock
+
+        self._entries: Dict[Tuple[str, ...], Tuple[List[Dict], float]] = {}  # chave -> (valor, buscado_em)
+        self._refreshing: Dict[Tuple[str, ...], asyncio.Task] = {}
+        self._warmer: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.invalidations = 0
+        self.warm_runs = 0
+        self.last_warm_at: Optional[str] = None
+        self.days_filtered = 0
+
+    @property
+    def gestaods(self) -> GestaoDS:
+        if self._gestaods is None:
+            self._gestaods = GestaoDS()
+        return self._gestaods
+
+    # Leitura
+
+    async def get_dias(self) -> List[Dict]:
+        """Dias disponíveis para agendamento"""
+        value = await self._get(("dias",))
+        if value is None:
+            return self.gestaods._gerar_dias_disponiveis_mock()
+        return value
+
+    async def get_horarios(self, data: str) -> List[Dict]:
+        """Horários disponíveis de uma data (YYYY-MM-DD)"""
+        value = await self._get(("horarios", data))
+        if value is None:
+            return self.gestaods._gerar_horarios_disponiveis_mock()
+        return value
+
+    async def get_dias_com_horarios(self, limit: int = 7) -> List[Dict]:
+        """
+        Dias disponíveis que ainda têm horários livres
+
+        Busca os horários de todos os dias candidatos em paralelo (limitado por
+        fanout_concurrency) e descarta os dias sem horários. Os horários ficam
+        no cache, então a escolha da data seguinte não precisa de rede.
+        """
+        dias = await self.get_dias()
+        candidatos = [dia for dia in dias[:limit] if dia.get('data')]
+        semaforo = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def buscar(dia: Dict) -> List[Dict]:
+            async with semaforo:
+                return await self.get_horarios(dia['data'])
+
+        resultados = await asyncio.gather(*(buscar(dia) for dia in candidatos), return_exceptions=True)
+
+        disponiveis = []
+        for dia, horarios in zip(candidatos, resultados):
+            if isinstance(horarios, Exception):
+                # Sem como saber: mantém o dia e deixa a escolha tratar
+                logger.error(f"❌ Erro ao buscar horários de {dia['data']}: {str(horarios)}")
+                disponiveis.append(dia)
+            elif horarios:
+                disponiveis.append(dia)
+
+        self.days_filtered += len(candidatos) - len(disponiveis)
+        return disponiveis
+
+    async def _get(self, key: Tuple[str, ...]) -> Optional[List[Dict]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = self._clock() - fetched_at
+            if age < self.fresh_ttl:
+                self.fresh_hits += 1
+                return value
+            if age < self.stale_ttl:
+                self.stale_hits += 1
+                self._schedule_refresh(key)
+                return value
+
+        self.misses += 1
+        return await self._refresh(key)
+
+    # Atualização
+
+    async def _fetch(self, key: Tuple[str, ...]) -> Optional[List[Dict]]:
+        if key[0] == "dias":
+            return await self.gestaods._fetch_dias_disponiveis()
+        return await self.gestaods._fetch_horarios_disponiveis(key[1])
+
+    async def _refresh(self, key: Tuple[str, ...]) -> Optional[List[Dict]]:
+        """Busca na API e atualiza a entrada; mantém o valor antigo se a API falhar"""
+        self.refreshes += 1
+        value = await self._fetch(key)
+        if value is None:
+            self.refresh_failures += 1
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+        self._entries[key] = (value, self._clock())
+        return value
+
+    def _schedule_refresh(self, key: Tuple[str, ...]):
+        """Revalida em background, no máximo uma vez por chave"""
+        if key in self._refreshing:
+            return
+        task = asyncio.ensure_future(self._refresh(key))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda t, k=key: self._refreshing.pop(k, None))
+
+    # Invalidação
+
+    def invalidate_date(self, data: str):
+        """
+        Invalida a disponibilidade de uma data após agendar/reagendar
+
+        Remove os horários da data e marca a lista de dias como velha (a data
+        pode ter lotado), que é revalidada na próxima leitura.
+        """
+        self.invalidations += 1
+        self._entries.pop(("horarios", data), None)
+
+        dias = self._entries.get(("dias",))
+        if dias is not None:
+            self._entries[("dias",)] = (dias[0], self._clock() - self.fresh_ttl)
+
+        logger.info(f"🗑️ Disponibilidade de {data} invalidada")
+
+    # Warmer
+
+    def start(self):
+        """Inicia o warmer em background (precisa de event loop ativo)"""
+        if self._warmer is not None and not self._warmer.done():
+            return
+        self._warmer = asyncio.create_task(self._warm_loop(), name="availability-warmer")
+        logger.info(f"✅ Prefetch de disponibilidade iniciado ({self.prefetch_days} dias a cada {self.refresh_interval}s)")
+
+    async def stop(self):
+        if self._warmer is None:
+            return
+        self._warmer.cancel()
+        await asyncio.gather(self._warmer, return_exceptions=True)
+        self._warmer = None
+        logger.info("🔄 Prefetch de disponibilidade finalizado")
+
+    async def _warm_loop(self):
+        while True:
+            try:
+                await self.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no prefetch de disponibilidade: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def warm(self):
+        """Atualiza os dias e os horários dos próximos N dias"""
+        dias = await self._refresh(("dias",)) or []
+        datas = [dia['data'] for dia in dias[:self.prefetch_days] if dia.get('data')]
+
+        semaforo = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def atualizar(data: str):
+            async with semaforo:
+                await self._refresh(("horarios", data))
+
+        await asyncio.gather(*(atualizar(data) for data in datas))
+
+        self._prune(set(datas))
+        self.warm_runs += 1
+        self.last_warm_at = datetime.now().isoformat()
+
+    def _prune(self, keep: set):
+        """Descarta horários de datas que saíram da janela e já expiraram"""
+        now = self._clock()
+        for key, (_, fetched_at) in list(self._entries.items()):
+            if key[0] == "horarios" and key[1] not in keep and now - fetched_at >= self.stale_ttl:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        reads = self.fresh_hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "warmer_running": self._warmer is not None and not self._warmer.done(),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "memory_hit_rate": round((self.fresh_hits + self.stale_hits) / reads, 4) if reads else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "invalidations": self.invalidations,
+            "days_filtered": self.days_filtered,
+            "warm_runs": self.warm_runs,
+            "last_warm_at": self.last_warm_at
+        }
+
+_availability_cache: Optional[AvailabilityCache] = None
+
+def get_availability_cache() -> AvailabilityCache:
+    """Retorna instância singleton do cache de disponibilidade"""
+    global _availability_cache
+    if _availability_cache is None:
+        _availability_cache = AvailabilityCache(
+            fresh_ttl=settings.availability_cache_ttl,
+            stale_ttl=settings.availability_stale_ttl,
+            prefetch_days=settings.availability_prefetch_days,
+            refresh_interval=settings.availability_prefetch_interval,
+            fanout_concurrency=settings.availability_fanout_concurrency
+        )
+    return _availability_cache
@@ -1,15 +1,73 @@
+import hashlib
 import re
-from typing import List, Dict, Tuple
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 import httpx
 from app.config import settings
+from app.utils.batching import map_chunks
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Padrão de tag decomponível: literais separados por '.*'
+_LITERAL_SEGMENT = re.compile(r"[^\\.^$*+?{}\[\]|()]*")
+
+class ClassificationState:
+    """
+    Estado incremental da classificação de uma conversa (persistido em JSON)
+    
+    Equivale a reclassificar o texto completo (mensagens em minúsculas unidas
+    por espaço). Os padrões de tag são literais separados por '.*', que não
+    atravessa quebra de linha: por padrão ainda não casado basta guardar
+    quantos literais já apareceram na linha atual e de onde a busca continua,
+    mais o fim da linha (literal dividido entre duas mensagens).
+    """
+    __slots__ = ("fingerprint", "messages", "tags", "progress", "line_length", "tail",
+                 "sentiment", "first_user_message")
+    
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.messages = 0
+        self.tags: set = set()
+        self.progress: Dict[int, Tuple[int, int]] = {}  # padrão -> (literais vistos, posição na linha)
+        self.line_length = 0
+        self.tail = ""
+        self.sentiment = 0  # Soma sem limite; o resultado é limitado a ±100
+        self.first_user_message: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'messages': self.messages,
+            'tags': sorted(self.tags),
+            'progress': {str(index): list(value) for index, value in self.progress.items()},
+            'line_length': self.line_length,
+            'tail': self.tail,
+            'sentiment': self.sentiment,
+            'first_user_message': self.first_user_message,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ClassificationState":
+        state = cls(data['fingerprint'])
+        state.messages = data['messages']
+        state.tags = set(data['tags'])
+        state.progress = {int(index): tuple(value) for index, value in data['progress'].items()}
+        state.line_length = data['line_length']
+        state.tail = data['tail']
+        state.sentiment = data['sentiment']
+        state.first_user_message = data['first_user_message']
+        return state
+
 class ConversationClassifier:
     def __init__(self):
         self.patterns = self._load_patterns()
+        # Compilados uma vez (mesma ordem e flags do re.search por padrão)
+        self._compiled_patterns = [
+            (tag, [re.compile(pattern, re.IGNORECASE) for pattern in patterns])
+            for tag, patterns in self.patterns.items()
+        ]
+        self._compile_segments()
         
     def _load_patterns(self) -> Dict:
         """Carrega padrões para classificação baseada em regras"""
@@ -94,37 +152,185 @@ class ConversationClassifier:
     async def analyze_conversation(self, messages: List[Dict]) -> Dict:
         """Analisa conversa completa e retorna classificação"""
         
+        # Análise baseada em regras
+        result = self.classify(messages)
+        
+        # Análise com IA (se configurado)
+        ai_analysis = await self._ai_analysis(messages) if hasattr(settings, 'use_ai_classifier') and settings.use_ai_classifier else {}
+        
+        # Resumo e ação sugerida
+        result['ai_summary'] = ai_analysis.get('summary', result['ai_summary'])
+        result['ai_suggested_action'] = ai_analysis.get('action', result['ai_suggested_action'])
+        
+        return result
+    
+    def classify(self, messages: List[Dict]) -> Dict:
+        """Classificação por regras (síncrona, sem IA): mesmas chaves de analyze_conversation"""
+        
         # Juntar todas as mensagens
         full_text = " ".join([msg['message'].lower() for msg in messages])
         
-        # Análise baseada em regras
         tags = self._extract_tags(full_text)
-        priority = self._calculate_priority(tags, messages)
         sentiment = self._analyze_sentiment(messages)
         
-        # Análise com IA (se configurado)
-        ai_analysis = await self._ai_analysis(messages) if hasattr(settings, 'use_ai_classifier') and settings.use_ai_classifier else {}
+        return {
+            'tags': tags,
+            'priority': self._calculate_priority(tags, messages),
+            'sentiment_score': sentiment,
+            'ai_summary': self._generate_summary(messages),
+            'ai_suggested_action': self._suggest_action(tags),
+            'requires_attention': self._requires_human_attention(tags, sentiment)
+        }
+    
+    def classify_batch(self, conversations: Iterable[List[Dict]], workers: int = 0,
+                       chunk_size: int = 200, with_state: bool = False) -> Iterator[Dict]:
+        """
+        Classifica conversas em lote (backfills), em streaming e na ordem de entrada
         
-        # Resumo e ação sugerida
-        summary = ai_analysis.get('summary', self._generate_summary(messages))
-        suggested_action = ai_analysis.get('action', self._suggest_action(tags))
+        Args:
+            conversations: Iterável de listas de mensagens ({'sender', 'message'})
+            workers: > 0 distribui lotes de chunk_size num pool de processos; 0 roda aqui
+            with_state: Inclui 'classifier_state' (estado incremental para persistir)
+        """
+        if workers > 0:
+            yield from map_chunks(_classify_batch_chunk, conversations, chunk_size=chunk_size,
+                                  workers=workers, initializer=_init_batch_worker, initargs=(with_state,))
+            return
+        for messages in conversations:
+            yield self._classify_one(messages, with_state)
+    
+    def _classify_one(self, messages: List[Dict], with_state: bool) -> Dict:
+        if not with_state:
+            return self.classify(messages)
+        state = self.new_state()
+        result = self.update(state, messages)
+        result['classifier_state'] = state.to_dict()
+        return result
+    
+    def new_state(self) -> ClassificationState:
+        return ClassificationState(self._fingerprint)
+    
+    def load_state(self, data: Optional[Dict[str, Any]]) -> Optional[ClassificationState]:
+        """Estado persistido; None se ausente ou gerado com outros padrões (reclassificar do zero)"""
+        if not data or data.get('fingerprint') != self._fingerprint:
+            return None
+        try:
+            return ClassificationState.from_dict(data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Estado de classificação inválido: {str(e)}")
+            return None
+    
+    def update(self, state: ClassificationState, messages: Iterable[Dict]) -> Dict:
+        """Incorpora só as mensagens novas ao estado (O(mensagem)) e devolve a classificação"""
+        chunks = []
+        for message in messages:
+            text = message['message'].lower()
+            if message['sender'] == 'user':
+                state.sentiment += self._sentiment_delta(text)
+                if state.first_user_message is None:
+                    state.first_user_message = message['message'][:100]
+            chunks.append(text if state.messages == 0 else " " + text)
+            state.messages += 1
         
+        # Mensagens novas juntas numa varredura só (mesmo texto do full_text de classify)
+        for number, line in enumerate("".join(chunks).split("\n")):
+            if number:
+                # '.' não casa '\n': os padrões recomeçam na linha nova
+                state.progress.clear()
+                state.line_length = 0
+                state.tail = ""
+            self._scan(state, line)
+        return self.result(state)
+    
+    def result(self, state: ClassificationState) -> Dict:
+        """Classificação do estado: mesmas chaves e valores de classify sobre todas as mensagens"""
+        tags = [tag for tag, _ in self._compiled_patterns if tag in state.tags]
+        sentiment = max(-100, min(100, state.sentiment))
+        if not state.messages:
+            summary = "Conversa vazia"
+        elif state.first_user_message is None:
+            summary = "Sem mensagens do usuário"
+        else:
+            summary = f"Conversa iniciada com: {state.first_user_message}..."
         return {
             'tags': tags,
-            'priority': priority,
+            'priority': self._calculate_priority(tags, []),
             'sentiment_score': sentiment,
             'ai_summary': summary,
-            'ai_suggested_action': suggested_action,
+            'ai_suggested_action': self._suggest_action(tags),
             'requires_attention': self._requires_human_attention(tags, sentiment)
         }
     
+    async def analyze_incremental(self, new_messages: List[Dict],
+                                  state: Optional[Dict[str, Any]] = None) -> Tuple[Dict, Dict[str, Any]]:
+        """
+        analyze_conversation sem reprocessar o histórico
+        
+        Args:
+            new_messages: Mensagens recebidas desde o último estado
+            state: Estado persistido (None = conversa nova)
+        
+        Returns:
+            (classificação, novo estado para persistir)
+        """
+        current = self.load_state(state)
+        if current is None and state:
+            logger.warning("⚠️ Estado de classificação descartado (padrões alterados); reclassifique o histórico")
+        current = current or self.new_state()
+        result = self.update(current, new_messages)
+        
+        if hasattr(settings, 'use_ai_classifier') and settings.use_ai_classifier:
+            ai_analysis = await self._ai_analysis(new_messages)
+            result['ai_summary'] = ai_analysis.get('summary', result['ai_summary'])
+            result['ai_suggested_action'] = ai_analysis.get('action', result['ai_suggested_action'])
+        
+        return result, current.to_dict()
+    
+    def _compile_segments(self):
+        """Decompõe cada padrão em literais compilados (ordem de self.patterns)"""
+        self._segment_patterns: List[Tuple[str, List["re.Pattern"]]] = []
+        longest = 1
+        for tag, patterns in self.patterns.items():
+            for pattern in patterns:
+                segments = [segment for segment in pattern.split('.*') if segment]
+                if not segments or not all(_LITERAL_SEGMENT.fullmatch(segment) for segment in segments):
+                    raise ValueError(f"Padrão '{pattern}' ({tag}) não suportado pela classificação incremental")
+                longest = max(longest, *map(len, segments))
+                self._segment_patterns.append((tag, [re.compile(re.escape(segment), re.IGNORECASE) for segment in segments]))
+        self._tail_length = longest - 1
+        self._fingerprint = hashlib.sha1(repr(self.patterns).encode("utf-8")).hexdigest()[:12]
+    
+    def _scan(self, state: ClassificationState, part: str):
+        """Avança cada padrão ainda não casado sobre o trecho novo da linha atual"""
+        base = state.line_length - len(state.tail)
+        buffer = state.tail + part
+        for index, (tag, segments) in enumerate(self._segment_patterns):
+            if tag in state.tags:
+                continue
+            step, resume = state.progress.get(index, (0, 0))
+            # Antes do fim guardado não cabe literal que termine no trecho novo
+            position = max(resume - base, 0)
+            while step < len(segments):
+                match = segments[step].search(buffer, position)
+                if not match:
+                    break
+                step += 1
+                position = match.end()
+            if step == len(segments):
+                state.tags.add(tag)
+                state.progress = {i: value for i, value in state.progress.items() if self._segment_patterns[i][0] != tag}
+            elif step:
+                state.progress[index] = (step, base + position)
+        state.line_length += len(part)
+        state.tail = buffer[max(len(buffer) - self._tail_length, 0):]
+    
     def _extract_tags(self, text: str) -> List[str]:
         """Extrai tags baseadas em padrões"""
         tags = []
         
-        for tag, patterns in self.patterns.items():
+        for tag, patterns in self._compiled_patterns:
             for pattern in patterns:
-                if re.search(pattern, text, re.IGNORECASE):
+                if pattern.search(text):
                     tags.append(tag)
                     break
         
@@ -151,24 +357,29 @@ class ConversationClassifier:
     def _analyze_sentiment(self, messages: List[Dict]) -> int:
         """Analisa sentimento da conversa (-100 a 100)"""
         
-        positive_words = ['obrigado', 'obrigada', 'ótimo', 'excelente', 'perfeito', 'maravilhoso', 'obrigado', 'valeu', 'legal']
-        negative_words = ['ruim', 'péssimo', 'horrível', 'demora', 'problema', 'erro', 'cancelar', 'insatisfeito', 'reclamar']
-        
         score = 0
         for msg in messages:
             if msg['sender'] == 'user':
-                text = msg['message'].lower()
-                
-                for word in positive_words:
-                    if word in text:
-                        score += 20
-                
-                for word in negative_words:
-                    if word in text:
-                        score -= 20
+                score += self._sentiment_delta(msg['message'].lower())
         
         return max(-100, min(100, score))
     
+    def _sentiment_delta(self, text: str) -> int:
+        """Contribuição de uma mensagem (em minúsculas) ao sentimento, sem limite"""
+        positive_words = ['obrigado', 'obrigada', 'ótimo', 'excelente', 'perfeito', 'maravilhoso', 'obrigado', 'valeu', 'legal']
+        negative_words = ['ruim', 'péssimo', 'horrível', 'demora', 'problema', 'erro', 'cancelar', 'insatisfeito', 'reclamar']
+        
+        score = 0
+        for word in positive_words:
+            if word in text:
+                score += 20
+        
+        for word in negative_words:
+            if word in text:
+                score -= 20
+        
+        return score
+    
     def _generate_summary(self, messages: List[Dict]) -> str:
         """Gera resumo simples da conversa"""
         if not messages:
@@ -243,4 +454,15 @@ class ConversationClassifier:
             
         except Exception as e:
             logger.error(f"Erro na análise IA: {str(e)}")
-            return {} 
\ No newline at end of file
+            return {} 
+
+# Lotes em pool de processos: um classificador por processo (criado no initializer)
+_batch_classifier: Optional[Tuple[ConversationClassifier, bool]] = None
+
+def _init_batch_worker(with_state: bool = False):
+    global _batch_classifier
+    _batch_classifier = (ConversationClassifier(), with_state)
+
+def _classify_batch_chunk(conversations: List[List[Dict]]) -> List[Dict]:
+    classifier, with_state = _batch_classifier
+    return [classifier._classify_one(messages, with_state) for messages in conversations]
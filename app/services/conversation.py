@@ -1,13 +1,19 @@
 from typing import Dict, Optional, List
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
 from app.models.database import Conversation, Appointment, WaitingList, get_db
+from app.models.conversation_repository import ConversationRepository, open_conversation_repository
 from app.services.whatsapp import WhatsAppService
 from app.services.gestaods import GestaoDS
+from app.services.availability_cache import get_availability_cache
+from app.services.appointment_index import get_appointment_index
+from app.services.conversation_state_store import get_conversation_state_store
+from app.services import conversation_context as ctx
 from app.utils.validators import ValidatorUtils
 from app.utils.formatters import FormatterUtils
 from app.utils.nlu_processor import NLUProcessor
 from app.services.state_manager import StateManager
+from app.services.state_machine import StateDispatcher
+from app.utils.keyed_lock import KeyedLockRegistry
 from app.config import settings
 import logging
 import re
@@ -15,14 +21,23 @@ import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Serialização por telefone compartilhada por todas as instâncias do manager
+phone_locks = KeyedLockRegistry(name="phone")
+
 class ConversationManager:
     def __init__(self):
         self.whatsapp = WhatsAppService()
         self.gestaods = GestaoDS()
+        self.availability = get_availability_cache()
+        self.appointment_index = get_appointment_index()
         self.validator = ValidatorUtils()
         self.nlu = NLUProcessor()
         self.state_manager = StateManager()
-        self.conversation_cache = {}
+        # Tabela de despacho compilada do grafo de estados (handlers resolvidos uma vez)
+        self.dispatcher = StateDispatcher(self, fallback="_handle_estado_desconhecido")
+        self.phone_locks = phone_locks
+        # Estado das conversas em memória (write-behind); None lê/grava direto no banco
+        self.state_store = get_conversation_state_store() if settings.conversation_store_enabled else None
         
     def _create_fallback_conversation(self, phone: str):
         """Cria conversa em memória quando banco falha"""
@@ -47,12 +62,16 @@ class ConversationManager:
         return hasattr(conversa, '_fields') and 'fallback_' in str(conversa.id)
 
     async def processar_mensagem(self, phone: str, message: str, message_id: str, db_generator):
+        """Processa mensagem serializando por telefone (ordem garantida por paciente)"""
+        # Mensagens do mesmo telefone nunca rodam _process_by_state em paralelo;
+        # telefones diferentes seguem totalmente em paralelo
+        async with self.phone_locks.lock(phone):
+            await self._processar_mensagem(phone, message, message_id, db_generator)
+
+    async def _processar_mensagem(self, phone: str, message: str, message_id: str, db_generator):
         """Processa mensagem com sistema robusto de gerenciamento"""
-        # 🔧 CORREÇÃO: Converter generator para sessão
-        if hasattr(db_generator, '__next__'):
-            db = next(db_generator)
-        else:
-            db = db_generator
+        # 🔧 CORREÇÃO: Converter generator/sessão em repositório (síncrono ou assíncrono)
+        db = open_conversation_repository(db_generator)
             
         try:
             # 🔧 CORREÇÃO: Logs esperados para diagnóstico rápido
@@ -68,7 +87,10 @@ class ConversationManager:
                 pass
             
             # Buscar ou criar conversa
-            conversa = self._get_or_create_conversation(phone, db)
+            conversa = await self._get_or_create_conversation(phone, db)
+            if ctx.is_legacy(conversa.context):
+                # Linha ainda no formato antigo: troca payloads embutidos por referências
+                conversa.context = ctx.compact_context(dict(conversa.context))
             estado = conversa.state or "inicio"
             # 🔧 CORREÇÃO: Rastrear último estado para comandos globais
             self._last_state = estado
@@ -77,8 +99,8 @@ class ConversationManager:
             logger.info(f"🔄 Estado ANTES: {estado}")
             logger.info(f"📋 Contexto ANTES: {contexto}")
             
-            # Processar NLU
-            nlu_result = self.nlu.process_message(message)
+            # Processar NLU (sob demanda: só o perfil do estado é calculado agora)
+            nlu_result = self.nlu.process_message(message, needs=self.dispatcher.nlu_needs(estado), state=estado)
             
             # 🔧 CORREÇÃO: Remover validação que bloqueia o fluxo normal
             # Os números 1-5 são válidos em muitos contextos (confirmações, escolhas, etc)
@@ -90,26 +112,25 @@ class ConversationManager:
             if self._is_global_command(message):
                 logger.info(f"🌐 Comando global detectado: '{message}'")
                 await self._handle_global_command(phone, message, conversa, db)
-                return
+            else:
+                # Processar por estado
+                await self._process_by_state(phone, message, conversa, db, nlu_result)
             
-            # Processar por estado
-            await self._process_by_state(phone, message, conversa, db, nlu_result)
+            # 🔧 CORREÇÃO: Logs pós-processamento (lidos do objeto em memória, sem refresh no banco)
+            estado_depois = conversa.state
+            contexto_depois = conversa.context.copy() if conversa.context else {}
             
-            # 🔧 CORREÇÃO: Logs pós-processamento
-            try:
-                db.refresh(conversa)  # Garantir que temos dados atualizados
-                estado_depois = conversa.state
-                contexto_depois = conversa.context.copy() if conversa.context else {}
-                
-                logger.info(f"🔄 Estado DEPOIS: {estado_depois}")
-                logger.info(f"📋 Contexto DEPOIS: {contexto_depois}")
-                
-                # 🔧 CORREÇÃO: Log explicando por que mudou
-                if estado != estado_depois:
-                    logger.info(f"🔍 Mudança de estado: {estado} → {estado_depois}")
-                    logger.info(f"📝 Razão: Processamento da mensagem '{message}' resultou em nova fase")
-            except Exception as refresh_error:
-                logger.warning(f"⚠️ Erro ao fazer refresh: {refresh_error}")
+            logger.info(f"🔄 Estado DEPOIS: {estado_depois}")
+            logger.info(f"📋 Contexto DEPOIS: {contexto_depois}")
+            
+            # 🔧 CORREÇÃO: Log explicando por que mudou
+            if estado != estado_depois:
+                logger.info(f"🔍 Mudança de estado: {estado} → {estado_depois}")
+                logger.info(f"📝 Razão: Processamento da mensagem '{message}' resultou em nova fase")
+            
+            # Unit of work: estado, contexto e inserts do turno num único COMMIT
+            if not await self._concluir_turno(db, conversa):
+                logger.error(f"❌ Alterações do turno descartadas para {phone}")
             
             logger.info(f"🎯 ===== PROCESSAMENTO CONCLUÍDO =====")
             
@@ -117,18 +138,21 @@ class ConversationManager:
             logger.error(f"❌ Erro no processamento da mensagem: {str(e)}")
             logger.exception("Stack trace completo:")
             
+            # Turno com erro não grava nada pela metade
+            await db.rollback()
+            
             # Em caso de erro crítico, tentar handle de erro
             try:
-                conversa = self._get_or_create_conversation(phone, db)
+                conversa = await self._get_or_create_conversation(phone, db)
                 await self._handle_error(phone, conversa, db)
+                await self._concluir_turno(db, conversa)
             except Exception as error_handling_error:
                 logger.error(f"❌ Erro crítico no handling de erro: {str(error_handling_error)}")
                 logger.error("Sistema em estado crítico - não enviando mensagem de erro para evitar loops")
         finally:
             # 🔧 CORREÇÃO: Fechar sessão se necessário
             try:
-                if hasattr(db, 'close'):
-                    db.close()
+                await db.close()
             except:
                 pass
     
@@ -169,7 +193,7 @@ class ConversationManager:
         
         return status_map.get(state, f"Estado: {state}")
     
-    async def _handle_global_command(self, phone: str, message: str, conversa: Conversation, db: Session):
+    async def _handle_global_command(self, phone: str, message: str, conversa: Conversation, db: ConversationRepository):
         """Trata comandos globais"""
         cmd = message.strip().lower()
         
@@ -190,7 +214,7 @@ class ConversationManager:
             await self._cancelar_operacao_atual(phone, conversa, db)
     
     async def _process_by_state(self, phone: str, message: str, conversa: Conversation, 
-                               db: Session, nlu_result: Dict):
+                               db: ConversationRepository, nlu_result: Dict):
         """Processa mensagem baseado no estado atual"""
         estado = conversa.state or "inicio"
         # 🔧 CORREÇÃO: Rastrear último estado para comandos globais
@@ -200,41 +224,40 @@ class ConversationManager:
         logger.info(f"   - Estado detectado: '{estado}'")
         logger.info(f"   - Mensagem: '{message}'")
         
-        handlers = {
-            "inicio": self._handle_inicio,
-            "menu_principal": self._handle_menu_principal,
-            "aguardando_cpf": self._handle_cpf,
-            "confirmando_paciente": self._handle_confirmacao_paciente,
-            "paciente_nao_encontrado": self._handle_paciente_nao_encontrado_opcoes,
-            "escolhendo_data": self._handle_escolha_data,
-            "escolhendo_horario": self._handle_escolha_horario,
-            "confirmando_agendamento": self._handle_confirmacao,
-            "visualizando_agendamentos": self._handle_visualizar_agendamentos,
-            "lista_espera": self._handle_lista_espera,
-            "agendamento_sem_dias": self._handle_agendamento_sem_dias,
-            "data_sem_horarios": self._handle_data_sem_horarios,
-            "finalizada": self._handle_conversa_finalizada  # 🔧 CORREÇÃO: Estado finalizada
-        }
-        
-        handler = handlers.get(estado, self._handle_estado_desconhecido)
+        spec, handler = self.dispatcher.route(estado)
         handler_name = handler.__name__ if hasattr(handler, '__name__') else str(handler)
         logger.info(f"🔧 Handler selecionado: {handler_name}")
         
         # 🔧 CORREÇÃO: Dispatcher resiliente com try/catch
         try:
+            if spec is not None:
+                # Validar expecting apenas se existir e for claramente errado
+                expecting = (conversa.context or {}).get("expecting")
+                if not spec.accepts_expecting(expecting):
+                    self.dispatcher.out_of_context += 1
+                    logger.warning(f"❌ Mensagem fora de contexto em '{estado}' - expecting: {expecting}")
+                    await self.whatsapp.send_text(phone, spec.out_of_context_message)
+                    await self._mostrar_menu_principal(phone, conversa, db)
+                    return
+                if not self.dispatcher.check_input(spec, message):
+                    logger.info(f"   - Entrada fora do esperado para '{estado}'")
+            
             await handler(phone, message, conversa, db, nlu_result)
+            
+            if spec is not None:
+                self.dispatcher.check_transition(spec, conversa.state)
         except Exception as e:
             logger.exception(f"❌ Erro dentro do handler de estado '{estado}': {str(e)}")
             logger.error(f"Handler: {handler_name}, Telefone: {phone}, Mensagem: {message}")
             await self._handle_error(phone, conversa, db)
     
     async def _handle_inicio(self, phone: str, message: str, conversa: Conversation, 
-                           db: Session, nlu_result: Dict):
+                           db: ConversationRepository, nlu_result: Dict):
         """Handler do estado inicial"""
         # Enviar saudação e menu
         await self._mostrar_menu_principal(phone, conversa, db)
     
-    async def _mostrar_menu_principal(self, phone: str, conversa: Conversation, db: Session):
+    async def _mostrar_menu_principal(self, phone: str, conversa: Conversation, db: ConversationRepository):
         """Mostra menu principal"""
         saudacao = FormatterUtils.formatar_saudacao()
         menu = f"""
@@ -260,24 +283,15 @@ Digite *0* para sair
         # 🔧 CORREÇÃO: Persistir estado apenas se não for fallback
         if not self._is_fallback_conversation(conversa):
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar no banco: {str(e)}")
                 # Em modo fallback, apenas continuar
         logger.info(f"💾 Estado 'menu_principal' salvo, expecting: menu_option")
     
     async def _handle_menu_principal(self, phone: str, message: str, conversa: Conversation,
-                                   db: Session, nlu_result: Dict):
+                                   db: ConversationRepository, nlu_result: Dict):
         """Handler do menu principal - Versão normalizada e resiliente"""
-        # 🔧 CORREÇÃO: Validar expecting apenas se existir e for diferente de menu_option
-        # Não bloquear se expecting não estiver definido (compatibilidade)
-        expecting = conversa.context.get("expecting")
-        if not self._is_global_command(message) and expecting and expecting not in ["menu_option", None]:
-            logger.warning(f"❌ Opção de menu fora de contexto - expecting: {expecting}")
-            await self.whatsapp.send_text(phone, "Vou mostrar o menu principal novamente:")
-            await self._mostrar_menu_principal(phone, conversa, db)
-            return
-        
         opcao = message.strip().lower()
         
         logger.info(f"🎯 MENU PRINCIPAL - Processando opção: '{opcao}'")
@@ -317,7 +331,7 @@ Digite *0* para sair
             
             # 🔧 CORREÇÃO: Persistir estado imediatamente
             try:
-                db.commit()
+                await db.commit()
                 logger.info(f"💾 Estado salvo no banco: {conversa.state}")
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
@@ -330,22 +344,13 @@ Digite *0* para sair
             # Manter estado atual após opção inválida
             logger.info(f"🔄 Mantendo estado atual: {conversa.state}")
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
     
     async def _handle_cpf(self, phone: str, message: str, conversa: Conversation, 
-                         db: Session, nlu_result: Dict):
+                         db: ConversationRepository, nlu_result: Dict):
         """Handler para validação de CPF com fallback robusto"""
-        # 🔧 CORREÇÃO: Validar expecting apenas se existir e for claramente errado
-        # Não bloquear se expecting não estiver definido (compatibilidade)
-        expecting = conversa.context.get("expecting")
-        if expecting and expecting not in ["cpf", None] and expecting != "menu_option":
-            logger.warning(f"❌ CPF fora de contexto - expecting: {expecting}")
-            await self.whatsapp.send_text(phone, "Desculpe, não entendi. Voltando ao menu principal.")
-            await self._mostrar_menu_principal(phone, conversa, db)
-            return
-        
         cpf = re.sub(r'[^0-9]', '', message)
         
         logger.info(f"🔍 Processando CPF: {cpf}")
@@ -369,7 +374,7 @@ Digite *0* para sair
             conversa.state = "menu_principal"
             conversa.context = {}
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
             await self._mostrar_menu_principal(phone, conversa, db)
@@ -394,7 +399,7 @@ Digite *0* para sair
         await self._mostrar_confirmacao_paciente(phone, paciente, conversa, db)
     
     async def _handle_paciente_nao_encontrado(self, phone: str, cpf: str, 
-                                            conversa: Conversation, db: Session):
+                                            conversa: Conversation, db: ConversationRepository):
         """Trata quando paciente não é encontrado"""
         mensagem = """
 ❌ *CPF não encontrado em nosso sistema*
@@ -417,12 +422,12 @@ Digite o número da opção:
         conversa.context = contexto
         conversa.state = "paciente_nao_encontrado"
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
     
     async def _handle_paciente_nao_encontrado_opcoes(self, phone: str, message: str,
-                                                    conversa: Conversation, db: Session, nlu_result: Dict):
+                                                    conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para quando paciente não é encontrado"""
         opcao = message.strip()
         
@@ -431,7 +436,7 @@ Digite o número da opção:
             await self.whatsapp.send_text(phone, "Por favor, digite seu CPF novamente:")
             conversa.state = "aguardando_cpf"
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "2":
@@ -445,7 +450,7 @@ Digite o número da opção:
                 "Digite *1* para voltar ao menu principal.")
             conversa.state = "menu_principal"
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "3":
@@ -453,7 +458,7 @@ Digite o número da opção:
             await self._mostrar_contato_atendente(phone)
             conversa.state = "menu_principal"
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "0":
@@ -469,12 +474,12 @@ Digite o número da opção:
                 "*0* - Voltar ao menu")
     
     async def _iniciar_agendamento(self, phone: str, paciente: Dict, 
-                                  conversa: Conversation, db: Session):
+                                  conversa: Conversation, db: ConversationRepository):
         """Inicia processo de agendamento"""
         nome = paciente.get('nome', 'Paciente')
         
-        # Buscar dias disponíveis
-        dias = await self.gestaods.buscar_dias_disponiveis()
+        # Buscar dias disponíveis que ainda têm horários (consulta paralela por dia)
+        dias = await self.availability.get_dias_com_horarios(limit=7)
         
         if not dias:
             # ✅ PRESERVAR contexto mesmo quando API falha
@@ -495,7 +500,7 @@ Digite o número da opção:
             
             # 🔧 CORREÇÃO: Persistir estado imediatamente
             try:
-                db.commit()
+                await db.commit()
                 logger.info(f"💾 Estado 'agendamento_sem_dias' salvo, expecting: agendamento_sem_dias")
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
@@ -518,7 +523,7 @@ Digite o número da opção:
         await self.whatsapp.send_text(phone, mensagem)
         
         contexto = conversa.context or {}
-        contexto['dias_disponiveis'] = dias[:7]
+        contexto[ctx.DIAS] = ctx.dias_ids(dias[:7])
         contexto['expecting'] = 'escolha_data'  # 🔧 CORREÇÃO: Flag expecting
         conversa.context = contexto
         conversa.state = "escolhendo_data"
@@ -526,37 +531,26 @@ Digite o número da opção:
         # 🔧 CORREÇÃO: Persistir estado apenas se não for fallback
         if not self._is_fallback_conversation(conversa):
             try:
-                db.commit()
+                await db.commit()
                 logger.info(f"💾 Estado 'escolhendo_data' salvo, expecting: escolha_data")
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar no banco: {str(e)}")
                 # Em modo fallback, apenas continuar
     
     async def _handle_escolha_data(self, phone: str, message: str, conversa: Conversation,
-                                  db: Session, nlu_result: Dict):
-        """Handler para escolha de data com validação expecting"""
-        # 🔧 CORREÇÃO: Validar expecting apenas se claramente errado
-        expecting = conversa.context.get("expecting")
-        if expecting and expecting not in ["escolha_data", None] and conversa.state == "escolhendo_data":
-            logger.warning(f"❌ Escolha de data fora de contexto - expecting: {expecting}")
-            await self.whatsapp.send_text(phone, "Desculpe, não entendi. Voltando ao menu principal.")
-            await self._mostrar_menu_principal(phone, conversa, db)
-            return
-        
+                                  db: ConversationRepository, nlu_result: Dict):
+        """Handler para escolha de data (expecting validado no dispatcher)"""
         try:
             opcao = int(message.strip())
             contexto = conversa.context or {}
-            dias = contexto.get('dias_disponiveis', [])
+            data_escolhida = ctx.escolher_opcao(contexto.get(ctx.DIAS, []), opcao)
             
-            if 1 <= opcao <= len(dias):
-                dia_escolhido = dias[opcao - 1]
-                contexto['data_escolhida'] = dia_escolhido
-                contexto['expecting'] = 'escolha_horario'  # 🔧 CORREÇÃO: Flag expecting
-                
+            if data_escolhida:
                 # Buscar horários disponíveis
-                horarios = await self.gestaods.buscar_horarios_disponiveis(dia_escolhido['data'])
+                horarios = await self.availability.get_horarios(data_escolhida)
                 
                 if not horarios:
+                    # Data e expecting só mudam com horários confirmados (o contexto é gravado)
                     await self.whatsapp.send_text(phone,
                         "😔 Não há horários disponíveis para esta data.\n\n"
                         "*O que deseja fazer?*\n\n"
@@ -567,13 +561,13 @@ Digite o número da opção:
                     # ✅ PRESERVAR estado e contexto!
                     conversa.state = "data_sem_horarios"
                     try:
-                        db.commit()  # ✅ SEMPRE FAZER COMMIT!
+                        await db.commit()  # ✅ SEMPRE FAZER COMMIT!
                     except Exception as e:
                         logger.error(f"❌ Erro ao salvar estado: {e}")
                     return
                 
                 # Mostrar horários
-                data = datetime.fromisoformat(dia_escolhido['data'])
+                data = datetime.fromisoformat(data_escolhida)
                 mensagem = f"📅 Data: *{data.strftime('%d/%m/%Y')}*\n\n⏰ *Horários disponíveis:*\n\n"
                 
                 for i, horario in enumerate(horarios[:8], 1):  # Limitar a 8 horários
@@ -583,13 +577,15 @@ Digite o número da opção:
                 
                 await self.whatsapp.send_text(phone, mensagem)
                 
-                contexto['horarios_disponiveis'] = horarios[:8]
+                contexto[ctx.DATA] = data_escolhida
+                contexto[ctx.HORARIOS] = ctx.horarios_ids(horarios[:8])
+                contexto['expecting'] = 'escolha_horario'  # 🔧 CORREÇÃO: Flag expecting
                 conversa.context = contexto
                 conversa.state = "escolhendo_horario"
                 
                 # 🔧 CORREÇÃO: Persistir estado imediatamente
                 try:
-                    db.commit()
+                    await db.commit()
                     logger.info(f"💾 Estado 'escolhendo_horario' salvo, expecting: escolha_horario")
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
@@ -603,35 +599,26 @@ Digite o número da opção:
                 "❌ Por favor, digite apenas o número da opção desejada.")
     
     async def _handle_escolha_horario(self, phone: str, message: str, conversa: Conversation,
-                                     db: Session, nlu_result: Dict):
-        """Handler para escolha de horário com validação expecting"""
-        # 🔧 CORREÇÃO: Validar expecting apenas se claramente errado
-        expecting = conversa.context.get("expecting")
-        if expecting and expecting not in ["escolha_horario", None] and conversa.state == "escolhendo_horario":
-            logger.warning(f"❌ Escolha de horário fora de contexto - expecting: {expecting}")
-            await self.whatsapp.send_text(phone, "Desculpe, não entendi. Voltando ao menu principal.")
-            await self._mostrar_menu_principal(phone, conversa, db)
-            return
-        
+                                     db: ConversationRepository, nlu_result: Dict):
+        """Handler para escolha de horário (expecting validado no dispatcher)"""
         try:
             opcao = int(message.strip())
             contexto = conversa.context or {}
-            horarios = contexto.get('horarios_disponiveis', [])
+            horario_escolhido = ctx.escolher_opcao(contexto.get(ctx.HORARIOS, []), opcao)
             
-            if 1 <= opcao <= len(horarios):
-                horario_escolhido = horarios[opcao - 1]
-                contexto['horario_escolhido'] = horario_escolhido
+            if horario_escolhido:
+                contexto[ctx.HORARIO] = horario_escolhido
                 
                 # Mostrar resumo para confirmação
-                paciente = contexto.get('paciente', {})
-                data = datetime.fromisoformat(contexto['data_escolhida']['data'])
+                paciente = await self._paciente_do_contexto(contexto) or {}
+                data = datetime.fromisoformat(contexto[ctx.DATA])
                 
                 mensagem = f"""
 ✅ *Confirmar agendamento:*
 
 👤 Paciente: *{paciente.get('nome')}*
 📅 Data: *{data.strftime('%d/%m/%Y')}*
-⏰ Horário: *{horario_escolhido['horario']}*
+⏰ Horário: *{horario_escolhido}*
 👩‍⚕️ Profissional: *Dra. Gabriela Nassif*
 
 *Confirma o agendamento?*
@@ -647,7 +634,7 @@ Digite o número da opção:
                 
                 # 🔧 CORREÇÃO: Persistir estado imediatamente
                 try:
-                    db.commit()
+                    await db.commit()
                     logger.info(f"💾 Estado 'confirmando_agendamento' salvo, expecting: confirmacao_agendamento")
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
@@ -661,23 +648,21 @@ Digite o número da opção:
                 "❌ Por favor, digite apenas o número da opção desejada.")
     
     async def _handle_confirmacao(self, phone: str, message: str, conversa: Conversation,
-                                 db: Session, nlu_result: Dict):
-        """Handler para confirmação de agendamento com validação expecting"""
-        # 🔧 CORREÇÃO: Validar expecting apenas se claramente errado
-        expecting = conversa.context.get("expecting")
-        if expecting and expecting not in ["confirmacao_agendamento", None] and conversa.state == "confirmando_agendamento":
-            logger.warning(f"❌ Confirmação fora de contexto - expecting: {expecting}")
-            await self.whatsapp.send_text(phone, "Desculpe, não entendi. Voltando ao menu principal.")
-            await self._mostrar_menu_principal(phone, conversa, db)
-            return
-        
+                                 db: ConversationRepository, nlu_result: Dict):
+        """Handler para confirmação de agendamento (expecting validado no dispatcher)"""
         opcao = message.strip()
         
         if opcao == "1":
             contexto = conversa.context
-            paciente = contexto['paciente']
-            data_escolhida = contexto['data_escolhida']['data']
-            horario = contexto['horario_escolhido']['horario']
+            paciente = await self._paciente_do_contexto(contexto)
+            data_escolhida = contexto[ctx.DATA]
+            horario = contexto[ctx.HORARIO]
+            
+            if not paciente:
+                logger.error("❌ Paciente do contexto não pôde ser resolvido")
+                await self.whatsapp.send_text(phone, "Desculpe, não consegui recuperar seu cadastro. Voltando ao menu principal.")
+                await self._mostrar_menu_principal(phone, conversa, db)
+                return
             
             # Formatar datas para API usando método correto
             # Criar datetime objects
@@ -688,6 +673,18 @@ Digite o número da opção:
             data_inicio_api = self.gestaods.converter_datetime_para_api(dt_inicio)
             data_fim_api = self.gestaods.converter_datetime_para_api(dt_fim)
             
+            # Sair de 'confirmando_agendamento' antes da reserva remota: com o
+            # COMMIT falhando não reserva; depois dela, nenhum rollback do turno
+            # devolve o paciente ao passo de confirmação (um novo "1" reservaria de novo)
+            conversa.state = "menu_principal"
+            conversa.context = {}
+            await db.commit()
+            if not await self._concluir_turno(db, conversa):
+                await self.whatsapp.send_text(phone,
+                    "❌ Não consegui confirmar o agendamento agora.\n\n"
+                    "Por favor, digite *1* novamente em instantes.")
+                return
+            
             # Criar agendamento
             resultado = await self.gestaods.criar_agendamento(
                 cpf=paciente['cpf'],
@@ -708,7 +705,10 @@ Digite o número da opção:
                         status="scheduled"
                     )
                     db.add(novo_agendamento)
-                    db.commit()
+                    await db.commit()
+                    # Transação própria: falha aqui não desfaz o estado já gravado
+                    if not await self._concluir_turno(db, conversa):
+                        logger.error(f"❌ Agendamento local não gravado (reserva na GestãoDS mantida)")
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar agendamento local: {e}")
                 
@@ -745,7 +745,7 @@ Digite *1* para voltar ao menu principal.
             conversa.state = "menu_principal"
             conversa.context = {}
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
             
@@ -756,7 +756,7 @@ Digite *1* para voltar ao menu principal.
             conversa.state = "menu_principal"
             conversa.context = {}
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         else:
@@ -764,19 +764,27 @@ Digite *1* para voltar ao menu principal.
                 "Por favor, digite:\n*1* para confirmar\n*2* para cancelar")
     
     async def _mostrar_agendamentos(self, phone: str, paciente: Dict, 
-                                   conversa: Conversation, db: Session):
+                                   conversa: Conversation, db: ConversationRepository):
         """Mostra agendamentos do paciente"""
-        # Buscar agendamentos
-        data_inicial = datetime.now().strftime("%d/%m/%Y")
-        data_final = (datetime.now() + timedelta(days=365)).strftime("%d/%m/%Y")
-        
-        agendamentos = await self.gestaods.listar_agendamentos_periodo(data_inicial, data_final)
-        
-        # Filtrar agendamentos do paciente
-        agendamentos_paciente = [
-            ag for ag in agendamentos 
-            if ag.get('cpf') == paciente['cpf']
-        ]
+        # Consultar índice local por CPF (O(k) nos agendamentos do paciente)
+        agendamentos_paciente = self.appointment_index.lookup(paciente['cpf'])
+        
+        if agendamentos_paciente is None:
+            # Índice ainda não confiável: varrer o mesmo horizonte do sync completo e alimentar o índice
+            inicio = datetime.now().date()
+            fim = inicio + timedelta(days=self.appointment_index.horizon_days)
+            agendamentos = await self.gestaods._fetch_agendamentos_periodo(
+                inicio.strftime("%d/%m/%Y"), fim.strftime("%d/%m/%Y"))
+            
+            if agendamentos is not None:
+                self.appointment_index.load_listing(agendamentos, inicio, fim)
+            
+            # Filtrar agendamentos do paciente (listagem pode trazer CPF formatado)
+            cpf = ValidatorUtils.extrair_numeros(str(paciente['cpf']))
+            agendamentos_paciente = [
+                ag for ag in (agendamentos or [])
+                if ValidatorUtils.extrair_numeros(str(ag.get('cpf') or '')) == cpf
+            ]
         
         if not agendamentos_paciente:
             await self.whatsapp.send_text(phone,
@@ -804,12 +812,12 @@ Digite *1* para voltar ao menu principal.
         
         conversa.state = "visualizando_agendamentos"
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
     
     async def _handle_visualizar_agendamentos(self, phone: str, message: str,
-                                             conversa: Conversation, db: Session, nlu_result: Dict):
+                                             conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para visualização de agendamentos"""
         opcao = message.strip()
         
@@ -822,14 +830,14 @@ Digite *1* para voltar ao menu principal.
                 "Vamos agendar sua consulta! 📅\n\n"
                 "Por favor, digite seu *CPF* (apenas números):")
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "3":
             await self._mostrar_contato_cancelamento(phone)
             conversa.state = "menu_principal"
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         else:
@@ -838,12 +846,12 @@ Digite *1* para voltar ao menu principal.
                 "*0* para menu\n*1* para agendar\n*3* para cancelar")
     
     async def _iniciar_cancelamento(self, phone: str, paciente: Dict,
-                                   conversa: Conversation, db: Session):
+                                   conversa: Conversation, db: ConversationRepository):
         """Inicia processo de cancelamento"""
         await self._mostrar_contato_cancelamento(phone)
         conversa.state = "menu_principal"
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
     
@@ -864,13 +872,11 @@ Digite *1* para voltar ao menu principal.
 """)
     
     async def _adicionar_lista_espera(self, phone: str, paciente: Dict,
-                                     conversa: Conversation, db: Session):
+                                     conversa: Conversation, db: ConversationRepository):
         """Adiciona paciente à lista de espera"""
         # Verificar se já está na lista
         try:
-            lista_existente = db.query(WaitingList).filter_by(
-                patient_id=str(paciente.get('id', ''))
-            ).first()
+            lista_existente = await db.get_waiting_list_entry(str(paciente.get('id', '')))
             
             if lista_existente:
                 await self.whatsapp.send_text(phone,
@@ -887,7 +893,7 @@ Digite *1* para voltar ao menu principal.
                     notified=False
                 )
                 db.add(nova_entrada)
-                db.commit()
+                await db.commit()
                 
                 await self.whatsapp.send_text(phone,
                     "✅ *Adicionado à lista de espera com sucesso!*\n\n"
@@ -904,12 +910,12 @@ Digite *1* para voltar ao menu principal.
         
         conversa.state = "menu_principal"
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
     
     async def _handle_lista_espera(self, phone: str, message: str, conversa: Conversation,
-                                  db: Session, nlu_result: Dict):
+                                  db: ConversationRepository, nlu_result: Dict):
         """Handler para lista de espera"""
         if message.strip() == "1":
             await self._mostrar_menu_principal(phone, conversa, db)
@@ -934,7 +940,7 @@ Sábado: 8h às 12h
 Digite *1* para voltar ao menu principal.
 """)
     
-    async def _finalizar_conversa(self, phone: str, conversa: Conversation, db: Session):
+    async def _finalizar_conversa(self, phone: str, conversa: Conversation, db: ConversationRepository):
         """Finaliza a conversa"""
         await self.whatsapp.send_text(phone,
             "👋 *Obrigado por usar nossos serviços!*\n\n"
@@ -944,15 +950,11 @@ Digite *1* para voltar ao menu principal.
         conversa.state = "finalizada"
         conversa.context = {"finalizada_em": datetime.utcnow().isoformat()}
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
-        
-        # Limpar cache
-        if phone in self.conversation_cache:
-            del self.conversation_cache[phone]
     
-    async def _cancelar_operacao_atual(self, phone: str, conversa: Conversation, db: Session):
+    async def _cancelar_operacao_atual(self, phone: str, conversa: Conversation, db: ConversationRepository):
         """Cancela operação atual e volta ao menu"""
         await self.whatsapp.send_text(phone,
             "❌ Operação cancelada.\n\n"
@@ -962,7 +964,7 @@ Digite *1* para voltar ao menu principal.
         await self._mostrar_menu_principal(phone, conversa, db)
     
     async def _handle_estado_desconhecido(self, phone: str, message: str, 
-                                        conversa: Conversation, db: Session, nlu_result: Dict):
+                                        conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para estados desconhecidos com recuperação inteligente"""
         logger.warning(f"⚠️ Estado desconhecido: {conversa.state}")
         
@@ -979,7 +981,7 @@ Digite *1* para voltar ao menu principal.
                     "Parece que houve um problema. Vamos continuar! 💪\n\n"
                     "Por favor, digite seu CPF (apenas números):")
                 try:
-                    db.commit()
+                    await db.commit()
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
                 return
@@ -988,7 +990,7 @@ Digite *1* para voltar ao menu principal.
         logger.info("   🔄 Não foi possível recuperar contexto, voltando ao menu")
         await self._mostrar_menu_principal(phone, conversa, db)
     
-    async def _handle_error(self, phone: str, conversa: Conversation, db: Session):
+    async def _handle_error(self, phone: str, conversa: Conversation, db: ConversationRepository):
         """Handler de erro mais robusto - NÃO reseta estado automaticamente"""
         logger.error(f"🚨 ERRO durante processamento para {phone}")
         logger.error(f"   Estado atual: {conversa.state}")
@@ -1004,14 +1006,14 @@ Digite *1* para voltar ao menu principal.
         logger.info("   ✅ Estado preservado após erro")
 
     async def _handle_agendamento_sem_dias(self, phone: str, message: str, 
-                                          conversa: Conversation, db: Session, nlu_result: Dict):
+                                          conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para quando não há dias disponíveis"""
         opcao = message.strip()
         
         if opcao == "1":
             # Tentar novamente
             contexto = conversa.context or {}
-            paciente = contexto.get('paciente')
+            paciente = await self._paciente_do_contexto(contexto)
             if paciente:
                 await self._iniciar_agendamento(phone, paciente, conversa, db)
             else:
@@ -1020,13 +1022,13 @@ Digite *1* para voltar ao menu principal.
                 await self.whatsapp.send_text(phone, 
                     "Vamos tentar novamente! Digite seu CPF:")
                 try:
-                    db.commit()
+                    await db.commit()
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "2":
             # Lista de espera
             contexto = conversa.context or {}
-            paciente = contexto.get('paciente')
+            paciente = await self._paciente_do_contexto(contexto)
             if paciente:
                 await self._adicionar_lista_espera(phone, paciente, conversa, db)
             else:
@@ -1036,7 +1038,7 @@ Digite *1* para voltar ao menu principal.
                 await self.whatsapp.send_text(phone, 
                     "Para entrar na lista de espera, digite seu CPF:")
                 try:
-                    db.commit()
+                    await db.commit()
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "3":
@@ -1044,7 +1046,7 @@ Digite *1* para voltar ao menu principal.
             await self._mostrar_contato_atendente(phone)
             conversa.state = "menu_principal"
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "0":
@@ -1058,28 +1060,27 @@ Digite *1* para voltar ao menu principal.
                 "*3* - Falar com atendente\n"
                 "*0* - Voltar ao menu")
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
     
     async def _handle_data_sem_horarios(self, phone: str, message: str, 
-                                       conversa: Conversation, db: Session, nlu_result: Dict):
+                                       conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para quando data não tem horários"""
         opcao = message.strip()
         
         if opcao == "1":
-            # Escolher outra data
-            conversa.state = "escolhendo_data"
-            await self.whatsapp.send_text(phone, 
-                "📅 Escolha outra data das opções disponíveis:")
-            try:
-                db.commit()
-            except Exception as e:
-                logger.error(f"❌ Erro ao salvar estado: {e}")
+            # Escolher outra data: descarta a escolha anterior e reenvia a lista (volta a expecting escolha_data)
+            contexto = conversa.context or {}
+            contexto.pop(ctx.DATA, None)
+            contexto.pop(ctx.HORARIOS, None)
+            conversa.context = contexto
+            paciente = await self._paciente_do_contexto(contexto) or {}
+            await self._iniciar_agendamento(phone, paciente, conversa, db)
         elif opcao == "2":
             # Lista de espera
             contexto = conversa.context or {}
-            paciente = contexto.get('paciente')
+            paciente = await self._paciente_do_contexto(contexto)
             if paciente:
                 await self._adicionar_lista_espera(phone, paciente, conversa, db)
             else:
@@ -1089,7 +1090,7 @@ Digite *1* para voltar ao menu principal.
                 contexto['acao'] = 'lista_espera'
                 conversa.context = contexto
                 try:
-                    db.commit()
+                    await db.commit()
                 except Exception as e:
                     logger.error(f"❌ Erro ao salvar estado: {e}")
         elif opcao == "0":
@@ -1102,12 +1103,12 @@ Digite *1* para voltar ao menu principal.
                 "*2* - Lista de espera\n"
                 "*0* - Voltar ao menu")
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
 
     async def _mostrar_confirmacao_paciente(self, phone: str, paciente: Dict, 
-                                           conversa: Conversation, db: Session):
+                                           conversa: Conversation, db: ConversationRepository):
         """Mostra dados do paciente para confirmação"""
         nome = paciente.get('nome', 'Paciente')
         cpf = paciente.get('cpf', '')
@@ -1131,7 +1132,7 @@ Digite o número da opção:
         
         # Salvar paciente temporariamente
         contexto = conversa.context or {}
-        contexto['paciente_temp'] = paciente
+        self._guardar_paciente(contexto, paciente, temporario=True)
         contexto['expecting'] = 'confirmacao_paciente'  # 🔧 CORREÇÃO: Flag expecting
         conversa.context = contexto
         conversa.state = "confirmando_paciente"
@@ -1139,14 +1140,14 @@ Digite o número da opção:
         # 🔧 CORREÇÃO: Persistir estado apenas se não for fallback
         if not self._is_fallback_conversation(conversa):
             try:
-                db.commit()
+                await db.commit()
                 logger.info(f"💾 Estado 'confirmando_paciente' salvo, expecting: confirmacao_paciente")
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar no banco: {str(e)}")
                 # Em modo fallback, apenas continuar
 
     async def _handle_confirmacao_paciente(self, phone: str, message: str, 
-                                         conversa: Conversation, db: Session, nlu_result: Dict):
+                                         conversa: Conversation, db: ConversationRepository, nlu_result: Dict):
         """Handler para confirmação de paciente"""
         opcao = message.strip()
         contexto = conversa.context or {}
@@ -1155,10 +1156,10 @@ Digite o número da opção:
         
         if opcao == "1":
             # Confirmar paciente
-            paciente = contexto.get('paciente_temp')
+            paciente = await self._paciente_do_contexto(contexto, temporario=True)
             if paciente:
-                contexto['paciente'] = paciente
-                contexto.pop('paciente_temp', None)
+                self._guardar_paciente(contexto, paciente)
+                self._descartar_paciente_temp(contexto)
                 conversa.context = contexto
                 
                 logger.info(f"✅ Paciente confirmado: {paciente.get('nome')}")
@@ -1181,7 +1182,7 @@ Digite o número da opção:
                     conversa.state = "menu_principal"
                     conversa.context = {}
                     try:
-                        db.commit()
+                        await db.commit()
                     except Exception as e:
                         logger.error(f"❌ Erro ao salvar estado: {e}")
                     await self._mostrar_menu_principal(phone, conversa, db)
@@ -1193,19 +1194,19 @@ Digite o número da opção:
             # Tentar outro CPF
             await self.whatsapp.send_text(phone, "Por favor, digite o CPF correto:")
             conversa.state = "aguardando_cpf"
-            contexto.pop('paciente_temp', None)
+            self._descartar_paciente_temp(contexto)
             contexto['expecting'] = 'cpf'  # 🔧 CORREÇÃO: Flag expecting
             conversa.context = contexto
             # 🔧 CORREÇÃO: Persistir estado imediatamente
             try:
-                db.commit()
+                await db.commit()
                 logger.info(f"💾 Estado 'aguardando_cpf' salvo, expecting: cpf")
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
             
         elif opcao == "0":
             # Voltar ao menu
-            contexto.pop('paciente_temp', None)
+            self._descartar_paciente_temp(contexto)
             conversa.context = contexto
             await self._mostrar_menu_principal(phone, conversa, db)
             
@@ -1214,7 +1215,7 @@ Digite o número da opção:
                 "❌ Opção inválida!\n\n"
                 "Digite:\n*1* - Sim, é meu cadastro\n*2* - Não, outro CPF\n*0* - Voltar ao menu")
             try:
-                db.commit()
+                await db.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao salvar estado: {e}")
 
@@ -1225,16 +1226,66 @@ Digite o número da opção:
             return f"{cpf_limpo[:3]}.{cpf_limpo[3:6]}.{cpf_limpo[6:9]}-{cpf_limpo[9:]}"
         return cpf
 
-    def _get_or_create_conversation(self, phone: str, db: Session) -> Conversation:
+    async def _paciente_do_contexto(self, contexto: Dict, temporario: bool = False) -> Optional[Dict]:
+        """Resolve a referência do paciente guardada no contexto (cache compartilhado da GestãoDS)"""
+        embutido = contexto.get('paciente_temp' if temporario else 'paciente')
+        if isinstance(embutido, dict):
+            return embutido
+        chave = ctx.PACIENTE_TEMP if temporario else ctx.PACIENTE
+        cpf = contexto.get(chave)
+        if not cpf:
+            return None
+        paciente = await self.gestaods.buscar_paciente_cpf(cpf)
+        resumo = contexto.get(ctx.resumo_key(chave))
+        if paciente is None and isinstance(resumo, dict):
+            # GestãoDS indisponível: paciente já identificado segue com os campos mínimos
+            logger.warning("⚠️ Paciente não resolvido na GestãoDS, usando dados guardados no contexto")
+            return dict(resumo)
+        return paciente
+
+    def _guardar_paciente(self, contexto: Dict, paciente: Dict, temporario: bool = False):
+        """Guarda a chave e o resumo do paciente; sem CPF válido o dict continua embutido"""
+        chave_ref, chave_embutida = (ctx.PACIENTE_TEMP, 'paciente_temp') if temporario else (ctx.PACIENTE, 'paciente')
+        ref = ctx.paciente_ref(paciente)
+        if ref:
+            contexto[chave_ref] = ref
+            contexto[ctx.resumo_key(chave_ref)] = ctx.paciente_resumo(paciente)
+            contexto.pop(chave_embutida, None)
+        else:
+            contexto[chave_embutida] = paciente
+
+    def _descartar_paciente_temp(self, contexto: Dict):
+        contexto.pop(ctx.PACIENTE_TEMP, None)
+        contexto.pop(ctx.PACIENTE_TEMP_RESUMO, None)
+        contexto.pop('paciente_temp', None)
+
+    async def _concluir_turno(self, db: ConversationRepository, conversa) -> bool:
+        """Commit único do turno (com o estado da conversa quando ela vem do store)"""
+        if self.state_store is not None:
+            return await self.state_store.complete_turn(db, conversa)
+        return await db.complete()
+
+    async def _get_or_create_conversation(self, phone: str, db: ConversationRepository) -> Conversation:
         """Busca ou cria conversa com tratamento de erro robusto"""
         try:
-            # 🔧 CORREÇÃO: Verificar se db é uma sessão válida
-            if not hasattr(db, 'query'):
+            # 🔧 CORREÇÃO: Verificar se db é um repositório válido
+            if not isinstance(db, ConversationRepository):
                 logger.error(f"❌ Objeto db inválido: {type(db)}")
                 # Retornar conversa fallback
                 return self._create_fallback_conversation(phone)
             
-            conversa = db.query(Conversation).filter_by(phone=phone).first()
+            if self.state_store is not None:
+                conversa = self.state_store.get(phone)
+                if conversa is not None:
+                    return conversa
+            
+            conversa = await db.get_conversation(phone)
+            
+            if self.state_store is not None:
+                # Turno trabalha na cópia do store; gravação sai em _concluir_turno
+                if conversa:
+                    return self.state_store.load(conversa)
+                return self.state_store.create(phone)
             
             if not conversa:
                 conversa = Conversation(
@@ -1243,7 +1294,7 @@ Digite o número da opção:
                     context={}
                 )
                 db.add(conversa)
-                db.commit()
+                await db.commit()
             
             return conversa
             
@@ -1253,7 +1304,7 @@ Digite o número da opção:
             return self._create_fallback_conversation(phone)
     
     async def _handle_conversa_finalizada(self, phone: str, message: str, conversa: Conversation,
-                                          db: Session, nlu_result: Dict):
+                                          db: ConversationRepository, nlu_result: Dict):
         """Handler para conversa finalizada - reinicia automaticamente"""
         logger.info(f"🔄 Conversa finalizada recebeu mensagem: '{message}'")
         logger.info("Reiniciando conversa automaticamente...")
@@ -1262,7 +1313,7 @@ Digite o número da opção:
         conversa.state = "inicio"
         conversa.context = {}
         try:
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"❌ Erro ao salvar estado: {e}")
         
@@ -0,0 +1,100 @@
+"""
+Esquema compacto do Conversation.context
+
+O contexto guarda só referências; os dados completos continuam nos caches
+compartilhados (paciente no cache da GestãoDS, dias/horários no cache de
+disponibilidade):
+
+- paciente_cpf / paciente_temp_cpf: chave do paciente (CPF só com dígitos)
+- paciente_resumo / paciente_temp_resumo: id, nome e cpf, usados se a GestãoDS
+  estiver fora quando o paciente já identificado for agendar
+- dias_ofertados: datas ISO mostradas ao paciente, na ordem das opções
+- horarios_ofertados: horários "HH:MM" mostrados ao paciente, na ordem das opções
+- data_escolhida / horario_escolhido: a data ISO e o horário escolhidos
+
+As listas guardam os IDs do que foi mostrado (a opção digitada é o offset
+nelas), não só o offset: o cache pode mudar entre um turno e outro e a
+opção "3" tem que continuar sendo o horário que o paciente viu.
+"""
+from typing import Any, Dict, List, Optional
+
+PACIENTE = "paciente_cpf"
+PACIENTE_TEMP = "paciente_temp_cpf"
+PACIENTE_RESUMO = "paciente_resumo"
+PACIENTE_TEMP_RESUMO = "paciente_temp_resumo"
+DIAS = "dias_ofertados"
+HORARIOS = "horarios_ofertados"
+DATA = "data_escolhida"
+HORARIO = "horario_escolhido"
+
+# Chaves do formato antigo (payloads completos da API embutidos)
+_LEGADO_PACIENTE = {"paciente": PACIENTE, "paciente_temp": PACIENTE_TEMP}
+_LEGADO_LISTAS = {"dias_disponiveis": (DIAS, "data"), "horarios_disponiveis": (HORARIOS, "horario")}
+_LEGADO_ESCOLHAS = {DATA: "data", HORARIO: "horario"}
+_RESUMO = {PACIENTE: PACIENTE_RESUMO, PACIENTE_TEMP: PACIENTE_TEMP_RESUMO}
+_CAMPOS_RESUMO = ("id", "nome", "cpf")
+
+def paciente_ref(paciente: Optional[Dict]) -> Optional[str]:
+    """Chave do paciente no cache (CPF só com dígitos); None se não houver CPF válido"""
+    cpf = ''.join(filter(str.isdigit, str((paciente or {}).get('cpf') or '')))
+    return cpf if len(cpf) == 11 else None
+
+def paciente_resumo(paciente: Dict) -> Dict:
+    """Campos mínimos do paciente (id, nome, cpf) para seguir sem a GestãoDS"""
+    return {campo: paciente[campo] for campo in _CAMPOS_RESUMO if paciente.get(campo) is not None}
+
+def resumo_key(chave: str) -> str:
+    """Chave do resumo que acompanha a referência (PACIENTE/PACIENTE_TEMP)"""
+    return _RESUMO[chave]
+
+def dias_ids(dias: List[Dict]) -> List[str]:
+    return [dia['data'] for dia in dias if dia.get('data')]
+
+def horarios_ids(horarios: List[Dict]) -> List[str]:
+    return [horario['horario'] for horario in horarios if horario.get('horario')]
+
+def escolher_opcao(ofertados: List[Any], opcao: int) -> Optional[Any]:
+    """Item ofertado para a opção digitada (1-based) ou None se fora da faixa"""
+    if 1 <= opcao <= len(ofertados):
+        return ofertados[opcao - 1]
+    return None
+
+def is_legacy(contexto: Optional[Dict]) -> bool:
+    if not contexto:
+        return False
+    if any(isinstance(contexto.get(chave), dict) for chave in _LEGADO_PACIENTE):
+        return True
+    if any(chave in contexto for chave in _LEGADO_LISTAS):
+        return True
+    return any(isinstance(contexto.get(chave), dict) for chave in _LEGADO_ESCOLHAS)
+
+def compact_context(contexto: Optional[Dict]) -> Dict:
+    """
+    Converte (in-place) um contexto do formato antigo para o compacto
+
+    Paciente sem CPF válido continua embutido: não há chave para resolver.
+    """
+    contexto = contexto if contexto is not None else {}
+    if not is_legacy(contexto):
+        return contexto
+
+    for antiga, nova in _LEGADO_PACIENTE.items():
+        paciente = contexto.get(antiga)
+        if isinstance(paciente, dict):
+            ref = paciente_ref(paciente)
+            if ref:
+                contexto[nova] = ref
+                contexto[_RESUMO[nova]] = paciente_resumo(paciente)
+                del contexto[antiga]
+
+    for antiga, (nova, campo) in _LEGADO_LISTAS.items():
+        itens = contexto.pop(antiga, None)
+        if isinstance(itens, list):
+            contexto[nova] = [item[campo] for item in itens if isinstance(item, dict) and item.get(campo)]
+
+    for chave, campo in _LEGADO_ESCOLHAS.items():
+        valor = contexto.get(chave)
+        if isinstance(valor, dict):
+            contexto[chave] = valor.get(campo)
+
+    return contexto
@@ -0,0 +1,314 @@
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+from app.models.database import Conversation
+
+logger = logging.getLogger(__name__)
+
+class _StateEntry:
+    __slots__ = ("conversation_id", "phone", "state", "context", "persisted",
+                 "dirty", "dirty_fields", "version", "dirty_since", "last_access")
+
+    def __init__(self, conversation_id: str, phone: str, state: str, context: Dict, persisted: bool):
+        self.conversation_id = conversation_id
+        self.phone = phone
+        self.state = state
+        self.context = context
+        self.persisted = persisted
+        self.dirty = not persisted
+        self.dirty_fields = set()  # Colunas alteradas desde a última gravação
+        self.version = 0
+        self.dirty_since: Optional[float] = None
+        self.last_access = 0.0
+
+class ConversationStateStore:
+    """
+    Estado das conversas em memória com gravação write-behind
+
+    O turno lê estado/contexto daqui (sem SELECT por telefone) e trabalha numa
+    cópia destacada da sessão. Ao fechar o turno (complete_turn):
+    - flush_interval <= 0: o estado entra no mesmo COMMIT do turno
+    - flush_interval > 0: a entrada fica suja e o job grava em lote
+
+    Ordem segura do flush: entradas gravadas da mais antiga para a mais nova
+    suja, uma versão só é marcada limpa depois do COMMIT e entrada suja nunca
+    é despejada (limite de tamanho/ociosidade só remove entradas limpas).
+    Pressupõe um único processo atendendo cada telefone, como o phone_locks.
+    """
+
+    def __init__(self, max_entries: int = 5000, idle_ttl: float = 1800, flush_interval: float = 0,
+                 repository_factory: Optional[Callable] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self._repository_factory = repository_factory
+        self._clock = clock
+
+        self._entries: "OrderedDict[str, _StateEntry]" = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.idle_evictions = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.rows_flushed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def write_behind(self) -> bool:
+        return self.flush_interval > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Leitura
+
+    def get(self, phone: str) -> Optional[Conversation]:
+        """Conversa do telefone em memória (cópia destacada) ou None"""
+        entry = self._entries.get(phone)
+        now = self._clock()
+        if entry is not None and not entry.dirty and now - entry.last_access > self.idle_ttl:
+            self._drop(phone)
+            self.idle_evictions += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry.last_access = now
+        self._entries.move_to_end(phone)
+        return self._materialize(entry)
+
+    def load(self, conversa: Conversation) -> Conversation:
+        """Registra conversa lida do banco e devolve a cópia usada no turno"""
+        entry = _StateEntry(str(conversa.id), conversa.phone, conversa.state or "inicio",
+                            copy.deepcopy(conversa.context or {}), persisted=True)
+        self._put(entry)
+        return self._materialize(entry)
+
+    def create(self, phone: str) -> Conversation:
+        """Nova conversa: o INSERT sai no fechamento do turno (ou no próximo flush)"""
+        entry = _StateEntry(str(uuid.uuid4()), phone, "inicio", {}, persisted=False)
+        entry.dirty_since = self._clock()
+        self._put(entry)
+        return self._materialize(entry)
+
+    # Escrita
+
+    async def complete_turn(self, db, conversa) -> bool:
+        """
+        Fecha o turno: grava o estado da conversa e faz o COMMIT único do turno
+
+        A memória só recebe o novo estado depois do COMMIT; se ele falhar o
+        turno inteiro é descartado e a entrada continua igual ao banco.
+        """
+        entry = self._entries.get(getattr(conversa, 'phone', None))
+        if entry is None or not isinstance(conversa, Conversation) or str(conversa.id) != entry.conversation_id:
+            return await db.complete()
+
+        state = conversa.state or "inicio"
+        context = conversa.context or {}
+        changed = set()
+        if state != entry.state:
+            changed.add("state")
+        if context != entry.context:
+            changed.add("context")
+
+        if not self.write_behind and (changed or entry.dirty):
+            await self._write(db, entry, entry.dirty_fields | changed, state, context)
+
+        if not await db.complete():
+            return False
+
+        if changed:
+            entry.state = state
+            entry.context = copy.deepcopy(context)
+            entry.version += 1
+            entry.dirty_fields |= changed
+            if entry.dirty_since is None:
+                entry.dirty_since = self._clock()
+            entry.dirty = True
+
+        if not self.write_behind and entry.dirty:
+            entry.persisted = True
+            self._mark_clean(entry)
+        return True
+
+    @staticmethod
+    async def _write(db, entry: _StateEntry, fields, state: str, context: Dict, persisted: Optional[bool] = None):
+        """INSERT completo para conversa nova; UPDATE só das colunas alteradas"""
+        persisted = entry.persisted if persisted is None else persisted
+        if not persisted:
+            await db.write_conversation_state(entry.conversation_id, entry.phone, state, context, insert=True)
+            return
+        await db.write_conversation_state(entry.conversation_id, entry.phone,
+                                          state=state if "state" in fields else None,
+                                          context=context if "context" in fields else None)
+
+    async def flush(self) -> int:
+        """Grava em lote as entradas sujas (mais antigas primeiro); retorna quantas"""
+        async with self._flush_lock:
+            pendentes = sorted((e for e in self._entries.values() if e.dirty), key=lambda e: e.dirty_since or 0.0)
+            if not pendentes:
+                return 0
+
+            snapshot = [(e, e.version, e.persisted, set(e.dirty_fields), e.state, copy.deepcopy(e.context))
+                        for e in pendentes]
+            started = time.perf_counter()
+            repo = self._open_repository()
+            try:
+                for entry, _, persisted, fields, state, context in snapshot:
+                    await self._write(repo, entry, fields, state, context, persisted=persisted)
+                ok = await repo.complete()
+            except Exception as e:
+                logger.error(f"❌ Erro ao gravar estados de conversa: {str(e)}")
+                await repo.rollback()
+                ok = False
+            finally:
+                try:
+                    await repo.close()
+                except Exception:
+                    pass
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+            if not ok:
+                # Entradas continuam sujas; o próximo ciclo tenta de novo na mesma ordem
+                self.flush_failures += 1
+                return 0
+
+            self.flushes += 1
+            self._total_flush_ms += elapsed_ms
+            for entry, version, _, _, _, _ in snapshot:
+                entry.persisted = True
+                # Turno novo durante o flush: a entrada segue suja para o próximo lote
+                if entry.version == version:
+                    self._mark_clean(entry)
+            self.rows_flushed += len(snapshot)
+            self._evict_overflow()
+            return len(snapshot)
+
+    # Job de flush
+
+    def start(self):
+        """Inicia o flush periódico (apenas no modo write-behind; precisa de event loop ativo)"""
+        if not self.write_behind or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._flush_loop(), name="conversation-state-flush")
+        logger.info(f"✅ Flush do estado das conversas iniciado (a cada {self.flush_interval}s)")
+
+    async def stop(self):
+        """Para o job e grava o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if any(e.dirty for e in self._entries.values()):
+            gravadas = await self.flush()
+            logger.info(f"💾 Flush final do estado das conversas: {gravadas} conversas")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self.evict_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no job de flush das conversas: {str(e)}")
+
+    # Despejo
+
+    def evict_idle(self) -> int:
+        """Remove entradas limpas sem acesso há mais de idle_ttl"""
+        limite = self._clock() - self.idle_ttl
+        ociosas = [phone for phone, e in self._entries.items() if not e.dirty and e.last_access < limite]
+        for phone in ociosas:
+            self._drop(phone)
+        self.idle_evictions += len(ociosas)
+        return len(ociosas)
+
+    def _put(self, entry: _StateEntry):
+        entry.last_access = self._clock()
+        self._entries[entry.phone] = entry
+        self._entries.move_to_end(entry.phone)
+        self._evict_overflow()
+
+    def _evict_overflow(self):
+        excesso = len(self._entries) - self.max_entries
+        if excesso <= 0:
+            return
+        # Menos usadas primeiro; entradas sujas ficam até serem gravadas
+        for phone in [p for p, e in self._entries.items() if not e.dirty][:excesso]:
+            self._drop(phone)
+            self.evictions += 1
+
+    def _drop(self, phone: str):
+        self._entries.pop(phone, None)
+
+    def _mark_clean(self, entry: _StateEntry):
+        entry.dirty = False
+        entry.dirty_fields = set()
+        entry.dirty_since = None
+
+    def _materialize(self, entry: _StateEntry) -> Conversation:
+        # Fora da sessão: alterações dos handlers só chegam ao banco via complete_turn/flush
+        return Conversation(id=entry.conversation_id, phone=entry.phone, state=entry.state,
+                            context=copy.deepcopy(entry.context))
+
+    def _open_repository(self):
+        if self._repository_factory is not None:
+            return self._repository_factory()
+        from app.models.database import get_db
+        from app.models.conversation_repository import open_conversation_repository
+        return open_conversation_repository(get_db())
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "dirty": sum(1 for e in self._entries.values() if e.dirty),
+            "write_mode": "write_behind" if self.write_behind else "per_turn",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "idle_evictions": self.idle_evictions,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "rows_flushed": self.rows_flushed,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_ms,
+            "flush_running": self._task is not None and not self._task.done()
+        }
+
+_conversation_state_store: Optional[ConversationStateStore] = None
+
+def get_conversation_state_store() -> ConversationStateStore:
+    """Retorna instância singleton do store de estado das conversas"""
+    global _conversation_state_store
+    if _conversation_state_store is None:
+        _conversation_state_store = ConversationStateStore(
+            max_entries=settings.conversation_store_max_entries,
+            idle_ttl=settings.conversation_store_idle_ttl,
+            flush_interval=settings.conversation_store_flush_interval
+        )
+    return _conversation_state_store
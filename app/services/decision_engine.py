@@ -1,5 +1,11 @@
+import ast
+import hashlib
+import itertools
+import json
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from enum import Enum
@@ -8,6 +14,9 @@ from app.models.patient_transaction import DecisionType, TransactionStage, Valid
 
 logger = logging.getLogger(__name__)
 
+# Tabela de decisão pré-compilada (gerada por scripts/build_decision_table.py)
+DECISION_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "decision_table.json")
+
 class ConfidenceLevel(Enum):
     """Nível de confiança da decisão"""
     VERY_LOW = 1
@@ -19,12 +28,46 @@ class ConfidenceLevel(Enum):
 @dataclass
 class DecisionFactor:
     """Fator que influencia uma decisão"""
+    __slots__ = ("name", "value", "weight", "confidence", "reason")
     name: str
     value: Any
     weight: float  # 0.0 a 1.0
     confidence: ConfidenceLevel
     reason: str
 
+class DecisionFactors:
+    """Fatores indexados por nome, na ordem de coleta (um fator por nome)"""
+    __slots__ = ("_by_name",)
+    
+    def __init__(self, factors: Iterable[DecisionFactor] = ()):
+        self._by_name: Dict[str, DecisionFactor] = {}
+        for factor in factors:
+            self.add(factor)
+    
+    def add(self, factor: DecisionFactor):
+        self._by_name[factor.name] = factor
+    
+    def get(self, name: str) -> Optional[DecisionFactor]:
+        return self._by_name.get(name)
+    
+    def value(self, name: str, default: Any = None) -> Any:
+        factor = self._by_name.get(name)
+        return factor.value if factor is not None else default
+    
+    def select(self, names: Iterable[str]) -> List[DecisionFactor]:
+        """Fatores presentes entre names, na ordem de coleta"""
+        wanted = set(names)
+        return [factor for name, factor in self._by_name.items() if name in wanted]
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+    
+    def __iter__(self) -> Iterator[DecisionFactor]:
+        return iter(self._by_name.values())
+    
+    def __len__(self) -> int:
+        return len(self._by_name)
+
 @dataclass
 class DecisionOption:
     """Opção de decisão avaliada"""
@@ -37,6 +80,136 @@ class DecisionOption:
     expected_outcome: str
     risk_level: str  # low, medium, high
 
+@dataclass(frozen=True)
+class _DecisionPlan:
+    """Decisão memorizada: opções avaliadas (tipo, score), a escolhida e o fallback"""
+    scores: Tuple[Tuple[DecisionType, float], ...]
+    chosen: int
+    fallback_action: Optional[str]
+
+# Uma entrada por tipo de decisão; factors_supporting vem dos fatores da chamada
+_OPTION_TEMPLATES: Dict[DecisionType, Dict[str, Any]] = {
+    DecisionType.CORRIGIR: {
+        "reasons": ("Erros detectados que precisam ser corrigidos",),
+        "supporting": ("has_errors",),
+        "suggested_action": "mostrar_erro_e_solicitar_correcao",
+        "expected_outcome": "Usuário corrige o erro e continua",
+        "risk_level": "low",
+    },
+    DecisionType.CONFIRMAR: {
+        "reasons": ("Dados do paciente encontrados e validados",),
+        "supporting": ("patient_data_completeness", "validation_result"),
+        "suggested_action": "solicitar_confirmacao_paciente",
+        "expected_outcome": "Usuário confirma e escolhe próxima ação",
+        "risk_level": "low",
+    },
+    DecisionType.AGENDAR: {
+        "reasons": ("Usuário quer agendar e temos dados do paciente",),
+        "supporting": ("intended_action", "patient_data_completeness"),
+        "suggested_action": "iniciar_processo_agendamento",
+        "expected_outcome": "Usuário escolhe data e horário",
+        "risk_level": "medium",
+    },
+    DecisionType.VISUALIZAR: {
+        "reasons": ("Usuário quer ver agendamentos e temos dados do paciente",),
+        "supporting": ("intended_action", "patient_data_completeness"),
+        "suggested_action": "mostrar_agendamentos_paciente",
+        "expected_outcome": "Usuário vê seus agendamentos",
+        "risk_level": "low",
+    },
+    DecisionType.AVANÇAR: {
+        "reasons": ("Continuar fluxo normal sem erros",),
+        "supporting": ("current_stage",),
+        "suggested_action": "continuar_fluxo_atual",
+        "expected_outcome": "Processo continua normalmente",
+        "risk_level": "low",
+    },
+    DecisionType.REPETIR: {
+        "reasons": ("Repetir última ação como fallback",),
+        "supporting": (),
+        "suggested_action": "repetir_ultima_acao",
+        "expected_outcome": "Usuário tem nova chance",
+        "risk_level": "medium",
+    },
+}
+
+_OPTION_CONFIDENCE = {
+    DecisionType.CORRIGIR: 0.9,
+    DecisionType.CONFIRMAR: 0.85,
+    DecisionType.AGENDAR: 0.8,
+    DecisionType.VISUALIZAR: 0.8,
+    DecisionType.AVANÇAR: 0.6,
+    DecisionType.REPETIR: 0.3,
+}
+
+# Paciente representativo de cada faixa de completude da assinatura
+_BUCKET_PATIENTS = {
+    0: None,
+    1: {"nome": "Paciente", "cpf": "00000000000"},
+    2: {"nome": "Paciente", "cpf": "00000000000", "telefone": "0", "email": "0", "endereco": "0", "data_nascimento": "0"},
+}
+
+# Definições que determinam o plano de cada assinatura (entram no fingerprint da tabela)
+_RULE_DEFINITIONS = {
+    "ConfidenceLevel", "_OPTION_TEMPLATES", "_OPTION_CONFIDENCE", "_BUCKET_PATIENTS",
+    "_collect_decision_factors", "_calculate_data_completeness", "_decision_signature", "_evaluate_options",
+    "_generate_decision_options", "_evaluate_option", "_apply_contextual_bonus", "_choose_best_option",
+    "_determine_fallback_action", "_to_plan",
+}
+
+def _definition_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name
+    target = node.target if isinstance(node, ast.AnnAssign) else node.targets[0] if isinstance(node, ast.Assign) else None
+    return target.id if isinstance(target, ast.Name) else None
+
+def _fingerprint_definitions(source: str) -> str:
+    """
+    Hash da AST das definições das regras
+
+    Comentários, docstrings, formatação e o resto do módulo não mudam o hash;
+    tests/test_decision_engine.py falha se a tabela em disco ficar desatualizada.
+    """
+    definitions = []
+    for node in ast.walk(ast.parse(source)):
+        if _definition_name(node) not in _RULE_DEFINITIONS:
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and ast.get_docstring(node) is not None:
+            node.body = node.body[1:]
+        definitions.append(ast.dump(node))
+    return hashlib.sha1("\n".join(sorted(definitions)).encode("utf-8")).hexdigest()[:12]
+
+@lru_cache(maxsize=1)
+def _rules_fingerprint() -> str:
+    """Hash das regras deste módulo: tabela gerada com outra versão é ignorada"""
+    with open(os.path.abspath(__file__).replace(".pyc", ".py"), encoding="utf-8") as source:
+        return _fingerprint_definitions(source.read())
+
+@lru_cache(maxsize=4)
+def _read_decision_table(path: str) -> Dict[Tuple, "_DecisionPlan"]:
+    """Planos da tabela em disco (vazio se ausente, inválida ou desatualizada)"""
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ Tabela de decisão não encontrada: {path}")
+        return {}
+    try:
+        with open(path, encoding="utf-8") as table_file:
+            table = json.load(table_file)
+        if table.get("fingerprint") != _rules_fingerprint():
+            logger.warning("⚠️ Tabela de decisão desatualizada; usando avaliação dinâmica (rode scripts/build_decision_table.py)")
+            return {}
+        plans = {}
+        for entry in table["entries"]:
+            stage, has_errors, bucket, passed, action = entry["signature"]
+            plans[(TransactionStage(stage), has_errors, bucket, passed, action)] = _DecisionPlan(
+                scores=tuple((DecisionType(decision), score) for decision, score in entry["scores"]),
+                chosen=entry["chosen"],
+                fallback_action=entry["fallback_action"],
+            )
+        return plans
+    except Exception as e:
+        logger.error(f"Erro ao carregar tabela de decisão: {str(e)}")
+        return {}
+
 @dataclass
 class DecisionResult:
     """Resultado final da análise de decisão"""
@@ -52,9 +225,18 @@ class DecisionResult:
 class IntelligentDecisionEngine:
     """Motor de decisão inteligente para transações de pacientes"""
     
-    def __init__(self):
+    def __init__(self, memoize: bool = True, decision_table: Optional[str] = DECISION_TABLE_PATH):
         self.decision_rules = self._load_decision_rules()
         self.historical_patterns = {}
+        # Assinatura -> plano; o espaço de assinaturas é finito (estágio x 2 x 3 x 2 x 3).
+        # A tabela pré-compilada preenche tudo na inicialização; o que faltar é avaliado e memorizado
+        self.memoize = memoize
+        self._plans: Dict[Tuple, _DecisionPlan] = {}
+        if memoize and decision_table:
+            self._plans.update(_read_decision_table(decision_table))
+        self.table_entries = len(self._plans)
+        self.decisions = 0
+        self.plan_hits = 0
         
     def analyze_and_decide(
         self, 
@@ -90,25 +272,31 @@ class IntelligentDecisionEngine:
             validation_result, errors, warnings
         )
         
-        # 2. Gerar opções de decisão
-        options = self._generate_decision_options(factors, current_stage, context)
-        
-        # 3. Avaliar cada opção
-        evaluated_options = [self._evaluate_option(option, factors) for option in options]
-        
-        # 4. Escolher melhor opção
-        best_option = self._choose_best_option(evaluated_options)
+        # 2-4. Gerar, avaliar e escolher (ou reaproveitar o plano da mesma assinatura)
+        self.decisions += 1
+        signature = self._decision_signature(factors, current_stage)
+        plan = self._plans.get(signature) if self.memoize else None
+        if plan is not None:
+            self.plan_hits += 1
+            evaluated_options = [self._build_option(decision_type, score, factors)
+                                 for decision_type, score in plan.scores]
+            best_option = evaluated_options[plan.chosen]
+            fallback_action = plan.fallback_action
+        else:
+            evaluated_options, best_option, fallback_action = self._evaluate_options(factors, current_stage, context)
+            if self.memoize and any(option is best_option for option in evaluated_options):
+                self._plans[signature] = self._to_plan(evaluated_options, best_option, fallback_action)
         
         # 5. Gerar resultado final
         decision_result = DecisionResult(
             chosen_decision=best_option.decision_type,
             confidence=best_option.confidence_score,
             reason=self._build_decision_reason(best_option, factors),
-            alternatives=[opt for opt in evaluated_options if opt != best_option],
-            factors_used=factors,
+            alternatives=[opt for opt in evaluated_options if opt is not best_option],
+            factors_used=list(factors),
             decision_path=self._build_decision_path(factors, best_option),
             suggested_action=best_option.suggested_action,
-            fallback_action=self._determine_fallback_action(best_option, evaluated_options)
+            fallback_action=fallback_action
         )
         
         logger.info(f"🎯 Decisão: {decision_result.chosen_decision.value} (confiança: {decision_result.confidence:.2f})")
@@ -125,12 +313,12 @@ class IntelligentDecisionEngine:
         validation_result: Optional[ValidationResult],
         errors: List[str],
         warnings: List[str]
-    ) -> List[DecisionFactor]:
+    ) -> DecisionFactors:
         """Coleta todos os fatores relevantes para a decisão"""
-        factors = []
+        factors = DecisionFactors()
         
         # Fator: Estágio atual
-        factors.append(DecisionFactor(
+        factors.add(DecisionFactor(
             name="current_stage",
             value=current_stage.value,
             weight=0.9,
@@ -140,7 +328,7 @@ class IntelligentDecisionEngine:
         
         # Fator: Presença de erros
         if errors:
-            factors.append(DecisionFactor(
+            factors.add(DecisionFactor(
                 name="has_errors",
                 value=True,
                 weight=0.95,
@@ -151,7 +339,7 @@ class IntelligentDecisionEngine:
         # Fator: Dados do paciente disponíveis
         if patient_data:
             completeness = self._calculate_data_completeness(patient_data)
-            factors.append(DecisionFactor(
+            factors.add(DecisionFactor(
                 name="patient_data_completeness",
                 value=completeness,
                 weight=0.8,
@@ -161,7 +349,7 @@ class IntelligentDecisionEngine:
         
         # Fator: Tipo de input do usuário
         input_type = self._classify_user_input(user_input)
-        factors.append(DecisionFactor(
+        factors.add(DecisionFactor(
             name="user_input_type",
             value=input_type,
             weight=0.7,
@@ -171,7 +359,7 @@ class IntelligentDecisionEngine:
         
         # Fator: Contexto anterior existe
         has_previous_context = bool(context.get('paciente') or context.get('last_transaction'))
-        factors.append(DecisionFactor(
+        factors.add(DecisionFactor(
             name="has_context",
             value=has_previous_context,
             weight=0.6,
@@ -182,7 +370,7 @@ class IntelligentDecisionEngine:
         # Fator: Ação pretendida
         intended_action = context.get('acao')
         if intended_action:
-            factors.append(DecisionFactor(
+            factors.add(DecisionFactor(
                 name="intended_action",
                 value=intended_action,
                 weight=0.8,
@@ -192,7 +380,7 @@ class IntelligentDecisionEngine:
         
         # Fator: Resultado da validação
         if validation_result:
-            factors.append(DecisionFactor(
+            factors.add(DecisionFactor(
                 name="validation_result",
                 value=validation_result.value,
                 weight=0.85,
@@ -202,7 +390,7 @@ class IntelligentDecisionEngine:
         
         # Fator: Avisos
         if warnings:
-            factors.append(DecisionFactor(
+            factors.add(DecisionFactor(
                 name="has_warnings",
                 value=len(warnings),
                 weight=0.5,
@@ -212,101 +400,128 @@ class IntelligentDecisionEngine:
         
         return factors
     
+    def _evaluate_options(
+        self,
+        factors: DecisionFactors,
+        current_stage: TransactionStage,
+        context: Dict[str, Any]
+    ) -> Tuple[List[DecisionOption], DecisionOption, Optional[str]]:
+        """Caminho interpretado: gera, avalia e escolhe"""
+        options = self._generate_decision_options(factors, current_stage, context)
+        evaluated_options = [self._evaluate_option(option, factors) for option in options]
+        best_option = self._choose_best_option(evaluated_options)
+        return evaluated_options, best_option, self._determine_fallback_action(best_option, evaluated_options)
+    
+    def _to_plan(self, evaluated_options: List[DecisionOption], best_option: DecisionOption,
+                 fallback_action: Optional[str]) -> _DecisionPlan:
+        return _DecisionPlan(
+            scores=tuple((option.decision_type, option.confidence_score) for option in evaluated_options),
+            chosen=next(i for i, option in enumerate(evaluated_options) if option is best_option),
+            fallback_action=fallback_action,
+        )
+    
+    def compile_decision_table(self) -> Dict[str, Any]:
+        """
+        Avalia todo o espaço de assinaturas pelo caminho interpretado
+        
+        Returns:
+            Tabela serializável em JSON (gravada por scripts/build_decision_table.py)
+        """
+        entries = []
+        for stage, has_errors, bucket, passed, action in itertools.product(
+                TransactionStage, (False, True), sorted(_BUCKET_PATIENTS), (False, True), (None, "agendar", "visualizar")):
+            context = {"acao": action} if action else {}
+            factors = self._collect_decision_factors(
+                stage, "", context, _BUCKET_PATIENTS[bucket],
+                ValidationResult.PASSOU if passed else None, ["erro"] if has_errors else [], []
+            )
+            signature = self._decision_signature(factors, stage)
+            if signature != (stage, has_errors, bucket, passed, action):
+                raise ValueError(f"Entrada representativa não gera a assinatura esperada: {signature}")
+            plan = self._to_plan(*self._evaluate_options(factors, stage, context))
+            entries.append({
+                "signature": [stage.value, has_errors, bucket, passed, action],
+                "scores": [[decision.value, score] for decision, score in plan.scores],
+                "chosen": plan.chosen,
+                "fallback_action": plan.fallback_action,
+            })
+        return {"fingerprint": _rules_fingerprint(), "entries": entries}
+    
+    def _decision_signature(self, factors: DecisionFactors, current_stage: TransactionStage) -> Tuple:
+        """
+        Assinatura compacta com tudo que as regras leem: estágio, erros, faixa de
+        completude (<=0.5, <=0.8, >0.8), validação, ação pretendida (agendar/visualizar)
+
+        user_input_type fica de fora de propósito: é coletado como fator, mas
+        nenhuma regra de geração/score o lê (só aparece em factors_used, que
+        vem sempre da chamada). Se uma regra passar a lê-lo, inclua-o aqui.
+        """
+        completeness = factors.value("patient_data_completeness", 0)
+        intended_action = factors.value("intended_action")
+        return (
+            current_stage,
+            bool(factors.value("has_errors")),
+            2 if completeness > 0.8 else 1 if completeness > 0.5 else 0,
+            factors.value("validation_result") == "passou",
+            intended_action if intended_action in ("agendar", "visualizar") else None,
+        )
+    
+    def _build_option(self, decision_type: DecisionType, confidence_score: float,
+                      factors: DecisionFactors) -> DecisionOption:
+        template = _OPTION_TEMPLATES[decision_type]
+        return DecisionOption(
+            decision_type=decision_type,
+            confidence_score=confidence_score,
+            reasons=list(template["reasons"]),
+            factors_supporting=factors.select(template["supporting"]),
+            factors_against=[],
+            suggested_action=template["suggested_action"],
+            expected_outcome=template["expected_outcome"],
+            risk_level=template["risk_level"]
+        )
+    
     def _generate_decision_options(
         self, 
-        factors: List[DecisionFactor], 
+        factors: DecisionFactors, 
         current_stage: TransactionStage,
         context: Dict[str, Any]
     ) -> List[DecisionOption]:
         """Gera opções de decisão possíveis baseadas nos fatores"""
-        options = []
+        decision_types = []
         
         # Analisar fatores críticos
-        has_errors = any(f.name == "has_errors" and f.value for f in factors)
-        has_patient_data = any(f.name == "patient_data_completeness" and f.value > 0.5 for f in factors)
-        validation_passed = any(f.name == "validation_result" and f.value == "passou" for f in factors)
-        intended_action = next((f.value for f in factors if f.name == "intended_action"), None)
+        has_errors = bool(factors.value("has_errors"))
+        has_patient_data = factors.value("patient_data_completeness", 0) > 0.5
+        validation_passed = factors.value("validation_result") == "passou"
+        intended_action = factors.value("intended_action")
         
         # Opção: Corrigir erros
         if has_errors:
-            options.append(DecisionOption(
-                decision_type=DecisionType.CORRIGIR,
-                confidence_score=0.9,
-                reasons=["Erros detectados que precisam ser corrigidos"],
-                factors_supporting=[f for f in factors if f.name == "has_errors"],
-                factors_against=[],
-                suggested_action="mostrar_erro_e_solicitar_correcao",
-                expected_outcome="Usuário corrige o erro e continua",
-                risk_level="low"
-            ))
+            decision_types.append(DecisionType.CORRIGIR)
         
         # Opção: Confirmar dados
         if has_patient_data and validation_passed and current_stage in [TransactionStage.BUSCA_EXECUTADA, TransactionStage.VERIFICADO]:
-            options.append(DecisionOption(
-                decision_type=DecisionType.CONFIRMAR,
-                confidence_score=0.85,
-                reasons=["Dados do paciente encontrados e validados"],
-                factors_supporting=[f for f in factors if f.name in ["patient_data_completeness", "validation_result"]],
-                factors_against=[],
-                suggested_action="solicitar_confirmacao_paciente",
-                expected_outcome="Usuário confirma e escolhe próxima ação",
-                risk_level="low"
-            ))
+            decision_types.append(DecisionType.CONFIRMAR)
         
         # Opção: Agendar
         if intended_action == "agendar" and has_patient_data:
-            options.append(DecisionOption(
-                decision_type=DecisionType.AGENDAR,
-                confidence_score=0.8,
-                reasons=["Usuário quer agendar e temos dados do paciente"],
-                factors_supporting=[f for f in factors if f.name in ["intended_action", "patient_data_completeness"]],
-                factors_against=[],
-                suggested_action="iniciar_processo_agendamento",
-                expected_outcome="Usuário escolhe data e horário",
-                risk_level="medium"
-            ))
+            decision_types.append(DecisionType.AGENDAR)
         
         # Opção: Visualizar
         if intended_action == "visualizar" and has_patient_data:
-            options.append(DecisionOption(
-                decision_type=DecisionType.VISUALIZAR,
-                confidence_score=0.8,
-                reasons=["Usuário quer ver agendamentos e temos dados do paciente"],
-                factors_supporting=[f for f in factors if f.name in ["intended_action", "patient_data_completeness"]],
-                factors_against=[],
-                suggested_action="mostrar_agendamentos_paciente",
-                expected_outcome="Usuário vê seus agendamentos",
-                risk_level="low"
-            ))
+            decision_types.append(DecisionType.VISUALIZAR)
         
         # Opção: Avançar no fluxo
         if not has_errors and current_stage != TransactionStage.ERRO:
-            options.append(DecisionOption(
-                decision_type=DecisionType.AVANÇAR,
-                confidence_score=0.6,
-                reasons=["Continuar fluxo normal sem erros"],
-                factors_supporting=[f for f in factors if f.name == "current_stage"],
-                factors_against=[],
-                suggested_action="continuar_fluxo_atual",
-                expected_outcome="Processo continua normalmente",
-                risk_level="low"
-            ))
+            decision_types.append(DecisionType.AVANÇAR)
         
         # Opção: Repetir (fallback)
-        options.append(DecisionOption(
-            decision_type=DecisionType.REPETIR,
-            confidence_score=0.3,
-            reasons=["Repetir última ação como fallback"],
-            factors_supporting=[],
-            factors_against=[],
-            suggested_action="repetir_ultima_acao",
-            expected_outcome="Usuário tem nova chance",
-            risk_level="medium"
-        ))
+        decision_types.append(DecisionType.REPETIR)
         
-        return options
+        return [self._build_option(decision_type, _OPTION_CONFIDENCE[decision_type], factors)
+                for decision_type in decision_types]
     
-    def _evaluate_option(self, option: DecisionOption, factors: List[DecisionFactor]) -> DecisionOption:
+    def _evaluate_option(self, option: DecisionOption, factors: DecisionFactors) -> DecisionOption:
         """Avalia uma opção de decisão baseada nos fatores"""
         # Calcular score baseado nos fatores que suportam
         support_score = 0.0
@@ -335,7 +550,7 @@ class IntelligentDecisionEngine:
     def _apply_contextual_bonus(
         self, 
         option: DecisionOption, 
-        factors: List[DecisionFactor], 
+        factors: DecisionFactors, 
         base_score: float
     ) -> float:
         """Aplica bônus contextual baseado em regras específicas"""
@@ -343,18 +558,16 @@ class IntelligentDecisionEngine:
         
         # Bônus para corrigir quando há erros
         if option.decision_type == DecisionType.CORRIGIR:
-            has_errors = any(f.name == "has_errors" and f.value for f in factors)
-            if has_errors:
+            if factors.value("has_errors"):
                 bonus += 0.2
         
         # Bônus para confirmar quando dados estão completos
         if option.decision_type == DecisionType.CONFIRMAR:
-            completeness = next((f.value for f in factors if f.name == "patient_data_completeness"), 0)
-            if completeness > 0.8:
+            if factors.value("patient_data_completeness", 0) > 0.8:
                 bonus += 0.15
         
         # Bônus para ação pretendida
-        intended_action = next((f.value for f in factors if f.name == "intended_action"), None)
+        intended_action = factors.value("intended_action")
         if intended_action:
             if (intended_action == "agendar" and option.decision_type == DecisionType.AGENDAR):
                 bonus += 0.1
@@ -390,7 +603,7 @@ class IntelligentDecisionEngine:
         
         return best_option
     
-    def _build_decision_reason(self, option: DecisionOption, factors: List[DecisionFactor]) -> str:
+    def _build_decision_reason(self, option: DecisionOption, factors: DecisionFactors) -> str:
         """Constrói explicação da decisão"""
         main_reasons = option.reasons[:2]  # Principais razões
         
@@ -399,22 +612,22 @@ class IntelligentDecisionEngine:
         reason_parts = main_reasons + supporting_factors
         return ". ".join(reason_parts)
     
-    def _build_decision_path(self, factors: List[DecisionFactor], option: DecisionOption) -> List[str]:
+    def _build_decision_path(self, factors: DecisionFactors, option: DecisionOption) -> List[str]:
         """Constrói caminho da lógica de decisão"""
         path = []
         
         # Estágio atual
-        current_stage = next((f.value for f in factors if f.name == "current_stage"), "unknown")
+        current_stage = factors.value("current_stage", "unknown")
         path.append(f"Estágio atual: {current_stage}")
         
         # Fatores críticos
-        if any(f.name == "has_errors" and f.value for f in factors):
+        if factors.value("has_errors"):
             path.append("Erros detectados → priorizar correção")
         
-        if any(f.name == "patient_data_completeness" and f.value > 0.5 for f in factors):
+        if factors.value("patient_data_completeness", 0) > 0.5:
             path.append("Dados do paciente disponíveis → permitir ações avançadas")
         
-        intended_action = next((f.value for f in factors if f.name == "intended_action"), None)
+        intended_action = factors.value("intended_action")
         if intended_action:
             path.append(f"Ação pretendida: {intended_action} → alinhar decisão")
         
@@ -488,6 +701,16 @@ class IntelligentDecisionEngine:
             "max_retries": 3,  # Máximo de repetições antes de escalar
         }
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Decisões tomadas e aproveitamento do plano memorizado"""
+        return {
+            "decisions": self.decisions,
+            "plan_hits": self.plan_hits,
+            "hit_rate": round(self.plan_hits / self.decisions, 4) if self.decisions else 0.0,
+            "plans": len(self._plans),
+            "table_entries": self.table_entries,
+        }
+    
     def explain_decision(self, decision_result: DecisionResult) -> Dict[str, Any]:
         """Gera explicação detalhada da decisão para auditoria"""
         return {
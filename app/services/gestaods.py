@@ -5,9 +5,34 @@ from app.config import settings
 import logging
 import asyncio
 import json
+import re
+from app.utils.http_clients import get_http_client_pool
+from app.utils.single_flight import SingleFlight
+from app.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Compartilhado entre instâncias: webhook e dashboard coalescem as mesmas chamadas
+_gestaods_flights = SingleFlight(name="gestaods")
+_CPF_IN_PATH = re.compile(r"/\d{11}(?=/|$)")
+
+# Cache de pacientes único no processo (todas as instâncias de GestaoDS)
+_paciente_cache = TTLCache(
+    name="gestaods_paciente",
+    max_entries=settings.gestaods_cache_max_entries,
+    default_ttl=settings.gestaods_cache_ttl,
+    negative_ttl=settings.gestaods_negative_cache_ttl,
+    max_bytes=settings.gestaods_cache_max_bytes
+)
+
+def get_request_stats() -> Dict[str, Any]:
+    """Chamadas upstream e taxa de coalescência por endpoint da GestãoDS"""
+    return _gestaods_flights.get_stats()
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Acertos, falhas e despejos do cache de pacientes"""
+    return _paciente_cache.get_stats()
+
 class GestaoDS:
     """Classe para integração com a API GestãoDS - Versão Alinhada com Documentação"""
     
@@ -15,8 +40,8 @@ class GestaoDS:
         self.base_url = settings.gestaods_api_url.rstrip('/')
         self.token = settings.gestaods_token
         self.timeout = 30
-        self._cache = {}
-        self._cache_ttl = 300  # 5 minutos
+        self._cache = _paciente_cache
+        self._cache_ttl = _paciente_cache.default_ttl
         
         # Detectar ambiente (dev vs prod)
         self.is_dev = "apidev" in self.base_url or settings.environment == "development"
@@ -25,39 +50,61 @@ class GestaoDS:
         logger.info(f"GestãoDS inicializado - URL: {self.base_url}")
         logger.info(f"Ambiente: {'desenvolvimento' if self.is_dev else 'produção'}")
     
-    async def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
-        """Faz requisição HTTP com tratamento de erros melhorado"""
+    async def _request(self, method: str, endpoint: str, not_found: Any = None, **kwargs) -> Optional[Dict]:
+        """
+        Faz requisição HTTP; GETs idênticos concorrentes compartilham a mesma chamada
+        
+        not_found: valor retornado em 404 (padrão None, igual a falha)
+        """
         url = f"{self.base_url}{endpoint}"
         
         # Substituir token na URL se necessário
         url = url.replace("{token}", self.token)
         
+        key = None
+        if method == "GET" and set(kwargs) <= {"params"}:
+            params = kwargs.get("params") or {}
+            key = (url, tuple(sorted(params.items())))
+        
+        return await _gestaods_flights.do(
+            key,
+            lambda: self._send(method, url, not_found, **kwargs),
+            label=f"{method} {self._endpoint_label(endpoint)}"
+        )
+    
+    def _endpoint_label(self, endpoint: str) -> str:
+        """Endpoint para métricas, sem token nem CPF"""
+        label = endpoint.replace(self.token, "{token}") if self.token else endpoint
+        return _CPF_IN_PATH.sub("/{cpf}", label)
+    
+    async def _send(self, method: str, url: str, not_found: Any = None, **kwargs) -> Optional[Dict]:
+        """Executa a requisição no cliente HTTP compartilhado (pool keep-alive)"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"{method} {url}")
-                
-                response = await client.request(method, url, **kwargs)
-                
-                logger.info(f"Response: {response.status_code}")
+            client = get_http_client_pool().get_client("gestaods")
+            logger.info(f"{method} {url}")
+            
+            response = await client.request(method, url, timeout=self.timeout, **kwargs)
+            
+            logger.info(f"Response: {response.status_code}")
+            
+            if response.status_code in [200, 201]:
+                return response.json()
+            elif response.status_code == 404:
+                logger.warning(f"Recurso não encontrado: {url}")
+                return not_found
+            elif response.status_code == 422:
+                # Erro de validação - extrair detalhes
+                try:
+                    error_detail = response.json()
+                    logger.error(f"Erro de validação (422): {error_detail}")
+                    return {"validation_error": True, "detail": error_detail}
+                except:
+                    logger.error(f"Erro de validação (422): {response.text}")
+                    return {"validation_error": True, "detail": response.text}
+            else:
+                logger.error(f"Erro na API: {response.status_code} - {response.text}")
+                return None
                 
-                if response.status_code in [200, 201]:
-                    return response.json()
-                elif response.status_code == 404:
-                    logger.warning(f"Recurso não encontrado: {url}")
-                    return None
-                elif response.status_code == 422:
-                    # Erro de validação - extrair detalhes
-                    try:
-                        error_detail = response.json()
-                        logger.error(f"Erro de validação (422): {error_detail}")
-                        return {"validation_error": True, "detail": error_detail}
-                    except:
-                        logger.error(f"Erro de validação (422): {response.text}")
-                        return {"validation_error": True, "detail": response.text}
-                else:
-                    logger.error(f"Erro na API: {response.status_code} - {response.text}")
-                    return None
-                    
         except httpx.TimeoutException:
             logger.error(f"Timeout na requisição: {url}")
             return None
@@ -78,17 +125,21 @@ class GestaoDS:
             logger.error(f"CPF inválido: {cpf}")
             return None
         
-        # Verificar cache
+        # Verificar cache (compartilhado entre instâncias, inclui CPFs não encontrados)
         cache_key = f"paciente_{cpf_limpo}"
-        if cache_key in self._cache:
-            cached_data, timestamp = self._cache[cache_key]
-            if datetime.now().timestamp() - timestamp < self._cache_ttl:
-                logger.info("Retornando paciente do cache")
-                return cached_data
+        found, cached_data = self._cache.lookup(cache_key)
+        if found:
+            logger.info("Retornando paciente do cache" if cached_data else "CPF não encontrado (cache negativo)")
+            return cached_data
         
         # Buscar na API - usar endpoint correto baseado no ambiente
         endpoint = f"/api/{self.env_prefix}paciente/{self.token}/{cpf_limpo}/"
-        result = await self._request("GET", endpoint)
+        result = await self._request("GET", endpoint, not_found=[])
+        
+        # 404 ou lista vazia: paciente não cadastrado
+        if result == []:
+            self._cache.set_negative(cache_key)
+            return None
         
         if result:
             # Verificar se é erro de validação
@@ -100,11 +151,11 @@ class GestaoDS:
             if isinstance(result, list) and len(result) > 0:
                 paciente = result[0]
                 # Adicionar ao cache
-                self._cache[cache_key] = (paciente, datetime.now().timestamp())
+                self._cache.set(cache_key, paciente)
                 return paciente
             elif isinstance(result, dict):
                 # Se retornar dict direto
-                self._cache[cache_key] = (result, datetime.now().timestamp())
+                self._cache.set(cache_key, result)
                 return result
         
         return None
@@ -115,6 +166,15 @@ class GestaoDS:
         GET /api/agendamento/dias-disponiveis/{token} (prod)
         GET /api/dev-agendamento/dias-disponiveis/{token} (dev)
         """
+        dias = await self._fetch_dias_disponiveis(data)
+        if dias:
+            return dias
+        
+        # Fallback: gerar dias mock se API falhar
+        return self._gerar_dias_disponiveis_mock()
+    
+    async def _fetch_dias_disponiveis(self, data: Optional[str] = None) -> Optional[List[Dict]]:
+        """Dias disponíveis direto da API; None se a API falhar (sem fallback mock)"""
         endpoint = f"/api/{self.env_prefix}agendamento/dias-disponiveis/{self.token}"
         params = {}
         if data:
@@ -122,20 +182,20 @@ class GestaoDS:
         
         result = await self._request("GET", endpoint, params=params)
         
+        # Lista vazia é resposta válida (sem disponibilidade), diferente de falha
+        if isinstance(result, list):
+            return result
+        
         if result:
             # Verificar se é erro de validação
             if isinstance(result, dict) and result.get("validation_error"):
                 logger.error(f"Erro de validação ao buscar dias: {result.get('detail')}")
-                return self._gerar_dias_disponiveis_mock()
+                return None
             
-            # Garantir que retorna lista
-            if isinstance(result, list):
-                return result
-            elif isinstance(result, dict) and 'dias' in result:
+            if isinstance(result, dict) and 'dias' in result:
                 return result['dias']
         
-        # Fallback: gerar dias mock se API falhar
-        return self._gerar_dias_disponiveis_mock()
+        return None
     
     async def buscar_horarios_disponiveis(self, data: str) -> List[Dict]:
         """
@@ -143,25 +203,34 @@ class GestaoDS:
         GET /api/agendamento/horarios-disponiveis/{token} (prod)
         GET /api/dev-agendamento/horarios-disponiveis/{token} (dev)
         """
+        horarios = await self._fetch_horarios_disponiveis(data)
+        if horarios:
+            return horarios
+        
+        # Fallback: gerar horários mock se API falhar
+        return self._gerar_horarios_disponiveis_mock()
+    
+    async def _fetch_horarios_disponiveis(self, data: str) -> Optional[List[Dict]]:
+        """Horários disponíveis direto da API; None se a API falhar (sem fallback mock)"""
         endpoint = f"/api/{self.env_prefix}agendamento/horarios-disponiveis/{self.token}"
         params = {"data": data}
         
         result = await self._request("GET", endpoint, params=params)
         
+        # Lista vazia é resposta válida (sem disponibilidade), diferente de falha
+        if isinstance(result, list):
+            return result
+        
         if result:
             # Verificar se é erro de validação
             if isinstance(result, dict) and result.get("validation_error"):
                 logger.error(f"Erro de validação ao buscar horários: {result.get('detail')}")
-                return self._gerar_horarios_disponiveis_mock()
+                return None
             
-            # Garantir que retorna lista
-            if isinstance(result, list):
-                return result
-            elif isinstance(result, dict) and 'horarios' in result:
+            if isinstance(result, dict) and 'horarios' in result:
                 return result['horarios']
         
-        # Fallback: gerar horários mock se API falhar
-        return self._gerar_horarios_disponiveis_mock()
+        return None
     
     async def retornar_agendamento(self, agendamento_id: str) -> Optional[Dict]:
         """
@@ -230,6 +299,8 @@ class GestaoDS:
                 return None
             
             logger.info("✅ Agendamento criado com sucesso")
+            self._invalidar_disponibilidade(data_agendamento)
+            self._indexar_agendamento(cpf_limpo, data_agendamento, result)
             return result
         
         return None
@@ -270,6 +341,10 @@ class GestaoDS:
             logger.error(f"Erro de validação ao reagendar: {result.get('detail')}")
             return None
         
+        if result:
+            self._invalidar_disponibilidade(data_agendamento)
+            self._indexar_reagendamento(agendamento_id, data_agendamento)
+        
         return result
     
     async def retornar_fuso_horario(self) -> Optional[Dict]:
@@ -317,6 +392,12 @@ class GestaoDS:
         
         Parâmetros data_inicial e data_final obrigatórios
         """
+        agendamentos = await self._fetch_agendamentos_periodo(data_inicial, data_final)
+        return agendamentos if agendamentos is not None else []
+    
+    async def _fetch_agendamentos_periodo(self, data_inicial: str,
+                                          data_final: str) -> Optional[List[Dict]]:
+        """Listagem direto da API; None se a API falhar (período vazio retorna [])"""
         endpoint = f"/api/{self.env_prefix}dados-agendamento/listagem/{self.token}"
         params = {
             "data_inicial": data_inicial,
@@ -325,21 +406,48 @@ class GestaoDS:
         
         result = await self._request("GET", endpoint, params=params)
         
+        if isinstance(result, list):
+            return result
+        
         if result:
             # Verificar se é erro de validação
             if isinstance(result, dict) and result.get("validation_error"):
                 logger.error(f"Erro de validação ao listar agendamentos: {result.get('detail')}")
-                return []
+                return None
             
-            if isinstance(result, list):
-                return result
-            elif isinstance(result, dict) and 'agendamentos' in result:
+            if isinstance(result, dict) and 'agendamentos' in result:
                 return result['agendamentos']
         
-        return []
+        return None
     
     # Métodos auxiliares e de fallback
     
+    def _indexar_agendamento(self, cpf: str, data_agendamento: str, result: Any):
+        """Write-through do agendamento criado no índice local por CPF"""
+        try:
+            from app.services.appointment_index import get_appointment_index
+            dados = result if isinstance(result, dict) else {}
+            get_appointment_index().record_created(cpf, self.converter_api_para_datetime(data_agendamento), dados)
+        except Exception as e:
+            logger.error(f"❌ Erro ao indexar agendamento: {str(e)}")
+    
+    def _indexar_reagendamento(self, agendamento_id: str, data_agendamento: str):
+        """Write-through do reagendamento no índice local por CPF"""
+        try:
+            from app.services.appointment_index import get_appointment_index
+            get_appointment_index().record_rescheduled(agendamento_id, self.converter_api_para_datetime(data_agendamento))
+        except Exception as e:
+            logger.error(f"❌ Erro ao indexar reagendamento: {str(e)}")
+    
+    def _invalidar_disponibilidade(self, data_agendamento: str):
+        """Invalida no cache de disponibilidade a data (dd/mm/yyyy hh:mm:ss) que mudou"""
+        try:
+            from app.services.availability_cache import get_availability_cache
+            data = datetime.strptime(data_agendamento, "%d/%m/%Y %H:%M:%S").strftime("%Y-%m-%d")
+            get_availability_cache().invalidate_date(data)
+        except Exception as e:
+            logger.error(f"❌ Erro ao invalidar disponibilidade: {str(e)}")
+    
     def _validar_formato_data_api(self, data_str: str) -> bool:
         """
         Valida se a data está no formato esperado pela API: dd/mm/yyyy hh:mm:ss
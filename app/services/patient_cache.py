@@ -0,0 +1,205 @@
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.models.patient_transaction import PatientCache
+
+logger = logging.getLogger(__name__)
+
+def patient_data_hash(patient_data: Dict[str, Any]) -> str:
+    """Hash do payload do paciente (o mesmo de PatientCache.data_hash das linhas existentes)"""
+    return hashlib.md5(json.dumps(patient_data, sort_keys=True).encode()).hexdigest()
+
+class CachedPatient:
+    """Instantâneo de uma linha de patient_cache; ler não altera a linha"""
+    __slots__ = ("patient_data", "data_hash", "expires_at", "is_valid", "checked_at")
+
+    def __init__(self, patient_data: Dict[str, Any], data_hash: str, expires_at: Optional[datetime],
+                 is_valid: bool, checked_at: float):
+        self.patient_data = patient_data
+        self.data_hash = data_hash
+        self.expires_at = expires_at
+        self.is_valid = is_valid
+        self.checked_at = checked_at
+
+    @property
+    def is_stale(self) -> bool:
+        return bool(self.expires_at and datetime.utcnow() > self.expires_at)
+
+    def copy(self) -> "CachedPatient":
+        # O turno grava patient_data no contexto; o L1 guarda a própria cópia
+        return CachedPatient(copy.deepcopy(self.patient_data), self.data_hash, self.expires_at,
+                             self.is_valid, self.checked_at)
+
+class TieredPatientCache:
+    """
+    Cache de pacientes em dois níveis: L1 em memória (LRU) sobre a tabela patient_cache (L2)
+
+    - L1 serve por até l1_ttl segundos e nunca depois do expires_at da linha.
+    - Passado l1_ttl, revalida com uma consulta leve (data_hash, expires_at):
+      hash igual mantém o payload da memória; diferente (outro worker
+      atualizou o paciente) relê a linha. Por isso um worker enxerga a
+      atualização de outro em no máximo l1_ttl segundos.
+    - Linha expirada volta com is_stale, sem UPDATE na leitura.
+    - refresh() com o mesmo data_hash não regrava patient_data: só estende
+      expires_at quando passou da metade do TTL, senão não grava nada.
+    """
+
+    def __init__(self, l1_ttl: float = 30, max_entries: int = 5000, default_ttl: int = 300,
+                 clock: Callable[[], float] = time.monotonic):
+        self.l1_ttl = l1_ttl
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._clock = clock
+        self._l1: "OrderedDict[Tuple[str, str], CachedPatient]" = OrderedDict()
+
+        # Métricas
+        self.l1_hits = 0
+        self.l1_misses = 0
+        self.l2_hits = 0
+        self.l2_revalidated = 0
+        self.l2_stale = 0
+        self.l2_misses = 0
+        self.evictions = 0
+        self.inserts = 0
+        self.updates = 0
+        self.extends = 0
+        self.unchanged_skips = 0
+
+    async def get(self, cpf: str, phone: str, db) -> Optional[CachedPatient]:
+        """Paciente do cache (L1, senão L2); None se não há linha"""
+        key = (cpf, phone)
+        entry = self._l1.get(key)
+        if entry is not None and not entry.is_stale:
+            if self._clock() - entry.checked_at < self.l1_ttl:
+                self._l1.move_to_end(key)
+                self.l1_hits += 1
+                return entry.copy()
+
+            row = db.query(PatientCache.data_hash, PatientCache.expires_at, PatientCache.is_valid).filter_by(
+                cpf=cpf, phone=phone
+            ).first()
+            if row is not None and row.data_hash == entry.data_hash:
+                entry.expires_at, entry.is_valid = row.expires_at, row.is_valid
+                entry.checked_at = self._clock()
+                self._l1.move_to_end(key)
+                self.l2_revalidated += 1
+                return entry.copy()
+
+        self.l1_misses += 1
+        self._l1.pop(key, None)
+        row = db.query(PatientCache).filter_by(cpf=cpf, phone=phone).first()
+        if row is None:
+            self.l2_misses += 1
+            return None
+
+        entry = CachedPatient(row.patient_data, row.data_hash, row.expires_at, row.is_valid, self._clock())
+        if entry.is_stale:
+            self.l2_stale += 1
+            return entry
+
+        self.l2_hits += 1
+        self._put(key, entry.copy())
+        return entry
+
+    async def refresh(self, cpf: str, phone: str, patient_data: Dict[str, Any], db):
+        """Grava o paciente vindo da API (nada se o data_hash não mudou e a linha ainda está fresca)"""
+        key = (cpf, phone)
+        data_hash = patient_data_hash(patient_data)
+        now = datetime.utcnow()
+        row = db.query(PatientCache.id, PatientCache.data_hash, PatientCache.expires_at,
+                       PatientCache.ttl_seconds).filter_by(cpf=cpf, phone=phone).first()
+        ttl = (row.ttl_seconds if row is not None else None) or self.default_ttl
+        expires_at = now + timedelta(seconds=ttl)
+        wrote = True
+
+        if row is None:
+            db.add(PatientCache(cpf=cpf, phone=phone, patient_data=patient_data, data_hash=data_hash,
+                                ttl_seconds=ttl, expires_at=expires_at))
+            self.inserts += 1
+        elif row.data_hash != data_hash:
+            db.query(PatientCache).filter_by(id=row.id).update({
+                PatientCache.patient_data: patient_data,
+                PatientCache.data_hash: data_hash,
+                PatientCache.fetch_timestamp: now,
+                PatientCache.last_validated: now,
+                PatientCache.validation_count: PatientCache.validation_count + 1,
+                PatientCache.is_stale: False,
+                PatientCache.expires_at: expires_at
+            }, synchronize_session=False)
+            self.updates += 1
+        elif row.expires_at and row.expires_at - now > timedelta(seconds=ttl / 2):
+            self.unchanged_skips += 1
+            expires_at = row.expires_at
+            wrote = False
+        else:
+            # Mesmo payload: só estende a validade (os outros workers leem expires_at)
+            db.query(PatientCache).filter_by(id=row.id).update({
+                PatientCache.last_validated: now,
+                PatientCache.validation_count: PatientCache.validation_count + 1,
+                PatientCache.is_stale: False,
+                PatientCache.expires_at: expires_at
+            }, synchronize_session=False)
+            self.extends += 1
+
+        if wrote:
+            db.commit()
+        self._put(key, CachedPatient(copy.deepcopy(patient_data), data_hash, expires_at, True, self._clock()))
+
+    def invalidate(self, cpf: str, phone: str):
+        """Remove o paciente do L1 deste processo"""
+        self._l1.pop((cpf, phone), None)
+
+    def _put(self, key: Tuple[str, str], entry: CachedPatient):
+        self._l1[key] = entry
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.max_entries:
+            self._l1.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate de cada nível e gravações evitadas"""
+        l1_lookups = self.l1_hits + self.l1_misses + self.l2_revalidated
+        l2_lookups = self.l2_hits + self.l2_revalidated + self.l2_stale + self.l2_misses
+        return {
+            "l1": {
+                "entries": len(self._l1),
+                "max_entries": self.max_entries,
+                "hits": self.l1_hits,
+                "lookups": l1_lookups,
+                "hit_rate": round(self.l1_hits / l1_lookups, 4) if l1_lookups else 0.0,
+                "evictions": self.evictions
+            },
+            "l2": {
+                "hits": self.l2_hits,
+                "revalidated": self.l2_revalidated,
+                "stale": self.l2_stale,
+                "misses": self.l2_misses,
+                "lookups": l2_lookups,
+                "hit_rate": round((self.l2_hits + self.l2_revalidated) / l2_lookups, 4) if l2_lookups else 0.0
+            },
+            "writes": {
+                "inserts": self.inserts,
+                "updates": self.updates,
+                "extends": self.extends,
+                "unchanged_skips": self.unchanged_skips
+            }
+        }
+
+_tiered_patient_cache: Optional[TieredPatientCache] = None
+
+def get_tiered_patient_cache() -> TieredPatientCache:
+    """Retorna instância singleton do cache de pacientes em dois níveis"""
+    global _tiered_patient_cache
+    if _tiered_patient_cache is None:
+        _tiered_patient_cache = TieredPatientCache(
+            l1_ttl=settings.patient_cache_l1_ttl,
+            max_entries=settings.patient_cache_l1_max_entries
+        )
+    return _tiered_patient_cache
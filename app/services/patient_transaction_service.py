@@ -1,17 +1,19 @@
 import logging
-import json
-import hashlib
+import uuid
 from typing import Dict, Optional, List, Tuple, Any
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy.orm import Session
 from dataclasses import dataclass
 
 from app.models.patient_transaction import (
-    PatientTransaction, PatientCache, ContextHistory, DecisionLog, ValidationRule,
+    PatientTransaction, ContextHistory, DecisionLog, ValidationRule, AuditBlob,
     TransactionStage, ValidationResult, DecisionType
 )
 from app.models.database import Conversation
+from app.services.audit_blobs import get_audit_blob_store
+from app.services.audit_writer import audit_async_enabled, get_audit_writer
 from app.services.gestaods import GestaoDS
+from app.services.patient_cache import CachedPatient, get_tiered_patient_cache
 from app.utils.validators import ValidatorUtils
 import time
 
@@ -356,11 +358,17 @@ class PatientTransactionService:
         conversation.state = new_state
     
     async def _persist_transaction(self, context: TransactionContext, db: Session, start_time: float):
-        """Persiste transação completa no banco"""
+        """Persiste transação completa (em lote fora do turno com AUDIT_ASYNC_ENABLED)"""
         processing_time = int((time.time() - start_time) * 1000)
         
+        # Contexto e resposta da API vão para audit_blobs; a transação guarda o hash
+        store = get_audit_blob_store()
+        blobs = {}
+        context_hash = store.ref(context.loaded_context, blobs)
+        
         # Criar registro da transação
-        transaction = PatientTransaction(
+        transaction = dict(
+            id=str(uuid.uuid4()),
             phone=context.phone,
             conversation_id=context.conversation_id,
             user_input=context.user_input,
@@ -370,8 +378,8 @@ class PatientTransactionService:
             validation_result=context.validation_results or ValidationResult.IGNORADO,
             validation_details=context.loaded_context.get('validation_details'),
             validation_reasons=context.errors + context.warnings,
-            context_loaded=context.loaded_context,
-            context_updated=context.loaded_context,
+            context_loaded_hash=context_hash,
+            context_updated_hash=context_hash,
             decision_type=context.decision_made or DecisionType.AVANÇAR,
             decision_reason=context.loaded_context.get('decision_reason'),
             suggested_action=context.loaded_context.get('suggested_action'),
@@ -381,64 +389,47 @@ class PatientTransactionService:
             processing_time_ms=processing_time,
             is_retry=False,
             retry_count=0,
-            needs_human_review=bool(context.errors)
+            needs_human_review=bool(context.errors),
+            created_at=datetime.utcnow()
         )
         
         # Adicionar dados da API se houve chamada
         if context.api_response:
-            transaction.api_endpoint = context.api_response.get('endpoint')
-            transaction.api_parameters = {"cpf": self._extract_cpf_from_input(context.user_input)}
-            transaction.api_response = context.api_response
-            transaction.api_timestamp = datetime.utcnow()
-            transaction.api_success = bool(context.patient_data)
+            # Horário e latência mudam a cada chamada: viram colunas para o hash deduplicar o payload
+            api_response = dict(context.api_response)
+            api_timestamp = api_response.pop('timestamp', None)
+            api_response_time_ms = api_response.pop('response_time_ms', None)
+            transaction.update(
+                api_endpoint=api_response.get('endpoint'),
+                api_parameters={"cpf": self._extract_cpf_from_input(context.user_input)},
+                api_response_hash=store.ref(api_response, blobs),
+                api_timestamp=datetime.fromisoformat(api_timestamp) if api_timestamp else datetime.utcnow(),
+                api_response_time_ms=api_response_time_ms,
+                api_success=bool(context.patient_data)
+            )
+        
+        if audit_async_enabled():
+            writer = get_audit_writer()
+            for blob in blobs.values():
+                await writer.submit(AuditBlob, blob, copy_values=False)
+            await writer.submit(PatientTransaction, transaction)
+            logger.info(f"💾 Transação enfileirada para auditoria: {transaction['id']}")
+            return
         
-        db.add(transaction)
+        saved = store.save(db, blobs.values())
+        db.add(PatientTransaction(**transaction))
         db.commit()
+        store.remember(saved)
         
-        logger.info(f"💾 Transação persistida: {transaction.id}")
+        logger.info(f"💾 Transação persistida: {transaction['id']}")
     
-    async def _get_cached_patient(self, cpf: str, phone: str, db: Session) -> Optional[PatientCache]:
-        """Busca paciente no cache"""
-        cache_entry = db.query(PatientCache).filter_by(
-            cpf=cpf, 
-            phone=phone
-        ).first()
-        
-        if cache_entry:
-            # Verificar se expirou
-            if cache_entry.expires_at and datetime.utcnow() > cache_entry.expires_at:
-                cache_entry.is_stale = True
-                db.commit()
-        
-        return cache_entry
+    async def _get_cached_patient(self, cpf: str, phone: str, db: Session) -> Optional[CachedPatient]:
+        """Busca paciente no cache (memória, depois tabela patient_cache); expirado vem com is_stale"""
+        return await get_tiered_patient_cache().get(cpf, phone, db)
     
     async def _update_patient_cache(self, cpf: str, phone: str, patient_data: Dict, db: Session):
-        """Atualiza cache de paciente"""
-        data_hash = hashlib.md5(json.dumps(patient_data, sort_keys=True).encode()).hexdigest()
-        
-        cache_entry = await self._get_cached_patient(cpf, phone, db)
-        
-        if cache_entry:
-            # Atualizar existente
-            cache_entry.patient_data = patient_data
-            cache_entry.data_hash = data_hash
-            cache_entry.fetch_timestamp = datetime.utcnow()
-            cache_entry.last_validated = datetime.utcnow()
-            cache_entry.validation_count += 1
-            cache_entry.is_stale = False
-            cache_entry.expires_at = datetime.utcnow() + timedelta(seconds=cache_entry.ttl_seconds)
-        else:
-            # Criar novo
-            cache_entry = PatientCache(
-                cpf=cpf,
-                phone=phone,
-                patient_data=patient_data,
-                data_hash=data_hash,
-                expires_at=datetime.utcnow() + timedelta(seconds=300)  # 5 minutos
-            )
-            db.add(cache_entry)
-        
-        db.commit()
+        """Atualiza cache de paciente (não regrava se o data_hash não mudou)"""
+        await get_tiered_patient_cache().refresh(cpf, phone, patient_data, db)
     
     def _is_cpf_input(self, text: str) -> bool:
         """Verifica se o input contém um CPF"""
@@ -467,6 +458,25 @@ class PatientTransactionService:
             phone=phone
         ).order_by(PatientTransaction.created_at.desc()).limit(limit).all()
     
+    def get_transaction_payloads(self, transactions: List[PatientTransaction], db: Session) -> Dict[str, Dict[str, Any]]:
+        """
+        Contexto e resposta da API de cada transação (blobs ou colunas antigas)
+        
+        Returns:
+            {transaction.id: {"context_loaded", "context_updated", "api_response"}}
+        """
+        fields = ("context_loaded", "context_updated", "api_response")
+        blobs = get_audit_blob_store().load(
+            db, (getattr(t, f"{field}_hash") for t in transactions for field in fields)
+        )
+        return {
+            t.id: {
+                field: blobs.get(getattr(t, f"{field}_hash"), getattr(t, field))
+                for field in fields
+            }
+            for t in transactions
+        }
+    
     async def get_patient_from_cache(self, cpf: str, phone: str, db: Session) -> Optional[Dict]:
         """Busca paciente do cache se válido"""
         cache_entry = await self._get_cached_patient(cpf, phone, db)
@@ -0,0 +1,288 @@
+"""
+Grafo de estados da conversa compilado numa tabela de despacho
+
+STATE_GRAPH é a fonte única do grafo: handler do ConversationManager,
+flags 'expecting' aceitas, entradas válidas, transições e perfil do NLU
+('nlu_needs': features que o handler lê, calculadas no início do turno;
+as demais só se alguém ler o resultado) de cada estado.
+StateManager e ContextValidator leem daqui em vez de manter cópias.
+
+O grafo é compilado uma vez na importação (startup); por turno o despacho,
+a validação da entrada e a checagem de transição são lookups O(1).
+"""
+import logging
+import re
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from app.services import conversation_context as ctx
+from app.utils.nlu_processor import NLU_FEATURES
+
+logger = logging.getLogger(__name__)
+
+_SAUDACOES = ["oi", "olá", "ola", "hi", "hello"]
+_FORA_DE_CONTEXTO = "Desculpe, não entendi. Voltando ao menu principal."
+
+STATE_GRAPH: Dict[str, Dict[str, Any]] = {
+    "inicio": {
+        "description": "Estado inicial da conversa",
+        "handler": "_handle_inicio",
+        "transitions": ["menu_principal", "finalizada"],
+        "valid_inputs": _SAUDACOES + ["1", "2", "3", "4", "5", "0"],
+        "menu_options_allowed": True,
+    },
+    "menu_principal": {
+        "description": "Menu principal com opções",
+        "handler": "_handle_menu_principal",
+        "expecting": ["menu_option"],
+        "out_of_context_message": "Vou mostrar o menu principal novamente:",
+        "transitions": ["aguardando_cpf", "inicio", "finalizada"],
+        "valid_inputs": ["1", "2", "3", "4", "5", "0"],
+        "menu_options_allowed": True,
+    },
+    "aguardando_cpf": {
+        "description": "Aguardando CPF do usuário",
+        "handler": "_handle_cpf",
+        "expecting": ["cpf", "menu_option"],
+        "transitions": ["confirmando_paciente", "paciente_nao_encontrado", "menu_principal", "inicio"],
+        "required_context": ["acao"],
+        "optional_context": [ctx.PACIENTE],
+        "cpf_allowed": True,
+    },
+    "confirmando_paciente": {
+        "description": "Confirmando os dados do paciente encontrado",
+        "handler": "_handle_confirmacao_paciente",
+        "transitions": ["escolhendo_data", "agendamento_sem_dias", "visualizando_agendamentos",
+                        "aguardando_cpf", "menu_principal", "inicio"],
+        "required_context": ["acao"],
+        "optional_context": [ctx.PACIENTE_TEMP],
+        "valid_inputs": ["1", "2", "0"],
+        "menu_options_allowed": True,
+    },
+    "paciente_nao_encontrado": {
+        "description": "CPF sem cadastro: tentar outro CPF ou falar com atendente",
+        "handler": "_handle_paciente_nao_encontrado_opcoes",
+        "transitions": ["aguardando_cpf", "menu_principal", "inicio"],
+        "required_context": ["acao"],
+        "valid_inputs": ["1", "2", "3", "0"],
+        "menu_options_allowed": True,
+    },
+    "escolhendo_tipo_consulta": {
+        "description": "Escolhendo tipo de consulta",
+        "transitions": ["escolhendo_data", "menu_principal", "inicio"],
+        "required_context": ["paciente"],
+        "optional_context": ["tipo_consulta", "profissional"],
+        "valid_inputs": ["1", "2", "3", "4", "5"],
+        "menu_options_allowed": True,
+    },
+    "escolhendo_data": {
+        "description": "Escolhendo data da consulta",
+        "handler": "_handle_escolha_data",
+        "expecting": ["escolha_data"],
+        "transitions": ["escolhendo_horario", "data_sem_horarios", "menu_principal", "inicio"],
+        "required_context": [ctx.DIAS],
+        "optional_context": [ctx.PACIENTE, ctx.DATA],
+        "valid_inputs": ["1", "2", "3", "4", "5", "6", "7"],
+        "menu_options_allowed": True,
+    },
+    "agendamento_sem_dias": {
+        "description": "Sem dias disponíveis: tentar de novo, lista de espera ou atendente",
+        "handler": "_handle_agendamento_sem_dias",
+        "transitions": ["escolhendo_data", "aguardando_cpf", "menu_principal", "inicio"],
+        "optional_context": [ctx.PACIENTE],
+        "valid_inputs": ["1", "2", "3", "0"],
+        "menu_options_allowed": True,
+    },
+    "data_sem_horarios": {
+        "description": "Data sem horários: escolher outra data ou lista de espera",
+        "handler": "_handle_data_sem_horarios",
+        "transitions": ["escolhendo_data", "aguardando_cpf", "menu_principal", "inicio"],
+        "required_context": [ctx.DIAS],
+        "optional_context": [ctx.PACIENTE, ctx.DATA],
+        "valid_inputs": ["1", "2", "0"],
+        "menu_options_allowed": True,
+    },
+    "escolhendo_horario": {
+        "description": "Escolhendo horário da consulta",
+        "handler": "_handle_escolha_horario",
+        "expecting": ["escolha_horario"],
+        "transitions": ["confirmando_agendamento", "menu_principal", "inicio"],
+        "required_context": [ctx.DATA, ctx.HORARIOS],
+        "optional_context": [ctx.PACIENTE, ctx.HORARIO],
+        "valid_inputs": ["1", "2", "3", "4", "5", "6", "7", "8"],
+        "menu_options_allowed": True,
+    },
+    "confirmando_agendamento": {
+        "description": "Confirmando agendamento",
+        "handler": "_handle_confirmacao",
+        "expecting": ["confirmacao_agendamento"],
+        "transitions": ["aguardando_observacoes", "menu_principal", "inicio"],
+        "required_context": [ctx.DATA, ctx.HORARIO],
+        "optional_context": [ctx.PACIENTE, "observacoes"],
+        "valid_inputs": ["1", "2", "3"],
+        "menu_options_allowed": True,
+    },
+    "aguardando_observacoes": {
+        "description": "Aguardando observações do paciente",
+        "transitions": ["inicio", "menu_principal"],
+        "required_context": [ctx.DATA, ctx.HORARIO],
+        "optional_context": ["observacoes"],
+    },
+    "visualizando_agendamentos": {
+        "description": "Visualizando agendamentos",
+        "handler": "_handle_visualizar_agendamentos",
+        "transitions": ["aguardando_cpf", "menu_principal", "inicio"],
+        "optional_context": [ctx.PACIENTE, "agendamentos"],
+        "valid_inputs": ["0", "1", "2", "3"],
+        "menu_options_allowed": True,
+    },
+    "cancelando_consulta": {
+        "description": "Cancelando consulta",
+        "transitions": ["confirmando_cancelamento", "menu_principal", "inicio"],
+        "required_context": ["paciente"],
+        "optional_context": ["agendamentos_cancelar"],
+        "valid_inputs": ["0", "1", "2", "3", "4", "5"],
+        "menu_options_allowed": True,
+    },
+    "confirmando_cancelamento": {
+        "description": "Confirmando cancelamento",
+        "transitions": ["inicio", "menu_principal"],
+        "required_context": ["paciente", "agendamento_cancelar"],
+        "valid_inputs": ["1", "2"],
+        "menu_options_allowed": True,
+    },
+    "lista_espera": {
+        "description": "Lista de espera",
+        "handler": "_handle_lista_espera",
+        "transitions": ["inicio", "menu_principal"],
+        "optional_context": [ctx.PACIENTE],
+        "valid_inputs": ["1"],
+        "menu_options_allowed": True,
+    },
+    "finalizada": {
+        "description": "Conversa finalizada",
+        "handler": "_handle_conversa_finalizada",
+        # Qualquer mensagem recomeça: inicio → menu_principal no mesmo turno
+        "transitions": ["inicio", "menu_principal"],
+        "optional_context": ["finalizada_em"],
+        "valid_inputs": _SAUDACOES + ["1"],
+        "menu_options_allowed": True,
+    },
+}
+
+# Formato do CPF (com ou sem pontuação); dígitos verificadores ficam no ValidatorUtils
+_CPF_PATTERN = re.compile(r"\d{3}\.?\d{3}\.?\d{3}-?\d{2}")
+
+class CompiledState:
+    """Entrada da tabela de despacho: tudo que o turno precisa, pré-calculado"""
+    __slots__ = ("name", "handler", "description", "transitions", "required_context", "optional_context",
+                 "expecting", "out_of_context_message", "valid_inputs", "input_set", "cpf_allowed",
+                 "menu_options_allowed", "nlu_needs")
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.handler: Optional[str] = spec.get("handler")
+        self.description: str = spec.get("description", "")
+        # O próprio estado é sempre permitido (opção inválida mantém o estado)
+        self.transitions: FrozenSet[str] = frozenset(spec.get("transitions", ())) | {name}
+        self.required_context: Tuple[str, ...] = tuple(spec.get("required_context", ()))
+        self.optional_context: Tuple[str, ...] = tuple(spec.get("optional_context", ()))
+        expecting = spec.get("expecting")
+        self.expecting: Optional[FrozenSet[str]] = frozenset(expecting) if expecting else None
+        self.out_of_context_message: str = spec.get("out_of_context_message", _FORA_DE_CONTEXTO)
+        self.valid_inputs: Tuple[str, ...] = tuple(spec.get("valid_inputs", ()))
+        self.input_set: FrozenSet[str] = frozenset(self.valid_inputs)
+        self.cpf_allowed: bool = spec.get("cpf_allowed", False)
+        self.menu_options_allowed: bool = spec.get("menu_options_allowed", False)
+        # Handlers atuais decidem pela mensagem crua (dígitos/CPF): nada do NLU por padrão
+        self.nlu_needs: FrozenSet[str] = frozenset(spec.get("nlu_needs", ()))
+
+    def accepts_expecting(self, expecting: Optional[str]) -> bool:
+        """Flag 'expecting' ausente é aceita (compatibilidade com contextos antigos)"""
+        return self.expecting is None or not expecting or expecting in self.expecting
+
+    def accepts_input(self, message: str) -> bool:
+        """Entrada dentro do esperado para o estado; sem lista definida aceita qualquer texto"""
+        if message in self.input_set:
+            return True
+        texto = message.strip().lower()
+        if texto in self.input_set:
+            return True
+        if self.cpf_allowed and _CPF_PATTERN.fullmatch(texto):
+            return True
+        return not self.input_set and not self.cpf_allowed
+
+    def can_transition_to(self, target: Optional[str]) -> bool:
+        return (target or "inicio") in self.transitions
+
+def compile_state_graph(graph: Dict[str, Dict[str, Any]] = STATE_GRAPH) -> Dict[str, CompiledState]:
+    """Compila o grafo; falha na carga se uma transição aponta para estado inexistente"""
+    compiled = {name: CompiledState(name, spec) for name, spec in graph.items()}
+    for state in compiled.values():
+        desconhecidos = state.transitions - compiled.keys()
+        if desconhecidos:
+            raise ValueError(f"Estado '{state.name}' com transição para estados inexistentes: {sorted(desconhecidos)}")
+        features = state.nlu_needs - NLU_FEATURES.keys()
+        if features:
+            raise ValueError(f"Estado '{state.name}' com features de NLU desconhecidas: {sorted(features)}")
+    return compiled
+
+COMPILED_STATES: Dict[str, CompiledState] = compile_state_graph()
+
+class StateDispatcher:
+    """
+    Tabela de despacho ligada aos handlers de um ConversationManager
+
+    Os métodos são resolvidos uma vez na construção; estado sem handler
+    (ou fora do grafo) vai para o handler de fallback.
+    """
+
+    def __init__(self, owner: Any, fallback: str, states: Optional[Dict[str, CompiledState]] = None):
+        states = COMPILED_STATES if states is None else states
+        self._routes: Dict[str, Tuple[CompiledState, Callable]] = {
+            name: (state, getattr(owner, state.handler)) for name, state in states.items() if state.handler
+        }
+        self._fallback: Tuple[Optional[CompiledState], Callable] = (None, getattr(owner, fallback))
+
+        # Métricas
+        self.dispatches = 0
+        self.fallbacks = 0
+        self.out_of_context = 0
+        self.unexpected_inputs = 0
+        self.unexpected_transitions = 0
+
+    def route(self, state: Optional[str]) -> Tuple[Optional[CompiledState], Callable]:
+        self.dispatches += 1
+        route = self._routes.get(state or "inicio")
+        if route is None:
+            self.fallbacks += 1
+            return self._fallback
+        return route
+
+    def nlu_needs(self, state: Optional[str]) -> FrozenSet[str]:
+        """Perfil do NLU do estado (estado fora do grafo: nada pré-calculado)"""
+        route = self._routes.get(state or "inicio")
+        return route[0].nlu_needs if route is not None else frozenset()
+
+    def check_input(self, state: CompiledState, message: str) -> bool:
+        """Só contabiliza: a resposta para opção inválida continua sendo do handler"""
+        if state.accepts_input(message):
+            return True
+        self.unexpected_inputs += 1
+        return False
+
+    def check_transition(self, state: CompiledState, target: Optional[str]) -> bool:
+        if state.can_transition_to(target):
+            return True
+        self.unexpected_transitions += 1
+        logger.warning(f"⚠️ Transição fora do grafo: {state.name} → {target}")
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "states": len(self._routes),
+            "dispatches": self.dispatches,
+            "fallbacks": self.fallbacks,
+            "out_of_context": self.out_of_context,
+            "unexpected_inputs": self.unexpected_inputs,
+            "unexpected_transitions": self.unexpected_transitions
+        }
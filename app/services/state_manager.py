@@ -2,92 +2,23 @@ from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 import logging
 
+from app.services.state_machine import COMPILED_STATES
+
 logger = logging.getLogger(__name__)
 
 class StateManager:
     """Sistema robusto de gerenciamento de estados para conversas"""
     
     def __init__(self):
-        # Estados válidos do sistema
+        # Estados válidos do sistema (visão do grafo único em state_machine)
         self.states = {
-            "inicio": {
-                "description": "Estado inicial da conversa",
-                "allowed_transitions": ["menu_principal", "finalizada"],
-                "required_context": [],
-                "optional_context": []
-            },
-            "menu_principal": {
-                "description": "Menu principal com opções",
-                "allowed_transitions": ["aguardando_cpf", "inicio", "finalizada"],
-                "required_context": [],
-                "optional_context": []
-            },
-            "aguardando_cpf": {
-                "description": "Aguardando CPF do usuário",
-                "allowed_transitions": ["escolhendo_tipo_consulta", "visualizando_agendamentos", "cancelando_consulta", "lista_espera", "menu_principal", "inicio"],
-                "required_context": ["acao"],
-                "optional_context": ["paciente"]
-            },
-            "escolhendo_tipo_consulta": {
-                "description": "Escolhendo tipo de consulta",
-                "allowed_transitions": ["escolhendo_data", "menu_principal", "inicio"],
-                "required_context": ["paciente"],
-                "optional_context": ["tipo_consulta", "profissional"]
-            },
-            "escolhendo_data": {
-                "description": "Escolhendo data da consulta",
-                "allowed_transitions": ["escolhendo_horario", "menu_principal", "inicio"],
-                "required_context": ["paciente", "tipo_consulta", "profissional"],
-                "optional_context": ["data_escolhida", "datas_disponiveis"]
-            },
-            "escolhendo_horario": {
-                "description": "Escolhendo horário da consulta",
-                "allowed_transitions": ["confirmando_agendamento", "menu_principal", "inicio"],
-                "required_context": ["paciente", "tipo_consulta", "profissional", "data_escolhida"],
-                "optional_context": ["horario_escolhido", "horarios_disponiveis"]
-            },
-            "confirmando_agendamento": {
-                "description": "Confirmando agendamento",
-                "allowed_transitions": ["aguardando_observacoes", "inicio", "menu_principal"],
-                "required_context": ["paciente", "tipo_consulta", "profissional", "data_escolhida", "horario_escolhido"],
-                "optional_context": ["observacoes"]
-            },
-            "aguardando_observacoes": {
-                "description": "Aguardando observações do paciente",
-                "allowed_transitions": ["inicio", "menu_principal"],
-                "required_context": ["paciente", "tipo_consulta", "profissional", "data_escolhida", "horario_escolhido"],
-                "optional_context": ["observacoes"]
-            },
-            "visualizando_agendamentos": {
-                "description": "Visualizando agendamentos",
-                "allowed_transitions": ["aguardando_cpf", "menu_principal", "inicio"],
-                "required_context": ["paciente"],
-                "optional_context": ["agendamentos"]
-            },
-            "cancelando_consulta": {
-                "description": "Cancelando consulta",
-                "allowed_transitions": ["confirmando_cancelamento", "menu_principal", "inicio"],
-                "required_context": ["paciente"],
-                "optional_context": ["agendamentos_cancelar"]
-            },
-            "confirmando_cancelamento": {
-                "description": "Confirmando cancelamento",
-                "allowed_transitions": ["inicio", "menu_principal"],
-                "required_context": ["paciente", "agendamento_cancelar"],
-                "optional_context": []
-            },
-            "lista_espera": {
-                "description": "Lista de espera",
-                "allowed_transitions": ["inicio", "menu_principal"],
-                "required_context": ["paciente"],
-                "optional_context": []
-            },
-            "finalizada": {
-                "description": "Conversa finalizada",
-                "allowed_transitions": ["inicio"],
-                "required_context": [],
-                "optional_context": ["finalizada_em"]
+            name: {
+                "description": state.description,
+                "allowed_transitions": sorted(state.transitions - {name}),
+                "required_context": list(state.required_context),
+                "optional_context": list(state.optional_context)
             }
+            for name, state in COMPILED_STATES.items()
         }
 
     def can_transition_to(self, current_state: str, target_state: str) -> Tuple[bool, str]:
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class WebhookIngestionQueue:
+    """Fila de ingestão do webhook: o handler enfileira e responde, workers processam em background"""
+
+    def __init__(self, processor: Callable[[Dict[str, Any]], Awaitable[None]],
+                 workers: int = 4, maxsize: int = 1000, job_timeout: float = 30.0):
+        self.processor = processor
+        self.worker_count = max(1, workers)
+        self.maxsize = maxsize
+        self.job_timeout = job_timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._busy_workers = 0
+        self._started_at: Optional[float] = None
+
+        # Métricas
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self._busy_time = 0.0
+        self._wait_times = deque(maxlen=500)  # Janela das últimas esperas (segundos)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        """Inicia os workers (precisa de event loop ativo)"""
+        if self.running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._started_at = time.monotonic()
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"✅ Fila de ingestão iniciada com {self.worker_count} workers (max {self.maxsize})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Drena a fila (até drain_timeout) e encerra os workers"""
+        if not self.running:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Fila não drenou em {drain_timeout}s, {self._queue.qsize()} eventos descartados")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("🔄 Fila de ingestão finalizada")
+
+    def enqueue(self, data: Dict[str, Any]) -> bool:
+        """
+        Enfileira um evento sem bloquear
+
+        Returns:
+            False se a fila estiver cheia (chamador decide o fallback)
+        """
+        if not self.running:
+            self.start()
+
+        try:
+            self._queue.put_nowait((time.monotonic(), data))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"⚠️ Fila de ingestão cheia ({self.maxsize}), evento rejeitado")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, worker_id: int):
+        """Consome eventos da fila até ser cancelado"""
+        while True:
+            enqueued_at, data = await self._queue.get()
+            started = time.monotonic()
+            self._wait_times.append(started - enqueued_at)
+            self._busy_workers += 1
+
+            try:
+                await asyncio.wait_for(self.processor(data), timeout=self.job_timeout)
+                self.processed += 1
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.error(f"❌ Worker {worker_id}: timeout de {self.job_timeout}s no processamento")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Worker {worker_id}: erro no processamento: {str(e)}")
+            finally:
+                self._busy_workers -= 1
+                self._busy_time += time.monotonic() - started
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, tempo de espera e utilização dos workers"""
+        waits = sorted(self._wait_times)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.worker_count
+
+        return {
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "workers": self.worker_count,
+            "busy_workers": self._busy_workers,
+            "utilization": round(self._busy_time / capacity, 4) if capacity else 0.0,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 2) if waits else 0.0
+            }
+        }
@@ -1,6 +1,7 @@
 import httpx
 from typing import Optional, List, Dict
 from app.config import settings
+from app.utils.http_clients import get_http_client_pool, parse_endpoint_timeouts
 import logging
 import asyncio
 
@@ -15,9 +16,13 @@ class WhatsAppService:
             "Client-Token": settings.zapi_client_token,
             "Content-Type": "application/json"
         }
-        self.timeout = 30
+        self.timeout = settings.zapi_timeout
+        self.endpoint_timeouts = parse_endpoint_timeouts(settings.zapi_endpoint_timeouts)
         self.max_retries = 3
         
+        # Um cliente HTTP compartilhado por instância Z-API
+        self.pool_key = f"zapi:{settings.zapi_instance_id}"
+        
         # Validar configurações
         self._validate_config()
     
@@ -36,6 +41,14 @@ class WhatsAppService:
         else:
             logger.info("✅ Configurações Z-API validadas com sucesso")
     
+    def _get_client(self) -> httpx.AsyncClient:
+        """Cliente com pool de conexões keep-alive compartilhado entre as instâncias do serviço"""
+        return get_http_client_pool().get_client(self.pool_key)
+    
+    def _timeout_for(self, endpoint: str) -> float:
+        """Timeout configurado para o endpoint (ZAPI_ENDPOINT_TIMEOUTS) ou o padrão"""
+        return self.endpoint_timeouts.get(endpoint, self.timeout)
+    
     async def send_text(self, phone: str, message: str, delay_message: int = 2) -> Optional[Dict]:
         """
         Envia mensagem de texto com retry e tratamento de erros
@@ -61,22 +74,23 @@ class WhatsAppService:
             try:
                 logger.info(f"Tentativa {attempt + 1}/{self.max_retries} - Enviando mensagem para {formatted_phone}")
                 
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        f"{self.base_url}/send-text",
-                        json=payload,
-                        headers=self.headers
-                    )
+                client = self._get_client()
+                response = await client.post(
+                    f"{self.base_url}/send-text",
+                    json=payload,
+                    headers=self.headers,
+                    timeout=self._timeout_for("send-text")
+                )
                     
-                    if response.status_code == 200:
-                        logger.info(f"✅ Mensagem enviada com sucesso para {phone}")
-                        return response.json()
-                    elif response.status_code == 429:  # Rate limit
-                        logger.warning("Rate limit atingido, aguardando...")
-                        await asyncio.sleep(5 * (attempt + 1))  # Backoff exponencial
-                        continue
-                    else:
-                        logger.error(f"Erro na API: {response.status_code} - {response.text}")
+                if response.status_code == 200:
+                    logger.info(f"✅ Mensagem enviada com sucesso para {phone}")
+                    return response.json()
+                elif response.status_code == 429:  # Rate limit
+                    logger.warning("Rate limit atingido, aguardando...")
+                    await asyncio.sleep(5 * (attempt + 1))  # Backoff exponencial
+                    continue
+                else:
+                    logger.error(f"Erro na API: {response.status_code} - {response.text}")
                         
             except httpx.TimeoutException:
                 logger.error(f"Timeout ao enviar mensagem (tentativa {attempt + 1})")
@@ -117,19 +131,20 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/send-button-list",
-                    json=payload,
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.post(
+                f"{self.base_url}/send-button-list",
+                json=payload,
+                headers=self.headers,
+                timeout=self._timeout_for("send-button-list")
+            )
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Lista de botões enviada para {phone}")
-                    return response.json()
-                else:
-                    logger.error(f"Erro ao enviar botões: {response.status_code}")
-                    return None
+            if response.status_code == 200:
+                logger.info(f"✅ Lista de botões enviada para {phone}")
+                return response.json()
+            else:
+                logger.error(f"Erro ao enviar botões: {response.status_code}")
+                return None
                     
         except Exception as e:
             logger.error(f"Erro ao enviar lista de botões: {str(e)}")
@@ -150,19 +165,20 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/send-link",
-                    json=payload,
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.post(
+                f"{self.base_url}/send-link",
+                json=payload,
+                headers=self.headers,
+                timeout=self._timeout_for("send-link")
+            )
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Link enviado para {phone}")
-                    return response.json()
-                else:
-                    logger.error(f"Erro ao enviar link: {response.status_code}")
-                    return None
+            if response.status_code == 200:
+                logger.info(f"✅ Link enviado para {phone}")
+                return response.json()
+            else:
+                logger.error(f"Erro ao enviar link: {response.status_code}")
+                return None
                     
         except Exception as e:
             logger.error(f"Erro ao enviar link: {str(e)}")
@@ -178,14 +194,15 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/read-message",
-                    json=payload,
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.post(
+                f"{self.base_url}/read-message",
+                json=payload,
+                headers=self.headers,
+                timeout=self._timeout_for("read-message")
+            )
                 
-                return response.status_code == 200
+            return response.status_code == 200
                 
         except Exception as e:
             logger.error(f"Erro ao marcar como lida: {str(e)}")
@@ -205,19 +222,20 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/send-location",
-                    json=payload,
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.post(
+                f"{self.base_url}/send-location",
+                json=payload,
+                headers=self.headers,
+                timeout=self._timeout_for("send-location")
+            )
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Localização enviada para {phone}")
-                    return response.json()
-                else:
-                    logger.error(f"Erro ao enviar localização: {response.status_code}")
-                    return None
+            if response.status_code == 200:
+                logger.info(f"✅ Localização enviada para {phone}")
+                return response.json()
+            else:
+                logger.error(f"Erro ao enviar localização: {response.status_code}")
+                return None
                     
         except Exception as e:
             logger.error(f"Erro ao enviar localização: {str(e)}")
@@ -226,16 +244,17 @@ class WhatsAppService:
     async def check_status(self) -> Dict:
         """Verifica status da instância Z-API"""
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                response = await client.get(
-                    f"{self.base_url}/status",
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.get(
+                f"{self.base_url}/status",
+                headers=self.headers,
+                timeout=self._timeout_for("status")
+            )
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {"connected": False, "error": f"Status code: {response.status_code}"}
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"connected": False, "error": f"Status code: {response.status_code}"}
                     
         except Exception as e:
             return {"connected": False, "error": str(e)}
@@ -275,14 +294,15 @@ class WhatsAppService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/send-typing",
-                    json=payload,
-                    headers=self.headers
-                )
+            client = self._get_client()
+            response = await client.post(
+                f"{self.base_url}/send-typing",
+                json=payload,
+                headers=self.headers,
+                timeout=self._timeout_for("send-typing")
+            )
                 
-                return response.status_code == 200
+            return response.status_code == 200
                 
         except Exception as e:
             logger.error(f"Erro ao enviar typing: {str(e)}")
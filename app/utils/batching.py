@@ -0,0 +1,44 @@
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def iter_chunks(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Divide um iterável (possivelmente infinito) em listas de até size itens"""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def map_chunks(fn: Callable[[List[T]], List[R]], items: Iterable[T], chunk_size: int = 500,
+               workers: int = 0, initializer: Optional[Callable] = None,
+               initargs: tuple = ()) -> Iterator[R]:
+    """
+    Aplica fn (lista -> lista) em lotes e devolve os resultados em streaming, na ordem de entrada
+
+    workers <= 0 roda no próprio processo. Com workers > 0 os lotes vão para
+    um ProcessPoolExecutor com no máximo 2 lotes em andamento por worker:
+    a entrada é consumida aos poucos (milhões de linhas não ficam em memória).
+    fn precisa ser uma função de módulo (picklable).
+    """
+    chunks = iter_chunks(items, max(1, chunk_size))
+    if workers <= 0:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield from fn(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(fn, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -3,96 +3,25 @@ from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 import logging
 
+from app.services.state_machine import COMPILED_STATES
+
 logger = logging.getLogger(__name__)
 
 class ContextValidator:
     """Sistema robusto de validação de contexto para conversas"""
     
     def __init__(self):
-        # Estados válidos do sistema
-        self.valid_states = {
-            "inicio",
-            "menu_principal", 
-            "aguardando_cpf",
-            "escolhendo_tipo_consulta",
-            "escolhendo_data",
-            "escolhendo_horario",
-            "confirmando_agendamento",
-            "aguardando_observacoes",
-            "visualizando_agendamentos",
-            "cancelando_consulta",
-            "confirmando_cancelamento",
-            "lista_espera",
-            "finalizada"
-        }
+        # Estados válidos do sistema (grafo único em state_machine)
+        self.valid_states = set(COMPILED_STATES)
         
-        # Padrões de validação por estado
+        # Padrões de validação por estado (valid_inputs vazio: qualquer texto)
         self.state_validation_patterns = {
-            "inicio": {
-                "valid_inputs": ["oi", "olá", "ola", "hi", "hello", "1", "2", "3", "4", "5", "0"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "menu_principal": {
-                "valid_inputs": ["1", "2", "3", "4", "5", "0"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "aguardando_cpf": {
-                "valid_inputs": [],  # Qualquer CPF válido
-                "cpf_allowed": True,
-                "menu_options_allowed": False
-            },
-            "escolhendo_tipo_consulta": {
-                "valid_inputs": ["1", "2", "3", "4", "5"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "escolhendo_data": {
-                "valid_inputs": ["1", "2", "3", "4", "5", "6", "7"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "escolhendo_horario": {
-                "valid_inputs": ["1", "2", "3", "4", "5", "6", "7", "8"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "confirmando_agendamento": {
-                "valid_inputs": ["1", "2", "3"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "aguardando_observacoes": {
-                "valid_inputs": [],  # Qualquer texto
-                "cpf_allowed": False,
-                "menu_options_allowed": False
-            },
-            "visualizando_agendamentos": {
-                "valid_inputs": ["0", "1", "2", "3"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "cancelando_consulta": {
-                "valid_inputs": ["0", "1", "2", "3", "4", "5"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "confirmando_cancelamento": {
-                "valid_inputs": ["1", "2"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "lista_espera": {
-                "valid_inputs": ["1"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
-            },
-            "finalizada": {
-                "valid_inputs": ["oi", "olá", "ola", "hi", "hello", "1"],
-                "cpf_allowed": False,
-                "menu_options_allowed": True
+            name: {
+                "valid_inputs": list(state.valid_inputs),
+                "cpf_allowed": state.cpf_allowed,
+                "menu_options_allowed": state.menu_options_allowed
             }
+            for name, state in COMPILED_STATES.items()
         }
 
     def validate_message_for_state(self, message: str, state: str, context: Dict) -> Tuple[bool, str, Dict]:
@@ -0,0 +1,162 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class RedisDedupBackend:
+    """Camada compartilhada entre workers/instâncias usando SET NX EX no Redis"""
+
+    def __init__(self, url: str, prefix: str = "chatbot:msgid:"):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+        self.errors = 0
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._client
+
+    async def add_if_absent(self, message_id: str, ttl_seconds: int) -> bool:
+        """Marca o ID; retorna False se já existia (evento duplicado)"""
+        try:
+            created = await self._get_client().set(self.prefix + message_id, 1, nx=True, ex=ttl_seconds)
+            return bool(created)
+        except Exception as e:
+            # Falha aberta: sem Redis, a camada em memória continua deduplicando
+            self.errors += 1
+            logger.warning(f"⚠️ Dedup Redis indisponível: {str(e)}")
+            return True
+
+    async def mark(self, message_id: str, ttl_seconds: int):
+        """Regrava o ID com novo TTL (em andamento -> processado)"""
+        try:
+            await self._get_client().set(self.prefix + message_id, 1, ex=ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ Dedup Redis indisponível: {str(e)}")
+
+    async def discard(self, message_id: str):
+        """Remove o ID (processamento falhou: a redelivery deve ser processada)"""
+        try:
+            await self._get_client().delete(self.prefix + message_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ Dedup Redis indisponível: {str(e)}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+class MessageDedupStore:
+    """
+    Deduplicação de eventos do webhook pelo messageId da Z-API
+
+    Camada 1: LRU em memória com TTL e tamanho limitado.
+    Camada 2 (opcional): backend compartilhado (Redis) para redeliveries que
+    caem em outro worker ou chegam depois de um restart.
+
+    Duas fases: claim() marca o ID como "em andamento" por inflight_ttl
+    segundos; complete() o marca como processado por ttl_seconds e release()
+    o libera se o processamento falhou. Um evento perdido no meio (timeout,
+    crash ou restart com a fila em memória) volta a ser aceito quando o
+    inflight_ttl expira: entrega pelo menos uma vez, nunca zero.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 3600, inflight_ttl: int = 120,
+                 backend: Optional[RedisDedupBackend] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.inflight_ttl = inflight_ttl
+        self.backend = backend
+        self._clock = clock
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # message_id -> expires_at
+
+        # Métricas
+        self.checks = 0
+        self.memory_hits = 0
+        self.backend_hits = 0
+        self.evictions = 0
+        self.completed = 0
+        self.released = 0
+
+    async def claim(self, message_id: str) -> bool:
+        """
+        Verifica o messageId e, se for novo, marca como em andamento
+
+        Returns:
+            True se o evento já foi visto ou está em andamento (duplicado), False se é novo
+        """
+        if not message_id:
+            return False
+
+        self.checks += 1
+        now = self._clock()
+
+        expires_at = self._seen.get(message_id)
+        if expires_at is not None:
+            if expires_at > now:
+                self._seen.move_to_end(message_id)
+                self.memory_hits += 1
+                return True
+            del self._seen[message_id]
+
+        if self.backend is not None:
+            is_new = await self.backend.add_if_absent(message_id, self.inflight_ttl)
+            if not is_new:
+                self.backend_hits += 1
+                self._remember(message_id, now + self.inflight_ttl)
+                return True
+
+        self._remember(message_id, now + self.inflight_ttl)
+        return False
+
+    async def complete(self, message_id: str):
+        """Processamento concluído: redeliveries são duplicadas por ttl_seconds"""
+        if not message_id:
+            return
+        self.completed += 1
+        self._remember(message_id, self._clock() + self.ttl_seconds)
+        if self.backend is not None:
+            await self.backend.mark(message_id, self.ttl_seconds)
+
+    async def release(self, message_id: str):
+        """Processamento falhou ou foi interrompido: a redelivery da Z-API será processada"""
+        if not message_id:
+            return
+        self.released += 1
+        self._seen.pop(message_id, None)
+        if self.backend is not None:
+            await self.backend.discard(message_id)
+
+    def _remember(self, message_id: str, expires_at: float):
+        self._seen[message_id] = expires_at
+        self._seen.move_to_end(message_id)
+
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxa de duplicados (volume de redelivery) por camada"""
+        duplicates = self.memory_hits + self.backend_hits
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "inflight_ttl": self.inflight_ttl,
+            "backend": "redis" if self.backend is not None else None,
+            "backend_errors": self.backend.errors if self.backend is not None else 0,
+            "checks": self.checks,
+            "duplicates": duplicates,
+            "memory_hits": self.memory_hits,
+            "backend_hits": self.backend_hits,
+            "hit_rate": round(duplicates / self.checks, 4) if self.checks else 0.0,
+            "evictions": self.evictions,
+            "completed": self.completed,
+            "released": self.released
+        }
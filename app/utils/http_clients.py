@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _http2_available() -> bool:
+    """HTTP/2 no httpx depende do pacote opcional h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class HTTPClientPool:
+    """
+    Registro de httpx.AsyncClient de longa duração, um por upstream
+
+    Cada cliente mantém seu pool de conexões keep-alive, evitando um
+    handshake TCP+TLS por chamada. Criado no lifespan e fechado no shutdown;
+    fora do lifespan (scripts, Vercel) os clientes são criados sob demanda.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, http2: bool = True, timeout: float = 30.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("⚠️ Pacote h2 não instalado, usando HTTP/1.1 com keep-alive")
+
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loops: Dict[str, Any] = {}
+        self._created: Dict[str, int] = {}
+
+    def get_client(self, name: str, base_url: str = "", headers: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+        """Retorna o cliente compartilhado do upstream, criando se necessário"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(name)
+
+        # Conexões ficam presas ao event loop em que foram abertas
+        if client is not None and not client.is_closed and self._loops.get(name) is loop:
+            return client
+        if client is not None:
+            self._retire(name, client, self._loops.get(name))
+
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2
+        )
+        self._clients[name] = client
+        self._loops[name] = loop
+        self._created[name] = self._created.get(name, 0) + 1
+        logger.info(f"🔌 Cliente HTTP '{name}' criado (http2={self.http2})")
+        return client
+
+    def _retire(self, name: str, client: httpx.AsyncClient, loop: Any):
+        """Fecha o cliente substituído no event loop dono das conexões"""
+        if client.is_closed:
+            return
+        if loop is None or loop.is_closed():
+            # aclose() em outro loop falha com "Event loop is closed"; os transportes ficam para o GC
+            logger.warning(f"⚠️ Cliente HTTP '{name}' descartado sem fechar (event loop encerrado)")
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close(name, client), loop)
+        else:
+            loop.create_task(self._close(name, client))  # Roda quando o loop voltar a rodar
+
+    async def _close(self, name: str, client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"❌ Erro ao fechar cliente HTTP '{name}': {str(e)}")
+
+    async def aclose(self):
+        """Fecha todos os clientes (shutdown da aplicação)"""
+        for name, client in list(self._clients.items()):
+            await self._close(name, client)
+        self._clients.clear()
+        self._loops.clear()
+        logger.info("🔄 Clientes HTTP finalizados")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "clients": {
+                name: {"open": not client.is_closed, "created": self._created.get(name, 0)}
+                for name, client in self._clients.items()
+            }
+        }
+
+def parse_endpoint_timeouts(value: str) -> Dict[str, float]:
+    """Converte 'status=10,send-text=30' em {'status': 10.0, 'send-text': 30.0}"""
+    timeouts = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        endpoint, seconds = item.split("=", 1)
+        try:
+            timeouts[endpoint.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"⚠️ Timeout inválido para endpoint '{endpoint.strip()}': {seconds}")
+    return timeouts
+
+_http_client_pool: Optional[HTTPClientPool] = None
+
+def get_http_client_pool() -> HTTPClientPool:
+    """Retorna instância singleton do pool de clientes HTTP"""
+    global _http_client_pool
+    if _http_client_pool is None:
+        _http_client_pool = HTTPClientPool(
+            max_connections=settings.http_pool_max_connections,
+            max_keepalive_connections=settings.http_pool_max_keepalive,
+            keepalive_expiry=settings.http_pool_keepalive_expiry,
+            http2=settings.http_pool_http2
+        )
+    return _http_client_pool
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+class _KeyedLockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0  # Detentor + tarefas aguardando
+
+class KeyedLockRegistry:
+    """
+    Registro de locks asyncio por chave (ex.: telefone do paciente)
+
+    Garante processamento em ordem para a mesma chave (asyncio.Lock acorda
+    os aguardando em FIFO) enquanto chaves diferentes rodam em paralelo.
+    A entrada é removida quando ninguém mais a referencia, então o registro
+    só guarda as chaves ativas.
+    """
+
+    def __init__(self, name: str = "keyed_lock"):
+        self.name = name
+        self._entries: Dict[str, _KeyedLockEntry] = {}
+
+        # Métricas
+        self.acquisitions = 0
+        self.contended = 0
+        self.max_active = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @asynccontextmanager
+    async def lock(self, key: str):
+        """Adquire o lock da chave; libera e limpa a entrada ao sair"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _KeyedLockEntry()
+            self.max_active = max(self.max_active, len(self._entries))
+
+        entry.refs += 1
+        if entry.lock.locked():
+            self.contended += 1
+            logger.debug(f"🔒 {self.name}: aguardando lock de {key} ({entry.refs - 1} na frente)")
+
+        started = time.monotonic()
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._release_ref(key, entry)
+            raise
+
+        waited = time.monotonic() - started
+        self.acquisitions += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+
+        try:
+            yield
+        finally:
+            entry.lock.release()
+            self._release_ref(key, entry)
+
+    def _release_ref(self, key: str, entry: _KeyedLockEntry):
+        entry.refs -= 1
+        if entry.refs == 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contenção de locks e quantidade de chaves ativas"""
+        waiting = sum(max(0, e.refs - 1) if e.lock.locked() else e.refs for e in self._entries.values())
+        return {
+            "active_keys": len(self._entries),
+            "max_active_keys": self.max_active,
+            "waiting": waiting,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "contention_rate": round(self.contended / self.acquisitions, 4) if self.acquisitions else 0.0,
+            "wait_ms": {
+                "avg": round(self._total_wait / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+                "max": round(self._max_wait * 1000, 2)
+            }
+        }
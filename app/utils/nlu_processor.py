@@ -1,16 +1,146 @@
 import re
-from typing import Dict, List, Optional, Tuple
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import unicodedata
 import logging
 
+from app.config import settings
+from app.utils.batching import map_chunks
+from app.utils.pattern_matcher import PatternMatcher
+
 logger = logging.getLogger(__name__)
 
+# Feature -> chaves do resultado que ela preenche
+NLU_FEATURES: Dict[str, Tuple[str, ...]] = {
+    'normalized': ('normalized_message',),
+    'intent': ('intent', 'confidence', 'is_greeting', 'is_farewell'),
+    'entities': ('entities',),
+    'sentiment': ('sentiment',),
+    'is_question': ('is_question',),
+}
+_KEY_FEATURE = {key: feature for feature, keys in NLU_FEATURES.items() for key in keys}
+_RESULT_KEYS = ('original_message',) + tuple(_KEY_FEATURE)
+
+# Vocabulário pré-calculado no memo (opções de menu, saudações, sim/não, comandos)
+NLU_WARM_VOCABULARY = (
+    [str(digito) for digito in range(10)]
+    + ["oi", "ola", "olá", "oii", "bom dia", "boa tarde", "boa noite", "hello",
+       "sim", "s", "ok", "nao", "não", "n", "menu", "ajuda", "sair", "cancelar", "tchau", "obrigado", "obrigada"]
+)
+
+class _NLUStateStats:
+    __slots__ = ("messages", "total_ns", "features", "memo_hits")
+
+    def __init__(self):
+        self.messages = 0
+        self.total_ns = 0
+        self.features = {feature: 0 for feature in NLU_FEATURES}
+        self.memo_hits = 0
+
+class NLUResult(Mapping):
+    """
+    Resultado do NLU avaliado sob demanda
+
+    Cada feature é calculada na primeira leitura de uma das suas chaves
+    (ex.: nlu_result['intent']) e guardada; o custo entra nas métricas do
+    estado em que a mensagem chegou. Features já calculadas para o mesmo
+    texto normalizado vêm do memo do processador.
+    """
+    __slots__ = ("_processor", "_values", "_stats", "_memo")
+
+    def __init__(self, processor: "NLUProcessor", message: str, stats: _NLUStateStats):
+        self._processor = processor
+        self._values: Dict[str, Any] = {'original_message': message}
+        self._stats = stats
+        self._memo: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._values:
+            feature = _KEY_FEATURE.get(key)
+            if feature is None:
+                raise KeyError(key)
+            self._compute(feature)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(_RESULT_KEYS)
+
+    def __len__(self) -> int:
+        return len(_RESULT_KEYS)
+
+    def computed(self) -> Dict[str, Any]:
+        """Só o que já foi calculado (não dispara análise)"""
+        return dict(self._values)
+
+    def __repr__(self) -> str:
+        return repr(self._values)
+
+    def _compute(self, feature: str):
+        started = time.perf_counter_ns()
+        processor = self._processor
+        values = self._values
+        if feature != 'normalized' and 'normalized_message' not in values:
+            self._compute('normalized')
+            started = time.perf_counter_ns()
+        text = values.get('normalized_message')
+
+        memo = self._memo
+        if memo is not None and feature in memo:
+            values.update(memo[feature])
+            if feature == 'entities':
+                # Listas compartilhadas com o memo: cada resultado recebe a sua cópia
+                values['entities'] = {tipo: list(valores) for tipo, valores in values['entities'].items()}
+            self._stats.total_ns += time.perf_counter_ns() - started
+            self._stats.memo_hits += 1
+            return
+
+        if feature == 'normalized':
+            text = values['normalized_message'] = processor._normalize_text(values['original_message'])
+            self._memo = processor._memo_entry(text)
+        elif feature == 'intent':
+            intent, confidence = processor._detect_intent(text)
+            values['intent'] = intent
+            values['confidence'] = confidence
+            values['is_greeting'] = intent == 'saudacao'
+            values['is_farewell'] = intent == 'despedida'
+        elif feature == 'entities':
+            values['entities'] = processor._extract_entities(text)
+        elif feature == 'sentiment':
+            values['sentiment'] = processor._analyze_sentiment(text)
+        elif feature == 'is_question':
+            values['is_question'] = processor._is_question(text)
+
+        if self._memo is not None and feature != 'normalized':
+            computed = {key: values[key] for key in NLU_FEATURES[feature]}
+            if feature == 'entities':
+                computed['entities'] = {tipo: list(valores) for tipo, valores in computed['entities'].items()}
+            self._memo[feature] = computed
+
+        self._stats.total_ns += time.perf_counter_ns() - started
+        self._stats.features[feature] += 1
+
 class NLUProcessor:
     """Processador de Linguagem Natural para entender intenções do usuário"""
     
-    def __init__(self):
+    def __init__(self, memo_size: Optional[int] = None, memo_max_length: Optional[int] = None):
         self.intents = self._load_intents()
         self.entities = self._load_entities()
+        # Padrões compilados uma vez; o pré-filtro por literais evita rodar
+        # padrões que não têm como casar (ex.: mensagem "1")
+        self._intent_matcher = PatternMatcher(self.intents)
+        self._entity_matcher = PatternMatcher(self.entities)
+        self._stats: Dict[str, _NLUStateStats] = {}
+        
+        # Memo LRU por texto normalizado (features calculadas sob demanda, compartilhado entre turnos)
+        self.memo_size = settings.nlu_memo_size if memo_size is None else memo_size
+        self.memo_max_length = settings.nlu_memo_max_length if memo_max_length is None else memo_max_length
+        self._memo: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.memo_evictions = 0
+        self.warm_memo()
     
     def _load_intents(self) -> Dict[str, List[str]]:
         """Carrega padrões de intenções"""
@@ -92,40 +222,104 @@ class NLUProcessor:
             ]
         }
     
-    def process_message(self, message: str) -> Dict:
+    def process_message(self, message: str, needs: Optional[Iterable[str]] = None,
+                        state: Optional[str] = None) -> NLUResult:
         """
         Processa mensagem e extrai intenções e entidades
         
+        Args:
+            needs: Features calculadas já (ver NLU_FEATURES); as demais só
+                quando lidas. None calcula tudo (comportamento completo).
+            state: Estado da conversa, para as métricas de custo por estado
+        
         Returns:
-            Dict com intent, entities, is_greeting, is_farewell, confidence
+            Mapping com intent, entities, is_greeting, is_farewell, confidence
         """
-        # Normalizar mensagem
-        normalized = self._normalize_text(message)
-        
-        # Detectar intenção principal
-        intent, confidence = self._detect_intent(normalized)
+        stats = self._stats.get(state or "sem_estado")
+        if stats is None:
+            stats = self._stats[state or "sem_estado"] = _NLUStateStats()
+        stats.messages += 1
         
-        # Extrair entidades
-        entities = self._extract_entities(normalized)
+        result = NLUResult(self, message, stats)
+        for feature in (NLU_FEATURES if needs is None else needs):
+            result._compute(feature)
         
-        # Análise adicional
-        sentiment = self._analyze_sentiment(normalized)
-        is_question = self._is_question(normalized)
+        if needs is None:
+            logger.info(f"NLU Result: {result}")
+        return result
+    
+    def warm_memo(self, vocabulary: Iterable[str] = NLU_WARM_VOCABULARY) -> int:
+        """Pré-calcula todas as features do vocabulário (não conta nas métricas)"""
+        if self.memo_size <= 0:
+            return 0
+        contadores = (self.memo_hits, self.memo_misses)
+        aquecidas = 0
+        for message in vocabulary:
+            result = NLUResult(self, message, _NLUStateStats())
+            for feature in NLU_FEATURES:
+                result._compute(feature)
+            aquecidas += result._memo is not None
+        self.memo_hits, self.memo_misses = contadores
+        return aquecidas
+    
+    def _memo_entry(self, text: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Entrada do memo para o texto normalizado (None se não memoizável)"""
+        if self.memo_size <= 0 or len(text) > self.memo_max_length:
+            return None
+        entry = self._memo.get(text)
+        if entry is not None:
+            self.memo_hits += 1
+            self._memo.move_to_end(text)
+            return entry
+        self.memo_misses += 1
+        entry = self._memo[text] = {}
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+            self.memo_evictions += 1
+        return entry
+    
+    def process_batch(self, messages: Iterable[str], needs: Optional[Iterable[str]] = None,
+                      workers: int = 0, chunk_size: int = 500, state: str = "batch") -> Iterator[Dict[str, Any]]:
+        """
+        Processa mensagens em lote (backfills), devolvendo dicts em streaming na ordem de entrada
         
-        result = {
-            'original_message': message,
-            'normalized_message': normalized,
-            'intent': intent,
-            'confidence': confidence,
-            'entities': entities,
-            'sentiment': sentiment,
-            'is_question': is_question,
-            'is_greeting': intent == 'saudacao',
-            'is_farewell': intent == 'despedida'
+        Args:
+            needs: Features calculadas (None = todas); o dict traz só elas
+            workers: > 0 distribui lotes de chunk_size num pool de processos
+                (cada processo com o seu NLUProcessor e memo); 0 roda aqui
+        """
+        needs = tuple(NLU_FEATURES) if needs is None else tuple(needs)
+        if workers > 0:
+            yield from map_chunks(_process_batch_chunk, messages, chunk_size=chunk_size, workers=workers,
+                                  initializer=_init_batch_worker, initargs=(needs, state))
+            return
+        for message in messages:
+            yield self.process_message(message, needs=needs, state=state).computed()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Custo do NLU por estado da conversa"""
+        return {
+            state: {
+                "messages": stats.messages,
+                "avg_us": round(stats.total_ns / stats.messages / 1000, 2) if stats.messages else 0.0,
+                "total_ms": round(stats.total_ns / 1_000_000, 2),
+                "features": dict(stats.features),
+                "memo_hits": stats.memo_hits
+            }
+            for state, stats in self._stats.items()
+        }
+    
+    def get_memo_stats(self) -> Dict[str, Any]:
+        lookups = self.memo_hits + self.memo_misses
+        return {
+            "entries": len(self._memo),
+            "max_entries": self.memo_size,
+            "max_length": self.memo_max_length,
+            "hits": self.memo_hits,
+            "misses": self.memo_misses,
+            "hit_rate": round(self.memo_hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.memo_evictions
         }
-        
-        logger.info(f"NLU Result: {result}")
-        return result
     
     def _normalize_text(self, text: str) -> str:
         """Normaliza texto removendo acentos e padronizando"""
@@ -156,18 +350,15 @@ class NLUProcessor:
         best_intent = None
         best_confidence = 0.0
         
-        # Verificar cada intenção
-        for intent, patterns in self.intents.items():
-            for pattern in patterns:
-                if re.search(pattern, text, re.IGNORECASE):
-                    # Calcular confiança baseada no match
-                    match = re.search(pattern, text, re.IGNORECASE)
-                    match_ratio = len(match.group()) / len(text)
-                    confidence = min(match_ratio * 1.5, 1.0)  # Max 100%
-                    
-                    if confidence > best_confidence:
-                        best_intent = intent
-                        best_confidence = confidence
+        # Verificar cada intenção (padrões candidatos, na ordem declarada)
+        for intent, match in self._intent_matcher.search(text):
+            # Calcular confiança baseada no match
+            match_ratio = len(match.group()) / len(text)
+            confidence = min(match_ratio * 1.5, 1.0)  # Max 100%
+            
+            if confidence > best_confidence:
+                best_intent = intent
+                best_confidence = confidence
         
         # Se não encontrou intenção clara, tentar classificar por contexto
         if not best_intent:
@@ -196,18 +387,13 @@ class NLUProcessor:
     
     def _extract_entities(self, text: str) -> Dict[str, List[str]]:
         """Extrai entidades da mensagem"""
-        extracted = {}
+        found_by_type: Dict[str, List] = {}
         
-        for entity_type, patterns in self.entities.items():
-            matches = []
-            for pattern in patterns:
-                found = re.findall(pattern, text, re.IGNORECASE)
-                matches.extend(found)
-            
-            if matches:
-                extracted[entity_type] = list(set(matches))  # Remove duplicatas
+        for entity_type, found in self._entity_matcher.findall(text):
+            found_by_type.setdefault(entity_type, []).extend(found)
         
-        return extracted
+        return {entity_type: list(set(matches))  # Remove duplicatas
+                for entity_type, matches in found_by_type.items()}
     
     def _analyze_sentiment(self, text: str) -> str:
         """Analisa sentimento básico da mensagem"""
@@ -274,4 +460,15 @@ class NLUProcessor:
         elif 'amanhã' in text or 'amanha' in text:
             references.append({'type': 'relative', 'value': 'tomorrow'})
         
-        return references
\ No newline at end of file
+        return references
+
+# Lotes em pool de processos: um NLUProcessor por processo (criado no initializer)
+_batch_worker: Optional[Tuple[NLUProcessor, Tuple[str, ...], str]] = None
+
+def _init_batch_worker(needs: Tuple[str, ...], state: str):
+    global _batch_worker
+    _batch_worker = (NLUProcessor(), needs, state)
+
+def _process_batch_chunk(messages: List[str]) -> List[Dict[str, Any]]:
+    processor, needs, state = _batch_worker
+    return [processor.process_message(message, needs=needs, state=state).computed() for message in messages]
@@ -0,0 +1,211 @@
+import re
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+# Limite de literais por fator (produto cartesiano de alternativas)
+_MAX_LITERALS = 64
+
+class PatternMatcher:
+    """
+    Grupos de regex compilados uma vez com pré-filtro por literais
+
+    Para cada padrão são extraídos, do próprio regex, os literais dos quais
+    pelo menos um aparece em qualquer match (ex.: '\\b(oi|ola)\\b' -> {oi, ola}).
+    Uma única varredura do texto (lookahead com a trie dos literais) diz quais
+    literais ocorrem; só os padrões com literal presente são verificados,
+    cada um com um único search/findall. Padrões sem literal obrigatório
+    (ex.: '\\b\\d{11}\\b') sempre são verificados.
+
+    O resultado é idêntico a rodar re.search/re.findall em todos os padrões,
+    na mesma ordem de declaração.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]], flags: int = re.IGNORECASE):
+        self._patterns: List[Tuple[str, "re.Pattern"]] = []
+        pattern_literals: List[Optional[Set[str]]] = []
+
+        fold = (lambda lit: lit.lower()) if flags & re.IGNORECASE else (lambda lit: lit)
+        for name, patterns in groups.items():
+            for pattern in patterns:
+                self._patterns.append((name, re.compile(pattern, flags)))
+                factors = _necessary_literals(pattern, flags)
+                pattern_literals.append({fold(lit) for lit in factors} if factors is not None else None)
+
+        self._always: FrozenSet[int] = frozenset(i for i, f in enumerate(pattern_literals) if f is None)
+
+        literals = sorted(set().union(*(f for f in pattern_literals if f)))
+        self._gate: Optional["re.Pattern"] = None
+        self._hits: Dict[int, FrozenSet[int]] = {}
+        if literals:
+            gate, terminals = _trie_regex(literals)
+            self._gate = re.compile(f"(?={gate})", flags)
+            for group, literal in terminals.items():
+                # O lookahead reporta o maior literal na posição; os prefixos dele também ocorrem
+                cobertos = {lit for lit in literals if literal.startswith(lit)}
+                self._hits[group] = frozenset(i for i, f in enumerate(pattern_literals) if f and f & cobertos)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def candidates(self, text: str) -> List[int]:
+        """Índices (em ordem de declaração) dos padrões que podem casar com o texto"""
+        selected = set(self._always)
+        if self._gate is not None:
+            for match in self._gate.finditer(text):
+                selected |= self._hits[match.lastindex]
+        return sorted(selected)
+
+    def search(self, text: str) -> Iterator[Tuple[str, "re.Match"]]:
+        """(grupo, primeiro match) de cada padrão que casa, em ordem de declaração"""
+        for index in self.candidates(text):
+            name, compiled = self._patterns[index]
+            match = compiled.search(text)
+            if match:
+                yield name, match
+
+    def findall(self, text: str) -> Iterator[Tuple[str, list]]:
+        """(grupo, re.findall) de cada padrão com ocorrência, em ordem de declaração"""
+        for index in self.candidates(text):
+            name, compiled = self._patterns[index]
+            found = compiled.findall(text)
+            if found:
+                yield name, found
+
+def _trie_regex(literals: List[str]) -> Tuple[str, Dict[int, str]]:
+    """
+    Regex em forma de trie dos literais: em cada posição percorre um único
+    caminho (não testa os literais um a um). Cada literal termina num grupo
+    vazio; o maior literal casado é o último grupo fechado (lastindex).
+    """
+    trie: Dict = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[None] = literal
+
+    terminals: Dict[int, str] = {}
+
+    def emit(node) -> str:
+        prefix = ""
+        if None in node:
+            terminals[len(terminals) + 1] = node[None]
+            prefix = "()"
+        children = [re.escape(char) + emit(child) for char, child in node.items() if char is not None]
+        if not children:
+            return prefix
+        body = "(?:" + "|".join(children) + ")"
+        return prefix + body + "?" if prefix else body
+
+    return emit(trie), terminals
+
+# Extração de literais obrigatórios a partir da árvore do sre_parse.
+# Qualquer construção não reconhecida vira None (padrão sempre verificado).
+
+def _necessary_literals(pattern: str, flags: int) -> Optional[Set[str]]:
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+    if (parsed.state.flags & ~flags) & re.IGNORECASE:
+        return None  # (?i) no padrão: o pré-filtro compilado sem ele seria mais restrito
+    return _factors(list(parsed))
+
+def _factors(items) -> Optional[Set[str]]:
+    """Conjunto de literais dos quais ao menos um ocorre em todo match da sequência"""
+    candidates = []
+    run = {""}
+    for op, av in items:
+        exact = _exact_item(op, av)
+        if exact is not None:
+            combined = {a + b for a in run for b in exact}
+            if len(combined) <= _MAX_LITERALS:
+                run = combined
+                continue
+            candidates.append(run)
+            run = exact
+            continue
+        candidates.append(run)
+        run = {""}
+        sub = _factors_item(op, av)
+        if sub is not None:
+            candidates.append(sub)
+    candidates.append(run)
+
+    valid = [c for c in candidates if c and "" not in c]
+    if not valid:
+        return None
+    # Mais seletivo: maior literal mínimo, depois menos alternativas
+    return max(valid, key=lambda c: (min(map(len, c)), -len(c)))
+
+def _factors_item(op, av) -> Optional[Set[str]]:
+    if op is sre_constants.SUBPATTERN:
+        return None if av[1] else _factors(av[-1])
+    if op is sre_constants.BRANCH:
+        union: Set[str] = set()
+        for branch in av[1]:
+            sub = _factors(branch)
+            if sub is None:
+                return None
+            union |= sub
+        return union
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+        return _factors(av[2])
+    return None
+
+def _exact(items) -> Optional[Set[str]]:
+    """Conjunto finito de strings que a sequência casa (None se infinito ou grande demais)"""
+    result = {""}
+    for op, av in items:
+        exact = _exact_item(op, av)
+        if exact is None:
+            return None
+        result = {a + b for a in result for b in exact}
+        if len(result) > _MAX_LITERALS:
+            return None
+    return result
+
+def _exact_item(op, av) -> Optional[Set[str]]:
+    if op is sre_constants.LITERAL:
+        return {chr(av)}
+    if op is sre_constants.AT:
+        return {""}  # Âncoras não consomem texto
+    if op is sre_constants.IN:
+        chars = set()
+        for item_op, item_av in av:
+            if item_op is not sre_constants.LITERAL:
+                return None
+            chars.add(chr(item_av))
+        return chars
+    if op is sre_constants.SUBPATTERN:
+        return None if av[1] else _exact(av[-1])  # Flags locais (?i:...): sem literal
+    if op is sre_constants.BRANCH:
+        union: Set[str] = set()
+        for branch in av[1]:
+            exact = _exact(branch)
+            if exact is None:
+                return None
+            union |= exact
+        return union if len(union) <= _MAX_LITERALS else None
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        low, high, item = av
+        if high == sre_constants.MAXREPEAT or high > 3:
+            return None
+        base = _exact(item)
+        if base is None:
+            return None
+        result: Set[str] = set()
+        current = {""}
+        for count in range(high + 1):
+            if count >= low:
+                result |= current
+            current = {a + b for a in current for b in base}
+            if len(result) > _MAX_LITERALS or len(current) > _MAX_LITERALS:
+                return None
+        return result
+    return None
@@ -0,0 +1,83 @@
+import asyncio
+import copy
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class _FlightStats:
+    __slots__ = ("calls", "upstream", "coalesced")
+
+    def __init__(self):
+        self.calls = 0
+        self.upstream = 0
+        self.coalesced = 0
+
+class SingleFlight:
+    """
+    Coalescência de requisições idênticas em andamento
+
+    Chamadas concorrentes com a mesma chave compartilham uma única execução.
+    Quem iniciou a execução recebe o objeto retornado por fn; os chamadores
+    coalescidos recebem uma cópia profunda, para que alterar o resultado
+    (ex.: o dict do paciente, também guardado no TTLCache) não afete os outros.
+    A execução roda em uma task própria: cancelar um chamador (ex.: timeout
+    do webhook) não cancela os demais que aguardam o mesmo resultado.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._stats: Dict[str, _FlightStats] = {}
+
+    async def do(self, key: Optional[Hashable], fn: Callable[[], Awaitable[Any]], label: str = "default") -> Any:
+        """
+        Executa fn ou aguarda a execução idêntica já em andamento
+
+        Args:
+            key: Chave de coalescência; None executa sem coalescer (só contabiliza)
+            fn: Fábrica da corrotina a executar
+            label: Rótulo das métricas (ex.: endpoint sem dados sensíveis)
+        """
+        stats = self._stats.get(label)
+        if stats is None:
+            stats = self._stats[label] = _FlightStats()
+        stats.calls += 1
+
+        if key is None:
+            stats.upstream += 1
+            return await fn()
+
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            stats.coalesced += 1
+            logger.debug(f"🔗 {self.name}: requisição coalescida ({label})")
+            return copy.deepcopy(await asyncio.shield(task))
+
+        stats.upstream += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Exceção já foi entregue aos chamadores; evita aviso de "never retrieved"
+            logger.debug(f"{self.name}: execução falhou: {task.exception()}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Chamadas, requisições upstream e taxa de coalescência por rótulo"""
+        return {
+            "inflight": len(self._inflight),
+            "endpoints": {
+                label: {
+                    "calls": s.calls,
+                    "upstream": s.upstream,
+                    "coalesced": s.coalesced,
+                    "coalescing_ratio": round(s.coalesced / s.calls, 4) if s.calls else 0.0
+                }
+                for label, s in self._stats.items()
+            }
+        }
@@ -0,0 +1,142 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NEGATIVE = object()  # Marca "consultado e não existe"
+
+class _CacheEntry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+class TTLCache:
+    """
+    Cache LRU limitado com TTL por chave, teto de memória e cache negativo
+
+    Tamanho das entradas é estimado pelo JSON serializado (suficiente para
+    os dicts/listas das APIs). Pensado para uso em um único event loop.
+    Os valores são devolvidos como foram guardados (sem cópia): quem lê
+    não deve alterá-los.
+    """
+
+    def __init__(self, name: str = "ttl_cache", max_entries: int = 5000, default_ttl: float = 300,
+                 negative_ttl: float = 60, max_bytes: int = 5_000_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+        # Métricas
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Busca a chave
+
+        Returns:
+            (encontrado, valor); entrada negativa retorna (True, None)
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        if entry.value is _NEGATIVE:
+            self.negative_hits += 1
+            return True, None
+
+        self.hits += 1
+        return True, entry.value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        found, value = self.lookup(key)
+        return value if found else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Armazena valor com TTL próprio (ou o padrão)"""
+        self._store(key, value, self.default_ttl if ttl is None else ttl)
+
+    def set_negative(self, key: Hashable, ttl: Optional[float] = None):
+        """Registra que a chave não existe na origem (evita reconsultar)"""
+        self._store(key, _NEGATIVE, self.negative_ttl if ttl is None else ttl)
+
+    def delete(self, key: Hashable):
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"⚠️ {self.name}: valor de {size} bytes maior que o teto, não cacheado")
+            self.delete(key)
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = _CacheEntry(value, self._clock() + ttl, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        if value is _NEGATIVE:
+            return 0
+        try:
+            return len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return len(repr(value))
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
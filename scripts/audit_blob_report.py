@@ -0,0 +1,144 @@
+"""
+Relatório de economia: payloads de auditoria endereçados por conteúdo (audit_blobs)
+
+Percorre patient_transactions e decision_logs e compara o tamanho dos
+payloads (contexto carregado/atualizado, resposta da API, contexto da
+decisão) gravados inline em cada linha com o armazenamento deduplicado:
+cada payload distinto uma vez em audit_blobs + um hash de 64 bytes por
+referência. Linhas novas já gravam só o hash; as antigas (inline) entram
+na conta como estão. Com --apply as linhas antigas são migradas: payloads
+para audit_blobs, colunas inline zeradas. As colunas *_hash são criadas na
+inicialização da aplicação (migrate_audit_schema); --apply também garante.
+
+Uso:
+    python scripts/audit_blob_report.py            # mede
+    python scripts/audit_blob_report.py --apply    # migra as linhas antigas
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.models.patient_transaction import AuditBlob, DecisionLog, PatientTransaction, migrate_audit_schema  # noqa: E402
+from app.services.audit_blobs import canonical_payload, get_audit_blob_store  # noqa: E402
+
+_HASH_BYTES = 64
+_CAMPOS = (
+    (PatientTransaction, ("context_loaded", "context_updated", "api_response")),
+    (DecisionLog, ("context_used",)),
+)
+
+def _tem_colunas(engine) -> bool:
+    from sqlalchemy import inspect
+    inspector = inspect(engine)
+    if not inspector.has_table(AuditBlob.__tablename__):
+        return False
+    for model, campos in _CAMPOS:
+        existentes = {coluna["name"] for coluna in inspector.get_columns(model.__tablename__)}
+        if any(f"{campo}_hash" not in existentes for campo in campos):
+            return False
+    return True
+
+class _Relatorio:
+    def __init__(self):
+        self.referencias = defaultdict(int)
+        self.bytes_inline = defaultdict(int)
+        self.unicos = {}  # hash -> tamanho
+
+    def contar(self, campo: str, digest: str, tamanho: int):
+        self.referencias[campo] += 1
+        self.bytes_inline[campo] += tamanho
+        self.unicos[digest] = tamanho
+
+    def imprimir(self):
+        total_refs = sum(self.referencias.values())
+        if not total_refs:
+            print("Nenhum payload de auditoria")
+            return
+        print(f"{'campo':<18}{'payloads':>10}{'bytes inline':>16}")
+        for campo, refs in self.referencias.items():
+            print(f"{campo:<18}{refs:>10}{self.bytes_inline[campo]:>16}")
+        inline = sum(self.bytes_inline.values())
+        dedup = sum(self.unicos.values()) + total_refs * _HASH_BYTES
+        print(f"inline: {inline} bytes em {total_refs} payloads")
+        print(f"deduplicado: {dedup} bytes ({len(self.unicos)} blobs + {total_refs} hashes)")
+        print(f"economia: {1 - dedup / inline:.1%}" if inline else "economia: 0.0%")
+
+def _varrer(session, model, campos, batch, relatorio, com_hash, aplicar, store):
+    colunas = [model.id] + [getattr(model, campo) for campo in campos]
+    if com_hash:
+        colunas += [getattr(model, f"{campo}_hash") for campo in campos]
+    ultimo_id = ""
+    migradas = 0
+    while True:
+        # Lotes por chave (commit no meio de um cursor aberto não é seguro)
+        lote = (session.query(*colunas).filter(model.id > ultimo_id)
+                .order_by(model.id).limit(batch).all())
+        if not lote:
+            return migradas
+        ultimo_id = lote[-1][0]
+
+        referenciados = [row[1 + len(campos) + i] for row in lote for i in range(len(campos))] if com_hash else []
+        tamanhos = dict(session.query(AuditBlob.hash, AuditBlob.size_bytes)
+                        .filter(AuditBlob.hash.in_({h for h in referenciados if h}))) if com_hash else {}
+
+        blobs, updates = {}, []
+        for row in lote:
+            update = {}
+            for i, campo in enumerate(campos):
+                digest = row[1 + len(campos) + i] if com_hash else None
+                if digest and digest in tamanhos:
+                    relatorio.contar(campo, digest, tamanhos[digest])
+                    continue
+                payload = row[1 + i]
+                if not payload:
+                    continue
+                digest, conteudo, tamanho = canonical_payload(payload)
+                relatorio.contar(campo, digest, tamanho)
+                if aplicar:
+                    blobs.setdefault(digest, dict(hash=digest, content=conteudo, size_bytes=tamanho))
+                    update.update({campo: None, f"{campo}_hash": digest})
+            if update:
+                updates.append(dict(id=row[0], **update))
+
+        if aplicar and updates:
+            salvos = store.save(session, blobs.values())
+            session.bulk_update_mappings(model, updates)
+            session.commit()
+            store.remember(salvos)
+            migradas += len(updates)
+        session.expire_all()
+
+def main():
+    parser = argparse.ArgumentParser(description="Economia dos payloads de auditoria deduplicados")
+    parser.add_argument("--apply", action="store_true", help="Migra os payloads inline para audit_blobs")
+    parser.add_argument("--batch", type=int, default=500, help="Linhas por leitura/commit")
+    args = parser.parse_args()
+
+    from app.models.database import SessionLocal, engine
+    if SessionLocal is None:
+        parser.error("banco indisponível (configure DATABASE_URL)")
+
+    if args.apply:
+        migrate_audit_schema(engine)
+    com_hash = _tem_colunas(engine)
+
+    session = SessionLocal()
+    try:
+        relatorio = _Relatorio()
+        store = get_audit_blob_store()
+        migradas = 0
+        for model, campos in _CAMPOS:
+            migradas += _varrer(session, model, campos, args.batch, relatorio, com_hash, args.apply, store)
+
+        relatorio.imprimir()
+        if args.apply:
+            print(f"✅ {migradas} linhas migradas para audit_blobs")
+        else:
+            print("(medição apenas; use --apply para migrar)")
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: decisões por segundo do IntelligentDecisionEngine
+
+Compara a avaliação completa a cada chamada (memoize=False) com o plano
+memorizado pela assinatura dos fatores (só memo, aquecendo em execução) e
+com a tabela pré-compilada carregada na inicialização. Antes de medir
+confere que as decisões são idênticas. Os logs por decisão ficam
+desligados para medir só o motor.
+
+Uso:
+    python scripts/bench_decision_engine.py --decisions 50000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.models.patient_transaction import TransactionStage, ValidationResult  # noqa: E402
+from app.services.decision_engine import IntelligentDecisionEngine  # noqa: E402
+
+_PACIENTES = [
+    None,
+    {"nome": "Maria Aparecida da Silva", "cpf": "12345678901"},
+    {"nome": "Maria Aparecida da Silva", "cpf": "12345678901", "telefone": "(31) 99999-0000",
+     "email": "maria.silva@example.com", "data_nascimento": "1985-03-12"},
+]
+
+def _cenarios(total: int):
+    random.seed(7)
+    return [dict(
+        current_stage=random.choice(list(TransactionStage)),
+        user_input=random.choice(["1", "2", "12345678909", "sim", "quero agendar uma consulta"]),
+        context={"acao": random.choice(["agendar", "visualizar", "agendar"])},
+        patient_data=random.choice(_PACIENTES),
+        validation_result=random.choice([None, ValidationResult.PASSOU, ValidationResult.PASSOU, ValidationResult.FALHOU]),
+        errors=random.choice([[], [], [], ["CPF inválido"]]),
+        warnings=random.choice([[], ["Telefone desatualizado"]]),
+    ) for _ in range(total)]
+
+def _resumo(result):
+    return (result.chosen_decision, result.confidence, result.reason, result.decision_path,
+            result.suggested_action, result.fallback_action,
+            [(alt.decision_type, alt.confidence_score) for alt in result.alternatives])
+
+def _medir(engine, cenarios):
+    started = time.perf_counter()
+    for cenario in cenarios:
+        engine.analyze_and_decide(**cenario)
+    elapsed = time.perf_counter() - started
+    return len(cenarios) / elapsed, elapsed / len(cenarios) * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="Decisões por segundo do motor de decisão")
+    parser.add_argument("--decisions", type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    cenarios = _cenarios(args.decisions)
+
+    completo, tabela = IntelligentDecisionEngine(memoize=False), IntelligentDecisionEngine()
+    for cenario in cenarios[:2000]:
+        assert _resumo(completo.analyze_and_decide(**cenario)) == _resumo(tabela.analyze_and_decide(**cenario)), cenario
+    print("✅ decisões idênticas com e sem tabela")
+
+    print(f"{args.decisions} decisões")
+    base = None
+    variantes = (
+        ("completo", IntelligentDecisionEngine(memoize=False)),
+        ("memo", IntelligentDecisionEngine(decision_table=None)),
+        ("tabela", IntelligentDecisionEngine()),
+    )
+    for nome, engine in variantes:
+        throughput, us = _medir(engine, cenarios)
+        base = base or throughput
+        print(f"{nome:<12} {throughput:>10.0f} decisões/s {us:>8.1f} µs/decisão  {throughput / base:.1f}x")
+    print(f"tabela: {engine.get_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: custo de despacho por turno (antes do handler rodar)
+
+Compara o despacho antigo do ConversationManager (dict de handlers montado a
+cada mensagem + checagem de 'expecting' repetida dentro de cada handler)
+com a tabela compilada de app/services/state_machine.py (lookup do estado,
+expecting, validação da entrada e checagem da transição).
+Os handlers são no-op: mede só o overhead do despacho.
+
+Uso:
+    python scripts/bench_state_dispatch.py --turns 200000
+"""
+import argparse
+import asyncio
+import functools
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.state_machine import STATE_GRAPH, StateDispatcher  # noqa: E402
+
+# Estado, expecting no contexto e mensagem típicos de um fluxo de agendamento
+_TURNOS = [
+    ("inicio", None, "oi"),
+    ("menu_principal", "menu_option", "1"),
+    ("aguardando_cpf", "cpf", "123.456.789-01"),
+    ("confirmando_paciente", "confirmacao_paciente", "1"),
+    ("escolhendo_data", "escolha_data", "3"),
+    ("escolhendo_horario", "escolha_horario", "2"),
+    ("confirmando_agendamento", "confirmacao_agendamento", "1"),
+    ("visualizando_agendamentos", None, "0"),
+]
+
+class _Conversa:
+    __slots__ = ("state", "context")
+
+    def __init__(self, state, expecting):
+        self.state = state
+        self.context = {"expecting": expecting} if expecting else {}
+
+class _Manager:
+    """Handlers no-op com os mesmos nomes do ConversationManager"""
+
+    def __init__(self):
+        async def _noop(phone, message, conversa, db, nlu_result):
+            return None
+
+        for spec in STATE_GRAPH.values():
+            if spec.get("handler"):
+                setattr(self, spec["handler"], _noop)
+        self._handle_estado_desconhecido = _noop
+
+    def _legado_expecting(self, conversa, aceitos):
+        # Igual ao bloco que cada handler repetia no início
+        expecting = conversa.context.get("expecting")
+        return not (expecting and expecting not in aceitos)
+
+    async def despacho_legado(self, phone, message, conversa):
+        estado = conversa.state or "inicio"
+        handlers = {
+            "inicio": self._handle_inicio,
+            "menu_principal": self._handle_menu_principal,
+            "aguardando_cpf": self._handle_cpf,
+            "confirmando_paciente": self._handle_confirmacao_paciente,
+            "paciente_nao_encontrado": self._handle_paciente_nao_encontrado_opcoes,
+            "escolhendo_data": self._handle_escolha_data,
+            "escolhendo_horario": self._handle_escolha_horario,
+            "confirmando_agendamento": self._handle_confirmacao,
+            "visualizando_agendamentos": self._handle_visualizar_agendamentos,
+            "lista_espera": self._handle_lista_espera,
+            "agendamento_sem_dias": self._handle_agendamento_sem_dias,
+            "data_sem_horarios": self._handle_data_sem_horarios,
+            "finalizada": self._handle_conversa_finalizada
+        }
+        handler = handlers.get(estado, self._handle_estado_desconhecido)
+        handler_name = handler.__name__ if hasattr(handler, '__name__') else str(handler)
+        if estado == "menu_principal" and not self._legado_expecting(conversa, ["menu_option", None]):
+            return handler_name
+        if estado == "aguardando_cpf" and not self._legado_expecting(conversa, ["cpf", None, "menu_option"]):
+            return handler_name
+        if estado == "escolhendo_data" and not self._legado_expecting(conversa, ["escolha_data", None]):
+            return handler_name
+        if estado == "escolhendo_horario" and not self._legado_expecting(conversa, ["escolha_horario", None]):
+            return handler_name
+        if estado == "confirmando_agendamento" and not self._legado_expecting(conversa, ["confirmacao_agendamento", None]):
+            return handler_name
+        await handler(phone, message, conversa, None, None)
+        return handler_name
+
+    async def despacho_compilado(self, dispatcher, phone, message, conversa, validar=True):
+        spec, handler = dispatcher.route(conversa.state)
+        handler_name = handler.__name__ if hasattr(handler, '__name__') else str(handler)
+        if spec is not None:
+            if not spec.accepts_expecting(conversa.context.get("expecting")):
+                return handler_name
+            if validar:
+                dispatcher.check_input(spec, message)
+        await handler(phone, message, conversa, None, None)
+        if validar and spec is not None:
+            dispatcher.check_transition(spec, conversa.state)
+        return handler_name
+
+async def _medir(despachar, turnos):
+    started = time.perf_counter()
+    for conversa, message in turnos:
+        await despachar("5531999990000", message, conversa)
+    return (time.perf_counter() - started) / len(turnos) * 1_000_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead de despacho por turno")
+    parser.add_argument("--turns", type=int, default=200000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(7)
+    turnos = [(_Conversa(estado, expecting), message)
+              for estado, expecting, message in (random.choice(_TURNOS) for _ in range(args.turns))]
+
+    manager = _Manager()
+    dispatcher = StateDispatcher(manager, fallback="_handle_estado_desconhecido")
+
+    variantes = {
+        "legado": manager.despacho_legado,
+        # Mesmo trabalho do legado: achar o handler e checar o expecting
+        "compilado": functools.partial(manager.despacho_compilado, dispatcher, validar=False),
+        # + validação da entrada e checagem da transição (o legado não fazia)
+        "compilado+validação": functools.partial(manager.despacho_compilado, dispatcher),
+    }
+    resultados = {nome: [] for nome in variantes}
+    for _ in range(args.rounds):
+        for nome, despachar in variantes.items():
+            resultados[nome].append(asyncio.run(_medir(despachar, turnos)))
+
+    print(f"{args.turns} turnos x {args.rounds} rodadas (handlers no-op)")
+    legado = statistics.median(resultados["legado"])
+    for nome, valores in resultados.items():
+        mediana = statistics.median(valores)
+        print(f"{nome:<22} {mediana:>8.0f} ns/turno (mediana)  {mediana / legado - 1:+.1%} vs legado")
+    print(f"estatísticas do dispatcher: {dispatcher.get_stats()}")
+
+if __name__ == "__main__":
+    main()
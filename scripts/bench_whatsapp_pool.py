@@ -0,0 +1,106 @@
+"""
+Benchmark: latência por turno da conversa pelo WhatsAppService, com
+conexão nova por chamada vs. HTTPClientPool com keep-alive
+
+Um turno de agendamento faz ~3 chamadas à Z-API (read-message, send-typing,
+send-text), aqui feitas pelos métodos reais do WhatsAppService. O cenário
+"sem reuso" usa o mesmo HTTPClientPool com max_keepalive_connections=0
+(cada chamada abre conexão, como o cliente criado por chamada de antes).
+Por padrão sobe um servidor HTTP local que simula o custo do handshake em
+cada conexão nova (--handshake-ms); use --url para medir contra a base de
+uma instância real (.../instances/{id}/token/{token}).
+
+Uso:
+    python scripts/bench_whatsapp_pool.py --turns 50 --handshake-ms 80
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.whatsapp import WhatsAppService  # noqa: E402
+from app.utils import http_clients  # noqa: E402
+from app.utils.http_clients import HTTPClientPool  # noqa: E402
+
+CALLS_PER_TURN = 3
+PHONE = "5531999999999"
+
+async def _handle_connection(reader, writer, handshake_ms: float):
+    # Custo de TCP+TLS pago uma vez por conexão
+    await asyncio.sleep(handshake_ms / 1000)
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in request.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            body = b'{"ok": true}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def _turn(service: WhatsAppService, i: int):
+    started = time.perf_counter()
+    await service.mark_as_read(PHONE, f"msg-{i}")
+    await service.send_typing(PHONE)
+    await service.send_text(PHONE, "Horários disponíveis para 20/10:", delay_message=0)
+    return (time.perf_counter() - started) * 1000
+
+async def _run(pool: HTTPClientPool, base_url: str, turns: int):
+    # Instala o pool como o singleton usado pelo serviço
+    http_clients._http_client_pool = pool
+    service = WhatsAppService()
+    service.base_url = base_url
+    try:
+        return [await _turn(service, i) for i in range(turns)]
+    finally:
+        await pool.aclose()
+
+def _summary(label: str, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} p50={statistics.median(samples):8.2f}ms  p95={p95:8.2f}ms  média={statistics.mean(samples):8.2f}ms")
+
+async def main(args):
+    logging.disable(logging.INFO)
+    server = None
+    base_url = args.url.rstrip("/")
+    if not base_url:
+        server = await asyncio.start_server(
+            lambda r, w: _handle_connection(r, w, args.handshake_ms), "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        base_url = f"http://127.0.0.1:{port}/instances/bench/token/bench"
+
+    before = await _run(HTTPClientPool(max_keepalive_connections=0, http2=False), base_url, args.turns)
+    after = await _run(HTTPClientPool(), base_url, args.turns)
+
+    print(f"Turnos: {args.turns} ({CALLS_PER_TURN} chamadas por turno) -> {base_url}")
+    _summary("Conexão nova por chamada", before)
+    _summary("HTTPClientPool (keep-alive)", after)
+    print(f"Ganho na mediana: {statistics.median(before) / statistics.median(after):.1f}x")
+
+    if server:
+        server.close()
+        await server.wait_closed()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pool HTTP da Z-API")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--handshake-ms", type=float, default=60.0,
+                        help="Atraso simulado por conexão nova no servidor local")
+    parser.add_argument("--url", default="", help="Base real da instância Z-API em vez do servidor local")
+    asyncio.run(main(parser.parse_args()))
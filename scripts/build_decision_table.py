@@ -0,0 +1,48 @@
+"""
+Gera app/services/decision_table.json: o plano de decisão de cada assinatura
+de fatores (espaço finito), avaliado pelo caminho interpretado do
+IntelligentDecisionEngine. O motor carrega a tabela na inicialização e só
+avalia dinamicamente o que não estiver nela. A tabela guarda o hash das
+definições das regras em decision_engine.py (comentários não contam): depois
+de alterar as regras, rode de novo.
+
+Uso:
+    python scripts/build_decision_table.py
+    python scripts/build_decision_table.py --check   # falha se a tabela estiver desatualizada
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.decision_engine import DECISION_TABLE_PATH, IntelligentDecisionEngine  # noqa: E402
+
+def render_table() -> str:
+    """JSON com uma assinatura por linha (diffs legíveis quando as regras mudam)"""
+    table = IntelligentDecisionEngine(memoize=False, decision_table=None).compile_decision_table()
+    entries = ",\n".join("  " + json.dumps(entry, ensure_ascii=False) for entry in table["entries"])
+    return f'{{\n "fingerprint": {json.dumps(table["fingerprint"])},\n "entries": [\n{entries}\n ]\n}}\n'
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-compila a tabela de decisão")
+    parser.add_argument("--check", action="store_true", help="Só confere se a tabela em disco está atualizada")
+    parser.add_argument("--output", default=DECISION_TABLE_PATH)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rendered = render_table()
+    if args.check:
+        current = open(args.output, encoding="utf-8").read() if os.path.exists(args.output) else ""
+        if current != rendered:
+            sys.exit(f"❌ {args.output} desatualizada; rode scripts/build_decision_table.py")
+        print(f"✅ {args.output} atualizada")
+        return
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        output.write(rendered)
+    print(f"✅ {len(json.loads(rendered)['entries'])} assinaturas gravadas em {args.output}")
+
+if __name__ == "__main__":
+    main()
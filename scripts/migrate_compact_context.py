@@ -0,0 +1,125 @@
+"""
+Migração: Conversation.context do formato antigo (payloads da API embutidos)
+para o esquema compacto de app/services/conversation_context.py
+
+Mede tamanho da linha (JSON serializado) e tempo de serialização/parse
+antes e depois. Sem --apply só mede; com --apply grava em lotes.
+Linhas não migradas continuam funcionando: o ConversationManager compacta
+o contexto antigo no primeiro turno.
+
+Uso:
+    python scripts/migrate_compact_context.py              # mede as linhas do banco
+    python scripts/migrate_compact_context.py --apply      # migra
+    python scripts/migrate_compact_context.py --sample     # mede um contexto típico de agendamento
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.conversation_context import compact_context, is_legacy  # noqa: E402
+
+def _tamanho(contexto) -> int:
+    return len(json.dumps(contexto, ensure_ascii=False, default=str).encode("utf-8"))
+
+def _tempo_serializacao_us(contexto, repeticoes: int) -> float:
+    """Custo de um turno: serializar para a coluna e ler de volta"""
+    started = time.perf_counter()
+    for _ in range(repeticoes):
+        json.loads(json.dumps(contexto, ensure_ascii=False, default=str))
+    return (time.perf_counter() - started) / repeticoes * 1_000_000
+
+def _contexto_exemplo():
+    """Contexto antigo no passo 'confirmando_agendamento' (paciente + 7 dias + 8 horários)"""
+    paciente = {
+        "id": 48213, "nome": "Maria Aparecida da Silva", "cpf": "12345678901",
+        "telefone": "(31) 99999-0000", "email": "maria.silva@example.com",
+        "data_nascimento": "1985-03-12", "sexo": "F", "convenio": "Particular",
+        "endereco": "Rua das Flores, 123 - Centro - Belo Horizonte/MG"
+    }
+    inicio = date.today() + timedelta(days=1)
+    dias = [{"data": (inicio + timedelta(days=i)).isoformat(), "disponivel": True,
+             "dia_semana": (inicio + timedelta(days=i)).strftime("%A")} for i in range(7)]
+    horarios = [{"horario": f"{8 + i // 2:02d}:{30 * (i % 2):02d}", "disponivel": True} for i in range(8)]
+    return {
+        "acao": "agendar",
+        "paciente": paciente,
+        "dias_disponiveis": dias,
+        "data_escolhida": dias[2],
+        "horarios_disponiveis": horarios,
+        "horario_escolhido": horarios[3],
+        "expecting": "confirmacao_agendamento"
+    }
+
+def _relatorio(pares, repeticoes: int):
+    antes = [_tamanho(a) for a, _ in pares]
+    depois = [_tamanho(d) for _, d in pares]
+    t_antes = [_tempo_serializacao_us(a, repeticoes) for a, _ in pares]
+    t_depois = [_tempo_serializacao_us(d, repeticoes) for _, d in pares]
+
+    print(f"{len(pares)} contextos")
+    print(f"{'':<10}{'bytes méd':>12}{'bytes máx':>12}{'serialização méd':>20}")
+    print(f"{'antes':<10}{statistics.mean(antes):>12.0f}{max(antes):>12}{statistics.mean(t_antes):>17.1f} µs")
+    print(f"{'depois':<10}{statistics.mean(depois):>12.0f}{max(depois):>12}{statistics.mean(t_depois):>17.1f} µs")
+    reducao = 1 - sum(depois) / sum(antes) if sum(antes) else 0.0
+    print(f"redução de tamanho: {reducao:.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra Conversation.context para o esquema compacto")
+    parser.add_argument("--apply", action="store_true", help="Grava os contextos migrados")
+    parser.add_argument("--sample", action="store_true", help="Mede um contexto típico em vez do banco")
+    parser.add_argument("--batch", type=int, default=500, help="Linhas por commit no --apply")
+    parser.add_argument("--repeticoes", type=int, default=2000, help="Repetições na medição de tempo")
+    args = parser.parse_args()
+
+    if args.sample:
+        legado = _contexto_exemplo()
+        _relatorio([(legado, compact_context(copy.deepcopy(legado)))], args.repeticoes)
+        return
+
+    from app.models.database import SessionLocal, Conversation
+    if SessionLocal is None:
+        parser.error("banco indisponível (configure DATABASE_URL)")
+
+    session = SessionLocal()
+    try:
+        pares = []
+        migradas = 0
+        ultimo_id = ""
+        while True:
+            # Lotes por chave (commit no meio de um cursor aberto não é seguro)
+            lote = (session.query(Conversation).filter(Conversation.id > ultimo_id)
+                    .order_by(Conversation.id).limit(args.batch).all())
+            if not lote:
+                break
+            ultimo_id = lote[-1].id
+            for conversa in lote:
+                if not is_legacy(conversa.context):
+                    continue
+                compacto = compact_context(copy.deepcopy(conversa.context))
+                pares.append((conversa.context, compacto))
+                if args.apply:
+                    conversa.context = compacto
+                    migradas += 1
+            if args.apply:
+                session.commit()
+
+        if not pares:
+            print("Nenhum contexto no formato antigo")
+            return
+
+        _relatorio(pares, args.repeticoes)
+        if args.apply:
+            print(f"✅ {migradas} conversas migradas")
+        else:
+            print("(medição apenas; use --apply para migrar)")
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Reclassificação em massa do ConversationDashboard (tags, prioridade, sentimento, resumo)
+
+Lê as conversas em lotes por chave, classifica com
+ConversationClassifier.classify_batch (em streaming; com --workers os lotes
+vão para um pool de processos) e grava os resultados junto com o estado
+incremental (classifier_state), para que as próximas análises só
+processem as mensagens novas. Sem --apply só classifica e mede o
+throughput. Conversas PENDING que precisam de atenção passam para
+REQUIRES_ATTENTION. Com --apply a coluna classifier_state é criada em
+bancos anteriores a ela (create_all não altera tabelas existentes).
+
+Uso:
+    python scripts/reclassify_dashboard.py                    # mede
+    python scripts/reclassify_dashboard.py --apply --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.classifier import ConversationClassifier  # noqa: E402
+
+def _garantir_coluna(engine, dashboard):
+    """Cria a coluna classifier_state em tabelas anteriores a ela"""
+    from sqlalchemy import inspect, text
+    tabela = dashboard.__tablename__
+    existentes = {coluna["name"] for coluna in inspect(engine).get_columns(tabela)}
+    if "classifier_state" not in existentes:
+        tipo = dashboard.__table__.c.classifier_state.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN classifier_state {tipo}"))
+
+def _conversas(session, dashboard, message_model, batch: int, limit: int, ids: deque):
+    """Mensagens de cada conversa, em lotes por chave; anota o id de cada uma em ids"""
+    ultimo_id = ""
+    lidas = 0
+    while not limit or lidas < limit:
+        tamanho = min(batch, limit - lidas) if limit else batch
+        lote = [row_id for (row_id,) in session.query(dashboard.id).filter(dashboard.id > ultimo_id)
+                .order_by(dashboard.id).limit(tamanho)]
+        if not lote:
+            return
+        ultimo_id = lote[-1]
+        mensagens = {row_id: [] for row_id in lote}
+        for dashboard_id, sender, message in (
+                session.query(message_model.dashboard_id, message_model.sender, message_model.message)
+                .filter(message_model.dashboard_id.in_(lote))
+                .order_by(message_model.dashboard_id, message_model.timestamp)):
+            mensagens[dashboard_id].append({'sender': sender, 'message': message or ""})
+        session.expire_all()
+        for row_id in lote:
+            ids.append(row_id)
+            yield mensagens[row_id]
+        lidas += len(lote)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reclassifica as conversas do dashboard")
+    parser.add_argument("--apply", action="store_true", help="Grava a nova classificação")
+    parser.add_argument("--workers", type=int, default=0, help="Processos do pool (0 = no próprio processo)")
+    parser.add_argument("--batch", type=int, default=1000, help="Conversas por leitura/commit")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Conversas por tarefa do pool")
+    parser.add_argument("--limit", type=int, default=0, help="Máximo de conversas (0 = todas)")
+    args = parser.parse_args()
+
+    from app.models.database import SessionLocal, engine
+    if SessionLocal is None:
+        parser.error("banco indisponível (configure DATABASE_URL)")
+    from app.models.dashboard import ConversationDashboard, ConversationMessage, ConversationStatus
+
+    if args.apply:
+        _garantir_coluna(engine, ConversationDashboard)
+
+    leitura, escrita = SessionLocal(), SessionLocal()
+    try:
+        classifier = ConversationClassifier()
+        ids = deque()
+        conversas = _conversas(leitura, ConversationDashboard, ConversationMessage, args.batch, args.limit, ids)
+
+        total = atencao = 0
+        tags = Counter()
+        pendentes = []
+        started = time.perf_counter()
+        for result in classifier.classify_batch(conversas, workers=args.workers, chunk_size=args.chunk_size,
+                                                with_state=args.apply):
+            # classify_batch preserva a ordem de entrada
+            row_id = ids.popleft()
+            total += 1
+            tags.update(result['tags'])
+            atencao += result['requires_attention']
+            if not args.apply:
+                continue
+            pendentes.append((row_id, result))
+            if len(pendentes) >= args.batch:
+                _gravar(escrita, ConversationDashboard, ConversationStatus, pendentes)
+                pendentes = []
+        if pendentes:
+            _gravar(escrita, ConversationDashboard, ConversationStatus, pendentes)
+        elapsed = time.perf_counter() - started
+
+        if not total:
+            print("Nenhuma conversa no dashboard")
+            return
+        print(f"{total} conversas em {elapsed:.2f}s ({total / elapsed:.0f} conversas/s, workers={args.workers})")
+        print(f"precisam de atenção: {atencao}")
+        for tag, quantidade in tags.most_common():
+            print(f"  {tag:<22}{quantidade:>8}")
+        if args.apply:
+            print(f"✅ {total} conversas reclassificadas")
+        else:
+            print("(medição apenas; use --apply para gravar)")
+    finally:
+        leitura.close()
+        escrita.close()
+
+def _gravar(session, dashboard, status_enum, pendentes):
+    session.bulk_update_mappings(dashboard, [{
+        'id': row_id,
+        'tags': result['tags'],
+        'priority': result['priority'],
+        'sentiment_score': result['sentiment_score'],
+        'ai_summary': result['ai_summary'],
+        'ai_suggested_action': result['ai_suggested_action'],
+        'classifier_state': result['classifier_state'],
+    } for row_id, result in pendentes])
+    atencao = [row_id for row_id, result in pendentes if result['requires_attention']]
+    if atencao:
+        (session.query(dashboard)
+         .filter(dashboard.id.in_(atencao), dashboard.status == status_enum.PENDING)
+         .update({'status': status_enum.REQUIRES_ATTENTION}, synchronize_session=False))
+    session.commit()
+
+if __name__ == "__main__":
+    main()
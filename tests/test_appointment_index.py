@@ -0,0 +1,151 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.appointment_index import AppointmentIndex
+
+CPF, OUTRO_CPF = "12345678901", "98765432100"
+
+def _data_hora(dias: int, hora: int = 9) -> datetime:
+    return datetime.combine(date.today() + timedelta(days=dias), datetime.min.time()).replace(hour=hora)
+
+def _agendamento(ag_id: str, cpf: str, dias: int, hora: int = 9) -> dict:
+    # Formato da listagem da API
+    return {"id": ag_id, "cpf": cpf, "data_hora": _data_hora(dias, hora).strftime("%d/%m/%Y %H:%M:%S")}
+
+class _GestaoDSFalsa:
+    def __init__(self, agendamentos):
+        self.agendamentos = agendamentos
+        self.periodos = []
+
+    async def _fetch_agendamentos_periodo(self, inicio, fim):
+        self.periodos.append((inicio, fim))
+        return self.agendamentos
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+class _WhatsAppFalso:
+    def __init__(self):
+        self.enviadas = []
+
+    async def send_text(self, phone, mensagem):
+        self.enviadas.append(mensagem)
+
+class TestAppointmentIndex:
+
+    def test_lookup_antes_e_depois_do_sync_completo(self):
+        """Testa None até a primeira sincronização completa e busca por CPF em ordem cronológica"""
+        api = _GestaoDSFalsa([
+            _agendamento("3", CPF, 40, hora=14),
+            _agendamento("1", CPF, 2),
+            _agendamento("2", OUTRO_CPF, 2),
+            _agendamento("4", "123.456.789-01", 40, hora=8),
+            _agendamento("5", CPF, 500),  # Fora do horizonte
+        ])
+        index = AppointmentIndex(gestaods=api, horizon_days=365, near_days=30)
+
+        assert index.lookup(CPF) is None
+        assert asyncio.run(index.sync(full=False))
+        assert index.lookup(CPF) is None  # Incremental não torna o índice confiável
+
+        assert asyncio.run(index.sync(full=True))
+        assert [ag["id"] for ag in index.lookup(CPF)] == ["1", "4", "3"]
+        assert [ag["id"] for ag in index.lookup("987.654.321-00")] == ["2"]
+        assert index.lookup("00000000000") == []
+
+        hoje = date.today()
+        assert api.periodos[-1] == (hoje.strftime("%d/%m/%Y"), (hoje + timedelta(days=365)).strftime("%d/%m/%Y"))
+        stats = index.get_stats()
+        assert (stats["lookups"], stats["fallbacks"], stats["index_hits"]) == (5, 2, 3)
+        assert (stats["syncs"], stats["full_syncs"], stats["appointments"]) == (2, 1, 4)
+
+    def test_sync_corrige_drift_e_falha_nao_apaga(self):
+        """Testa que a listagem nova remove cancelados e que falha da API mantém o índice"""
+        api = _GestaoDSFalsa([_agendamento("1", CPF, 2), _agendamento("2", CPF, 10)])
+        index = AppointmentIndex(gestaods=api)
+        asyncio.run(index.sync(full=True))
+
+        api.agendamentos = [_agendamento("1", CPF, 2)]  # "2" cancelado na clínica
+        asyncio.run(index.sync(full=False))
+        assert [ag["id"] for ag in index.lookup(CPF)] == ["1"]
+        assert index.get_stats()["drift_corrections"] == 1
+
+        api.agendamentos = None
+        assert asyncio.run(index.sync(full=True)) is False
+        assert [ag["id"] for ag in index.lookup(CPF)] == ["1"]
+        assert index.get_stats()["sync_failures"] == 1
+
+    def test_write_through_de_criacao_e_reagendamento(self):
+        """Testa record_created/record_rescheduled refletidos no lookup sem nova sincronização"""
+        api = _GestaoDSFalsa([_agendamento("1", CPF, 5)])
+        index = AppointmentIndex(gestaods=api)
+        asyncio.run(index.sync(full=True))
+
+        index.record_created("123.456.789-01", _data_hora(3), {"id": "7", "medico": "Dra. Ana"})
+        criados = index.lookup(CPF)
+        assert [ag["id"] for ag in criados] == ["7", "1"]
+        assert criados[0]["status"] == "Agendado" and criados[0]["cpf"] == CPF
+
+        index.record_rescheduled("7", _data_hora(8, hora=15))
+        reagendados = index.lookup(CPF)
+        assert [ag["id"] for ag in reagendados] == ["1", "7"]
+        assert reagendados[1]["data_hora"] == _data_hora(8, hora=15).isoformat()
+        assert reagendados[1]["medico"] == "Dra. Ana"
+        assert index.get_stats()["dates"] == 2
+
+        index.record_rescheduled("desconhecido", _data_hora(9))  # Fica para o sync
+        assert index.get_stats()["write_throughs"] == 2
+        assert index.get_stats()["appointments"] == 2
+
+    def test_sem_job_de_sync_a_carga_vale_so_como_dica(self):
+        """Testa que sem o job rodando a varredura vale hint_ttl, e com ele max_staleness"""
+        relogio = _Relogio()
+        api = _GestaoDSFalsa([_agendamento("1", CPF, 2)])
+        index = AppointmentIndex(gestaods=api, sync_interval=3600, max_staleness=3600, hint_ttl=60, clock=relogio)
+        hoje = date.today()
+
+        index.load_listing(api.agendamentos, hoje, hoje + timedelta(days=365))
+        assert [ag["id"] for ag in index.lookup(CPF)] == ["1"]
+        relogio.agora = 61
+        assert index.lookup(CPF) is None  # Cancelamentos na clínica não chegariam ao índice
+
+        async def cenario():
+            index.start()
+            await asyncio.sleep(0)  # Primeiro ciclo: sync completo
+            relogio.agora = 61 + 600
+            com_job = index.lookup(CPF)
+            await index.stop()
+            return com_job
+
+        assert [ag["id"] for ag in asyncio.run(cenario())] == ["1"]
+        assert index.lookup(CPF) is None  # Job parado: 600s passam do hint_ttl
+        assert index.get_stats()["sync_running"] is False
+
+    def test_varredura_de_fallback_compara_cpf_normalizado(self):
+        """Testa que a listagem com CPF formatado encontra o paciente com CPF só dígitos"""
+        pytest.importorskip("sqlalchemy")
+        from app.services.conversation import ConversationManager
+
+        api = _GestaoDSFalsa([
+            {"id": "1", "cpf": "123.456.789-01", "data_hora": _data_hora(2).isoformat()},
+            {"id": "2", "cpf": OUTRO_CPF, "data_hora": _data_hora(3).isoformat()},
+        ])
+        manager = ConversationManager.__new__(ConversationManager)
+        manager.whatsapp, manager.gestaods = _WhatsAppFalso(), api
+        manager.appointment_index = AppointmentIndex(gestaods=api)
+
+        conversa, db = SimpleNamespace(state="menu_principal"), AsyncMock()
+        asyncio.run(manager._mostrar_agendamentos("5531999990000", {"cpf": CPF}, conversa, db))
+        assert conversa.state == "visualizando_agendamentos"
+        assert len(api.periodos) == 1
+        assert "Seus agendamentos" in manager.whatsapp.enviadas[-1]
+        assert _data_hora(2).strftime("%d/%m/%Y") in manager.whatsapp.enviadas[-1]
+        assert _data_hora(3).strftime("%d/%m/%Y") not in manager.whatsapp.enviadas[-1]
@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.patient_transaction import (
+    AUDIT_ADDED_COLUMNS, AuditBlob, Base as AuditBase, DecisionLog, DecisionType, PatientTransaction, TransactionStage,
+    ValidationResult, migrate_audit_schema
+)
+from app.services import audit_blobs
+from app.services.audit_blobs import AuditBlobStore
+from app.models import database
+from app.services import audit_writer
+from app.services.audit_writer import AuditWriter
+
+def _transacao(i):
+    return dict(phone="5531999990000", conversation_id="c1", user_input=str(i),
+                stage_current=TransactionStage.INICIAL, validation_result=ValidationResult.PASSOU,
+                decision_type=DecisionType.AVANÇAR, context_loaded={"passo": i})
+
+class _SessaoLenta:
+    """Sessão falsa: cada COMMIT demora, para encher a fila"""
+    gravados = []
+
+    def bulk_insert_mappings(self, model, records):
+        self.gravados.extend(records)
+
+    def commit(self):
+        time.sleep(0.2)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class TestAuditWriter:
+
+    def test_grava_em_lote_e_drena_no_stop(self):
+        """Testa lotes por tamanho, INSERT nas duas tabelas e drenagem no stop"""
+        engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        AuditBase.metadata.create_all(engine)
+        writer = AuditWriter(batch_size=200, flush_interval=30, session_factory=sessionmaker(bind=engine))
+
+        async def cenario():
+            ids = [await writer.submit(PatientTransaction, _transacao(i)) for i in range(450)]
+            await writer.submit(DecisionLog, dict(transaction_id=ids[0], decision_type=DecisionType.AVANÇAR,
+                                                  decision_reason="Continuar fluxo normal sem erros"))
+            await writer.stop()
+
+        asyncio.run(cenario())
+        session = sessionmaker(bind=engine)()
+        assert session.query(PatientTransaction).count() == 450
+        assert session.query(DecisionLog).count() == 1
+        assert session.query(PatientTransaction).first().user_input_type == "text"
+        stats = writer.get_stats()
+        assert (stats["written"], stats["batches"], stats["depth"], stats["running"]) == (451, 3, 0, False)
+
+    def test_backpressure_e_copia_do_turno(self):
+        """Testa que fila cheia segura o turno até o timeout e que o registro é a cópia do momento do submit"""
+        _SessaoLenta.gravados = []
+        writer = AuditWriter(maxsize=1, batch_size=1, flush_interval=0, enqueue_timeout=0.05,
+                             session_factory=_SessaoLenta)
+
+        async def cenario():
+            registro = _transacao(0)
+            assert await writer.submit(PatientTransaction, registro)
+            registro["context_loaded"]["passo"] = 99
+            await asyncio.sleep(0.01)  # Job pega o primeiro e fica no COMMIT
+            assert await writer.submit(PatientTransaction, _transacao(1))
+            started = time.perf_counter()
+            assert await writer.submit(PatientTransaction, _transacao(2)) is None
+            assert time.perf_counter() - started >= 0.05
+            await writer.stop()
+
+        asyncio.run(cenario())
+        stats = writer.get_stats()
+        assert (stats["blocked"], stats["dropped"], stats["written"]) == (1, 1, 2)
+        assert _SessaoLenta.gravados[0]["context_loaded"] == {"passo": 0}
+
+    def test_perda_de_registros_aciona_o_alerta(self):
+        """Testa que lote com erro deixa o health degradado até alert_window depois da última perda"""
+        class _Relogio:
+            agora = 0.0
+
+            def __call__(self):
+                return self.agora
+
+        def sessao_fora_do_ar():
+            raise RuntimeError("no such column: context_loaded_hash")
+
+        engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        AuditBase.metadata.create_all(engine)
+        relogio = _Relogio()
+        writer = AuditWriter(session_factory=sessao_fora_do_ar, alert_window=300, clock=relogio)
+        assert writer.health()["status"] == "healthy"
+
+        asyncio.run(writer.flush([(PatientTransaction, _transacao(0)), (PatientTransaction, _transacao(1))]))
+        health = writer.health()
+        assert (health["status"], health["lost"], health["consecutive_failures"]) == ("degraded", 2, 1)
+        assert "context_loaded_hash" in health["last_error"]
+
+        writer._session_factory = sessionmaker(bind=engine)
+        relogio.agora = 60
+        asyncio.run(writer.flush([(PatientTransaction, _transacao(2))]))
+        assert writer.consecutive_failures == 0 and writer.alerting  # Perda recente ainda alerta
+        relogio.agora = 301
+        assert writer.health()["status"] == "healthy"
+        assert writer.get_stats()["failed"] == 2
+
+class TestAuditBlobs:
+
+    def test_payload_repetido_gravado_uma_vez(self, monkeypatch):
+        """Testa que contextos iguais viram um único blob, inclusive vindo de outro processo"""
+        engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        AuditBase.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        contexto = {"acao": "agendar", "paciente": {"nome": "Maria", "cpf": "12345678901"}}
+
+        def turnos(store, contextos):
+            writer = AuditWriter(flush_interval=30, session_factory=Session)
+
+            async def cenario():
+                for i, ctx in enumerate(contextos):
+                    blobs = {}
+                    digest = store.ref(ctx, blobs)
+                    for blob in blobs.values():
+                        await writer.submit(AuditBlob, blob, copy_values=False)
+                    registro = _transacao(i)
+                    registro.update(context_loaded=None, context_loaded_hash=digest, context_updated_hash=digest)
+                    await writer.submit(PatientTransaction, registro)
+                await writer.stop()
+
+            asyncio.run(cenario())
+
+        store = AuditBlobStore()
+        monkeypatch.setattr(audit_blobs, "_audit_blob_store", store)
+        turnos(store, [contexto, dict(reversed(list(contexto.items()))), {"acao": "visualizar"}])
+        assert store.get_stats()["stored"] == 2
+
+        # Novo processo: LRU vazio, o hash já existe no banco
+        outro = AuditBlobStore()
+        monkeypatch.setattr(audit_blobs, "_audit_blob_store", outro)
+        turnos(outro, [contexto])
+
+        session = Session()
+        assert session.query(AuditBlob).count() == 2
+        assert outro.get_stats()["stored"] == 0
+        hashes = [t.context_loaded_hash for t in session.query(PatientTransaction)]
+        assert len(hashes) == 4 and len(set(hashes)) == 2
+        assert outro.load(session, hashes)[hashes[0]] in (contexto, {"acao": "visualizar"})
+
+    def test_migracao_de_banco_anterior_aos_hashes(self):
+        """Testa que a migração cria audit_blobs e as colunas *_hash e que o INSERT volta a funcionar"""
+        engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        AuditBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("DROP TABLE audit_blobs"))
+            for model, colunas in AUDIT_ADDED_COLUMNS.items():
+                for coluna in colunas:
+                    conn.execute(sqlalchemy.text(f"ALTER TABLE {model.__tablename__} DROP COLUMN {coluna}"))
+        Session = sessionmaker(bind=engine)
+
+        def registro(i):
+            return dict(_transacao(i), context_loaded=None, context_loaded_hash="a" * 64)
+
+        writer = AuditWriter(flush_interval=30, session_factory=Session)
+        assert asyncio.run(writer.flush([(PatientTransaction, registro(0))])) == 0
+        assert writer.failed == 1
+
+        assert len(migrate_audit_schema(engine)) == 5
+        assert migrate_audit_schema(engine) == []
+        assert asyncio.run(writer.flush([(PatientTransaction, registro(1))])) == 1
+        assert sqlalchemy.inspect(engine).has_table("audit_blobs")
+
+    def test_gravacao_em_lote_exige_esquema_migrado(self, monkeypatch):
+        """Testa que AUDIT_ASYNC_ENABLED não liga o caminho em lote sem a migração"""
+        monkeypatch.setattr(audit_writer.settings, "audit_async_enabled", True)
+        monkeypatch.setattr(database, "audit_schema_ready", False)
+        assert audit_writer.audit_async_enabled() is False
+        monkeypatch.setattr(database, "audit_schema_ready", True)
+        assert audit_writer.audit_async_enabled() is True
+        monkeypatch.setattr(audit_writer.settings, "audit_async_enabled", False)
+        assert audit_writer.audit_async_enabled() is False
+
+    def test_resposta_da_api_sem_campos_volateis_no_hash(self, monkeypatch):
+        """Testa que timestamp/response_time_ms viram colunas e a mesma resposta gera um único blob"""
+        from app.services.patient_transaction_service import PatientTransactionService, TransactionContext
+
+        engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        AuditBase.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        monkeypatch.setattr(audit_blobs, "_audit_blob_store", AuditBlobStore())
+        service = PatientTransactionService.__new__(PatientTransactionService)
+
+        for i, (timestamp, latencia) in enumerate([("2030-01-10T09:00:00", 120), ("2030-01-10T09:05:00", 340)]):
+            context = TransactionContext(
+                phone="5531999990000", conversation_id="c1", user_input="12345678901",
+                current_stage=TransactionStage.BUSCA_EXECUTADA, previous_stage=None, loaded_context={},
+                patient_data={"id": 7}, validation_results=ValidationResult.PASSOU,
+                api_response={"endpoint": "/api/paciente/token/12345678901/", "response": {"id": 7},
+                              "timestamp": timestamp, "response_time_ms": latencia})
+            asyncio.run(service._persist_transaction(context, session, time.time()))
+
+        transacoes = session.query(PatientTransaction).order_by(PatientTransaction.api_timestamp).all()
+        assert len({t.api_response_hash for t in transacoes}) == 1
+        assert [t.api_response_time_ms for t in transacoes] == [120, 340]
+        assert transacoes[1].api_timestamp.isoformat() == "2030-01-10T09:05:00"
+        blob = session.get(AuditBlob, transacoes[0].api_response_hash)
+        assert "timestamp" not in blob.content and blob.content["response"] == {"id": 7}
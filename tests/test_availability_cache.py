@@ -0,0 +1,166 @@
+import asyncio
+
+from app.services.availability_cache import AvailabilityCache
+
+DIAS = [{"data": "2026-10-20"}, {"data": "2026-10-21"}, {"data": "2026-10-22"}]
+HORARIOS = [{"horario": "08:00"}, {"horario": "09:00"}]
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+class _GestaoDSFalsa:
+    """Conta as buscas e devolve a versão atual de dias/horários"""
+
+    def __init__(self):
+        self.dias = list(DIAS)
+        self.horarios = {dia["data"]: list(HORARIOS) for dia in DIAS}
+        self.buscas = []
+        self.falhar = False
+
+    async def _fetch_dias_disponiveis(self, data=None):
+        self.buscas.append("dias")
+        return None if self.falhar else list(self.dias)
+
+    async def _fetch_horarios_disponiveis(self, data):
+        self.buscas.append(data)
+        return None if self.falhar else list(self.horarios.get(data, []))
+
+    def _gerar_dias_disponiveis_mock(self):
+        return [{"data": "mock"}]
+
+    def _gerar_horarios_disponiveis_mock(self):
+        return [{"horario": "mock"}]
+
+class TestStaleWhileRevalidate:
+
+    def test_entrada_velha_servida_e_revalidada_em_background(self):
+        """Testa fresco da memória, velho servido na hora com refresh em background e expirado aguardando a API"""
+        relogio = _Relogio()
+        api = _GestaoDSFalsa()
+        cache = AvailabilityCache(gestaods=api, fresh_ttl=60, stale_ttl=900, clock=relogio)
+
+        async def cenario():
+            assert await cache.get_dias() == DIAS            # miss: busca e aguarda
+            relogio.agora = 30
+            assert await cache.get_dias() == DIAS            # fresco
+            assert api.buscas == ["dias"]
+
+            api.dias = DIAS[1:]
+            relogio.agora = 120
+            assert await cache.get_dias() == DIAS            # velho: servido sem esperar
+            assert await cache.get_dias() == DIAS            # um refresh por chave
+            await asyncio.sleep(0)
+            assert api.buscas == ["dias", "dias"]
+            assert await cache.get_dias() == DIAS[1:]        # refresh gravado com o relógio atual
+
+            api.falhar = True
+            relogio.agora = 200
+            assert await cache.get_dias() == DIAS[1:]
+            await asyncio.sleep(0)
+            assert await cache.get_dias() == DIAS[1:]        # falha não apaga o valor velho
+
+            relogio.agora = 120 + 900
+            assert await cache.get_dias() == DIAS[1:]        # expirado e API fora: último valor
+            assert await cache.get_horarios("2026-10-20") == [{"horario": "mock"}]  # nunca buscado: mock
+
+        asyncio.run(cenario())
+        stats = cache.get_stats()
+        assert (stats["fresh_hits"], stats["stale_hits"], stats["misses"]) == (2, 4, 3)
+        assert (stats["refresh_failures"], stats["entries"]) == (3, 1)
+
+    def test_invalidate_date(self):
+        """Testa que agendar remove os horários da data e deixa a lista de dias velha"""
+        relogio = _Relogio()
+        api = _GestaoDSFalsa()
+        cache = AvailabilityCache(gestaods=api, fresh_ttl=60, stale_ttl=900, clock=relogio)
+
+        async def cenario():
+            await cache.get_dias()
+            await cache.get_horarios("2026-10-20")
+            await cache.get_horarios("2026-10-21")
+            relogio.agora = 10
+
+            api.horarios["2026-10-20"] = HORARIOS[1:]
+            api.dias = DIAS[1:]
+            cache.invalidate_date("2026-10-20")
+
+            assert await cache.get_horarios("2026-10-20") == HORARIOS[1:]  # buscado de novo
+            assert await cache.get_horarios("2026-10-21") == HORARIOS      # outras datas intactas
+            assert await cache.get_dias() == DIAS                          # velho, revalidando
+            await asyncio.sleep(0)
+            assert await cache.get_dias() == DIAS[1:]
+
+        asyncio.run(cenario())
+        assert api.buscas == ["dias", "2026-10-20", "2026-10-21", "2026-10-20", "dias"]
+        stats = cache.get_stats()
+        assert (stats["invalidations"], stats["stale_hits"], stats["misses"]) == (1, 1, 4)
+
+class _GestaoDSLenta(_GestaoDSFalsa):
+    """Registra quantas buscas de horários rodam ao mesmo tempo"""
+
+    def __init__(self, datas):
+        super().__init__()
+        self.dias = [{"data": data} for data in datas]
+        self.horarios = {data: list(HORARIOS) for data in datas}
+        self.horarios[datas[1]] = []  # Dia lotado
+        self.simultaneas = 0
+        self.max_simultaneas = 0
+
+    async def _fetch_horarios_disponiveis(self, data):
+        self.simultaneas += 1
+        self.max_simultaneas = max(self.max_simultaneas, self.simultaneas)
+        await asyncio.sleep(0.001)
+        self.simultaneas -= 1
+        return await super()._fetch_horarios_disponiveis(data)
+
+class TestFanoutEWarmer:
+
+    DATAS = [f"2026-11-{dia:02d}" for dia in range(1, 11)]
+
+    def test_dias_com_horarios_limitado_pelo_semaforo(self):
+        """Testa que a busca paralela respeita fanout_concurrency e descarta dias lotados"""
+        api = _GestaoDSLenta(self.DATAS)
+        cache = AvailabilityCache(gestaods=api, fanout_concurrency=3)
+
+        dias = asyncio.run(cache.get_dias_com_horarios(limit=8))
+        assert [dia["data"] for dia in dias] == self.DATAS[:1] + self.DATAS[2:8]
+        assert api.max_simultaneas == 3
+        assert sorted(api.buscas[1:]) == self.DATAS[:8]
+        assert cache.get_stats()["days_filtered"] == 1
+
+    def test_warm_limitado_pelo_semaforo(self):
+        """Testa que o warmer aquece os próximos N dias com no máximo fanout_concurrency buscas"""
+        api = _GestaoDSLenta(self.DATAS)
+        cache = AvailabilityCache(gestaods=api, prefetch_days=7, fanout_concurrency=2)
+
+        asyncio.run(cache.warm())
+        assert api.max_simultaneas == 2
+        assert sorted(api.buscas[1:]) == self.DATAS[:7]
+        assert cache.get_stats()["entries"] == 8
+
+    def test_stop_cancela_o_warmer(self):
+        """Testa que stop() cancela o loop do warmer, inclusive no meio do sleep"""
+        api = _GestaoDSLenta(self.DATAS)
+        cache = AvailabilityCache(gestaods=api, prefetch_days=2, refresh_interval=3600)
+
+        async def cenario():
+            cache.start()
+            warmer = cache._warmer
+            cache.start()  # Idempotente
+            assert cache._warmer is warmer
+            while cache.warm_runs == 0:
+                await asyncio.sleep(0.001)
+            assert cache.get_stats()["warmer_running"]
+
+            await asyncio.wait_for(cache.stop(), timeout=1)
+            return warmer
+
+        warmer = asyncio.run(cenario())
+        assert warmer.cancelled()
+        assert cache._warmer is None
+        assert cache.get_stats()["warmer_running"] is False
+        assert cache.warm_runs == 1
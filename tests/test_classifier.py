@@ -0,0 +1,71 @@
+import asyncio
+import json
+import random
+
+from app.services.classifier import ConversationClassifier
+
+CONVERSAS = [
+    [],
+    [{'sender': 'bot', 'message': 'Olá! Digite seu CPF'}],
+    [{'sender': 'user', 'message': 'Quero cancelar minha consulta'}, {'sender': 'bot', 'message': 'Cancelamento feito'}],
+    [{'sender': 'user', 'message': 'É URGENTE, dor forte'}, {'sender': 'user', 'message': 'péssimo, demora demais'}],
+    [{'sender': 'user', 'message': 'primeira vez, qual valor?'}, {'sender': 'user', 'message': 'obrigado, ótimo'}],
+]
+
+def _normalizar(result):
+    return {**result, 'tags': sorted(result['tags'])}
+
+class TestClassificacaoEmLote:
+
+    def test_lote_igual_a_analise_individual(self):
+        """Testa que classify_batch (no processo e no pool) dá o mesmo resultado de analyze_conversation"""
+        classifier = ConversationClassifier()
+        esperado = [_normalizar(asyncio.run(classifier.analyze_conversation(c))) for c in CONVERSAS]
+        assert [_normalizar(r) for r in classifier.classify_batch(iter(CONVERSAS))] == esperado
+        assert [_normalizar(r) for r in classifier.classify_batch(CONVERSAS * 3, workers=2, chunk_size=2)] == esperado * 3
+
+    def test_prioridade_e_atencao(self):
+        """Testa prioridade máxima e atenção humana para urgência com reclamação"""
+        result = ConversationClassifier().classify(CONVERSAS[3])
+        assert set(result['tags']) == {'urgente', 'reclamacao'}
+        assert result['priority'] == 3 and result['requires_attention']
+
+def _mensagem(texto, sender='user'):
+    return {'sender': sender, 'message': texto}
+
+class TestClassificacaoIncremental:
+
+    def test_igual_a_reclassificar_o_historico(self):
+        """Testa mensagem a mensagem (estado via JSON) contra classify no texto completo"""
+        classifier = ConversationClassifier()
+        pecas = ["primeira", "vez", "não", "consegui", "agendar", "OK", "agendado", "dor", "forte",
+                 "péssimo", "obrigado", "lista", "espe", "ra", "outro", "dia", "\n", " ", "confirmou"]
+        random.seed(3)
+        for _ in range(500):
+            conversa = [_mensagem("".join(random.choice(pecas) for _ in range(random.randint(0, 4))),
+                                  random.choice(['user', 'bot'])) for _ in range(random.randint(0, 6))]
+            estado = None
+            for mensagem in conversa:
+                resultado, estado = asyncio.run(classifier.analyze_incremental([mensagem], estado))
+                estado = json.loads(json.dumps(estado))
+            if not conversa:
+                resultado = classifier.result(classifier.new_state())
+            assert _normalizar(resultado) == _normalizar(classifier.classify(conversa)), conversa
+
+    def test_literal_dividido_entre_mensagens_e_quebra_de_linha(self):
+        """Testa 'primeira vez' em duas mensagens e que '.*' não atravessa '\\n'"""
+        classifier = ConversationClassifier()
+        estado = classifier.new_state()
+        assert classifier.update(estado, [_mensagem("é minha primeira")])['tags'] == []
+        assert classifier.update(estado, [_mensagem("vez aqui")])['tags'] == ['novo_paciente']
+
+        estado = classifier.new_state()
+        assert classifier.update(estado, [_mensagem("dor"), _mensagem("\nforte")])['tags'] == []
+
+    def test_estado_de_outros_padroes_e_descartado(self):
+        """Testa que estado gerado com padrões diferentes não é reaproveitado"""
+        classifier = ConversationClassifier()
+        _, estado = asyncio.run(classifier.analyze_incremental([_mensagem("urgente")]))
+        assert classifier.load_state(estado) is not None
+        assert classifier.load_state({**estado, 'fingerprint': 'outro'}) is None
+
@@ -0,0 +1,39 @@
+from app.services import conversation_context as ctx
+
+class TestContextoCompacto:
+
+    def test_compacta_contexto_antigo(self):
+        """Testa troca dos payloads embutidos por referências"""
+        contexto = {
+            "acao": "agendar",
+            "paciente": {"id": 1, "nome": "Maria", "cpf": "123.456.789-01", "email": "m@example.com"},
+            "dias_disponiveis": [{"data": "2030-01-10", "disponivel": True}, {"data": "2030-01-11"}],
+            "data_escolhida": {"data": "2030-01-11", "disponivel": True},
+            "horarios_disponiveis": [{"horario": "09:00", "disponivel": True}, {"horario": "09:30"}],
+            "horario_escolhido": {"horario": "09:30"},
+            "expecting": "confirmacao_agendamento"
+        }
+        assert ctx.is_legacy(contexto)
+        assert ctx.compact_context(contexto) == {
+            "acao": "agendar",
+            ctx.PACIENTE: "12345678901",
+            ctx.PACIENTE_RESUMO: {"id": 1, "nome": "Maria", "cpf": "123.456.789-01"},
+            ctx.DIAS: ["2030-01-10", "2030-01-11"],
+            ctx.DATA: "2030-01-11",
+            ctx.HORARIOS: ["09:00", "09:30"],
+            ctx.HORARIO: "09:30",
+            "expecting": "confirmacao_agendamento"
+        }
+        assert not ctx.is_legacy(contexto)
+
+    def test_paciente_sem_cpf_continua_embutido(self):
+        """Testa que paciente sem CPF válido não perde os dados"""
+        contexto = {"paciente_temp": {"nome": "Sem CPF"}}
+        assert ctx.compact_context(contexto) == {"paciente_temp": {"nome": "Sem CPF"}}
+
+    def test_escolher_opcao(self):
+        """Testa a opção digitada como offset na lista ofertada"""
+        ofertados = ["2030-01-10", "2030-01-11"]
+        assert ctx.escolher_opcao(ofertados, 2) == "2030-01-11"
+        assert ctx.escolher_opcao(ofertados, 0) is None
+        assert ctx.escolher_opcao(ofertados, 3) is None
@@ -0,0 +1,381 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.database import Base, Conversation, Appointment
+from app.models import async_database
+from app.models.conversation_repository import (
+    AsyncConversationRepository, ConversationRepository, SyncConversationRepository, open_conversation_repository
+)
+from app.config import settings
+from app.models.context_tracking import conversation_write_stats
+
+@pytest.fixture
+def banco():
+    """Banco SQLite em memória que registra os comandos SQL e os COMMITs"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    registro = {"sql": [], "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _sql(conn, cursor, statement, parameters, context, executemany):
+        registro["sql"].append(statement.split()[0].upper())
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        registro["commits"] += 1
+
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = Session()
+    session.add(Conversation(phone="5531999990000", state="menu_principal", context={}))
+    session.commit()
+    session.close()
+    registro["sql"].clear()
+    registro["commits"] = 0
+
+    yield Session, registro
+    engine.dispose()
+
+async def _turno_agendamento(db, patient_id="1"):
+    """Reproduz os commits que um handler de agendamento faz num turno"""
+    conversa = await db.get_conversation("5531999990000")
+    conversa.state = "confirmando_agendamento"
+    await db.commit()
+    conversa.context = {"paciente": {"id": patient_id}}
+    await db.commit()
+    db.add(Appointment(patient_id=patient_id, patient_name="Maria", patient_phone="5531999990000",
+                       appointment_date=datetime(2030, 1, 10, 9, 0)))
+    await db.commit()
+    conversa.state = "menu_principal"
+    await db.commit()
+    return await db.complete()
+
+class TestUnitOfWorkPorTurno:
+
+    def test_turno_faz_um_unico_commit(self, banco):
+        """Testa contagem de comandos SQL: um SELECT, gravações e um único COMMIT por turno"""
+        Session, registro = banco
+        db = SyncConversationRepository(Session())
+
+        assert asyncio.run(_turno_agendamento(db)) is True
+
+        assert registro["commits"] == 1
+        assert registro["sql"].count("SELECT") == 1
+        assert registro["sql"].count("INSERT") == 1
+        assert registro["sql"].count("UPDATE") == 1
+        assert db.commit_requests == 4
+        assert db.commits == 1
+
+    def test_turno_sem_alteracoes_nao_faz_commit(self, banco):
+        """Testa que turno só de leitura não vai ao banco para gravar"""
+        Session, registro = banco
+        db = SyncConversationRepository(Session())
+
+        async def turno():
+            await db.get_conversation("5531999990000")
+            return await db.complete()
+
+        assert asyncio.run(turno()) is True
+        assert registro["commits"] == 0
+        assert registro["sql"] == ["SELECT"]
+
+    def test_falha_no_commit_desfaz_o_turno(self, banco):
+        """Testa rollback completo quando o COMMIT do turno falha"""
+        Session, registro = banco
+        db = SyncConversationRepository(Session())
+
+        # patient_id é obrigatório: o INSERT falha no commit do turno
+        assert asyncio.run(_turno_agendamento(db, patient_id=None)) is False
+        assert db.rollbacks == 1
+        assert not db.pending
+
+        session = Session()
+        conversa = session.query(Conversation).filter_by(phone="5531999990000").first()
+        assert conversa.state == "menu_principal"
+        assert conversa.context == {}
+        assert session.query(Appointment).count() == 0
+
+def _async_session(Session):
+    """AsyncSession falsa que delega para uma sessão síncrona do SQLite"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    sync = Session()
+    session = AsyncMock(spec=AsyncSession)
+    session.sync_session = sync
+    session.add = MagicMock(side_effect=sync.add)
+    session.execute.side_effect = sync.execute
+    session.commit.side_effect = sync.commit
+    session.rollback.side_effect = sync.rollback
+    session.close.side_effect = sync.close
+    return session
+
+class TestRepositorioAssincrono:
+
+    def test_interface_abstrata(self):
+        """Testa que o repositório base não pode ser instanciado sem implementar a sessão"""
+        with pytest.raises(TypeError):
+            ConversationRepository()
+
+    def test_turno_faz_um_unico_commit(self, banco):
+        """Testa o mesmo turno da sessão síncrona sobre AsyncSession: um COMMIT awaited"""
+        Session, registro = banco
+        session = _async_session(Session)
+        db = AsyncConversationRepository(session)
+
+        assert asyncio.run(_turno_agendamento(db)) is True
+
+        assert session.commit.await_count == 1
+        assert registro["commits"] == 1
+        assert registro["sql"].count("SELECT") == 1
+        assert registro["sql"].count("INSERT") == 1
+        assert registro["sql"].count("UPDATE") == 1
+        assert session.add.call_count == 1
+
+    def test_falha_no_commit_faz_rollback(self, banco):
+        """Testa rollback awaited e banco intacto quando o COMMIT assíncrono falha"""
+        Session, registro = banco
+        session = _async_session(Session)
+        db = AsyncConversationRepository(session)
+
+        assert asyncio.run(_turno_agendamento(db, patient_id=None)) is False
+        assert session.rollback.await_count == 1
+        assert Session().query(Appointment).count() == 0
+
+class TestAberturaDoRepositorio:
+
+    def test_modo_sincrono_usa_o_generator(self, banco, monkeypatch):
+        """Testa que sem DB_ASYNC_MODE o repositório usa a sessão do get_db()"""
+        Session, registro = banco
+        monkeypatch.setattr(settings, "db_async_mode", False)
+        sessao = Session()
+
+        def get_db():
+            yield sessao
+
+        db = open_conversation_repository(get_db())
+        assert isinstance(db, SyncConversationRepository) and db.session is sessao
+        assert asyncio.run(_turno_agendamento(db)) is True
+        assert registro["commits"] == 1
+
+    def test_modo_assincrono_nao_abre_sessao_sincrona(self, banco, monkeypatch):
+        """Testa que com DB_ASYNC_MODE o generator do get_db() nem é iniciado"""
+        Session, registro = banco
+        monkeypatch.setattr(settings, "db_async_mode", True)
+        session = _async_session(Session)
+        monkeypatch.setattr(async_database, "get_async_sessionmaker", lambda: lambda: session)
+        iniciado = []
+
+        def get_db():
+            iniciado.append(True)
+            yield Session()
+
+        generator = get_db()
+        db = open_conversation_repository(generator)
+        assert isinstance(db, AsyncConversationRepository) and db.session is session
+        assert iniciado == []
+        with pytest.raises(StopIteration):
+            next(generator)
+
+    def test_modo_assincrono_indisponivel_cai_no_sincrono(self, banco, monkeypatch):
+        """Testa fallback para a sessão síncrona quando não há driver assíncrono"""
+        Session, registro = banco
+        monkeypatch.setattr(settings, "db_async_mode", True)
+        monkeypatch.setattr(async_database, "get_async_sessionmaker", lambda: None)
+        assert isinstance(open_conversation_repository(Session()), SyncConversationRepository)
+
+class TestRastreamentoDoContexto:
+
+    def test_mutacao_in_place_e_gravada(self, banco):
+        """Testa que alterar o dict do contexto e reatribuir o mesmo objeto gera UPDATE"""
+        Session, registro = banco
+        db = SyncConversationRepository(Session())
+
+        async def turno():
+            conversa = await db.get_conversation("5531999990000")
+            contexto = conversa.context
+            contexto["paciente"] = {"nome": "Maria"}
+            conversa.context = contexto
+            await db.commit()
+            return await db.complete()
+
+        bytes_antes = conversation_write_stats.bytes_written
+        assert asyncio.run(turno()) is True
+        assert registro["sql"].count("UPDATE") == 1
+        assert conversation_write_stats.bytes_written - bytes_antes == len('{"paciente": {"nome": "Maria"}}')
+
+        session = Session()
+        conversa = session.query(Conversation).filter_by(phone="5531999990000").first()
+        assert conversa.context == {"paciente": {"nome": "Maria"}}
+
+    def test_turno_sem_mudanca_nao_gera_update(self, banco):
+        """Testa que reatribuir estado e contexto iguais não vai ao banco"""
+        Session, registro = banco
+        db = SyncConversationRepository(Session())
+
+        async def turno():
+            conversa = await db.get_conversation("5531999990000")
+            conversa.state = "menu_principal"
+            conversa.context = dict(conversa.context)
+            await db.commit()
+            return await db.complete()
+
+        sem_escrita_antes = conversation_write_stats.turns_without_write
+        assert asyncio.run(turno()) is True
+        assert registro["sql"] == ["SELECT"]
+        assert registro["commits"] == 0
+        assert conversation_write_stats.turns_without_write == sem_escrita_antes + 1
+
+class _WhatsAppFalso:
+    def __init__(self):
+        self.enviadas = []
+
+    async def send_text(self, phone, mensagem):
+        self.enviadas.append(mensagem)
+
+class _GestaoDSFalsa:
+    def __init__(self, Session):
+        self.Session = Session
+        self.reservas = 0
+        self.estado_na_reserva = None
+        self.reserva = None
+        self.fora_do_ar = False
+
+    def converter_datetime_para_api(self, dt):
+        return dt.strftime("%d/%m/%Y %H:%M:%S")
+
+    async def buscar_paciente_cpf(self, cpf):
+        return None if self.fora_do_ar else {"id": 7, "nome": "Maria", "cpf": cpf}
+
+    async def criar_agendamento(self, **kwargs):
+        self.reservas += 1
+        self.reserva = kwargs
+        self.estado_na_reserva = self.Session().query(Conversation.state).scalar()
+        return {"id": "ag-1"}
+
+class TestConfirmacaoAgendamento:
+
+    def test_falha_no_insert_local_nao_desfaz_o_estado(self, banco):
+        """Testa que a reserva na GestãoDS não volta para 'confirmando_agendamento' se o INSERT local falhar"""
+        from app.services.conversation import ConversationManager
+
+        Session, registro = banco
+        session = Session()
+        session.query(Conversation).update({"state": "confirmando_agendamento", "context": {
+            "paciente_cpf": "12345678909", "data_escolhida": "2030-01-10", "horario_escolhido": "09:00",
+            "expecting": "confirmacao_agendamento"}})
+        session.commit()
+        session.execute(sqlalchemy.text("DROP TABLE appointments"))
+        session.close()
+
+        manager = ConversationManager.__new__(ConversationManager)
+        manager.whatsapp, manager.gestaods, manager.state_store = _WhatsAppFalso(), _GestaoDSFalsa(Session), None
+        db = SyncConversationRepository(Session())
+
+        async def turno():
+            conversa = await db.get_conversation("5531999990000")
+            await manager._handle_confirmacao("5531999990000", "1", conversa, db, {})
+            return await db.complete()
+
+        assert asyncio.run(turno()) is True
+        assert manager.gestaods.reservas == 1
+        assert manager.gestaods.estado_na_reserva == "menu_principal"
+        assert "confirmado com sucesso" in manager.whatsapp.enviadas[-1]
+        conversa = Session().query(Conversation).filter_by(phone="5531999990000").first()
+        assert (conversa.state, conversa.context) == ("menu_principal", {})
+
+    def test_paciente_identificado_agenda_com_a_busca_fora_do_ar(self, banco):
+        """Testa que o resumo guardado no contexto substitui a busca por CPF que falhou"""
+        from app.services.conversation import ConversationManager
+
+        Session, registro = banco
+        manager = ConversationManager.__new__(ConversationManager)
+        manager.whatsapp, manager.gestaods, manager.state_store = _WhatsAppFalso(), _GestaoDSFalsa(Session), None
+
+        contexto = {"data_escolhida": "2030-01-10", "horario_escolhido": "09:00",
+                    "expecting": "confirmacao_agendamento"}
+        manager._guardar_paciente(contexto, {"id": 7, "nome": "Maria", "cpf": "123.456.789-09", "email": "m@example.com"})
+        assert contexto["paciente_resumo"] == {"id": 7, "nome": "Maria", "cpf": "123.456.789-09"}
+
+        session = Session()
+        session.query(Conversation).update({"state": "confirmando_agendamento", "context": contexto})
+        session.commit()
+        session.close()
+        manager.gestaods.fora_do_ar = True
+        db = SyncConversationRepository(Session())
+
+        async def turno():
+            conversa = await db.get_conversation("5531999990000")
+            await manager._handle_confirmacao("5531999990000", "1", conversa, db, {})
+            return await db.complete()
+
+        assert asyncio.run(turno()) is True
+        assert manager.gestaods.reservas == 1
+        assert manager.gestaods.reserva["cpf"] == "123.456.789-09"
+        assert "confirmado com sucesso" in manager.whatsapp.enviadas[-1]
+        assert Session().query(Appointment.patient_name).scalar() == "Maria"
+
+class _DisponibilidadeFalsa:
+    """Primeira data lotada; a segunda tem horários"""
+
+    def __init__(self):
+        self.horarios = {"2030-01-10": [], "2030-01-11": [{"horario": "09:00"}, {"horario": "09:30"}]}
+
+    async def get_dias_com_horarios(self, limit=7):
+        return [{"data": data} for data, horarios in self.horarios.items() if horarios][:limit]
+
+    async def get_horarios(self, data):
+        return self.horarios.get(data, [])
+
+class TestDataSemHorarios:
+
+    def test_escolher_outra_data_reenvia_a_lista(self, banco):
+        """Testa data lotada -> '1' (outra data) -> nova data aceita pelo dispatcher, sem voltar ao menu"""
+        from app.services.conversation import ConversationManager
+        from app.services.state_machine import StateDispatcher
+
+        Session, registro = banco
+        session = Session()
+        session.query(Conversation).update({"state": "escolhendo_data", "context": {
+            "paciente_cpf": "12345678909", "dias_ofertados": ["2030-01-10", "2030-01-11"],
+            "expecting": "escolha_data"}})
+        session.commit()
+        session.close()
+
+        manager = ConversationManager.__new__(ConversationManager)
+        manager.whatsapp, manager.gestaods, manager.state_store = _WhatsAppFalso(), _GestaoDSFalsa(Session), None
+        manager.availability = _DisponibilidadeFalsa()
+        manager.dispatcher = StateDispatcher(manager, fallback="_handle_estado_desconhecido")
+
+        async def turno(mensagem):
+            db = SyncConversationRepository(Session())
+            conversa = await db.get_conversation("5531999990000")
+            await manager._process_by_state("5531999990000", mensagem, conversa, db, {})
+            assert await db.complete()
+            await db.close()
+            linha = Session().query(Conversation).filter_by(phone="5531999990000").first()
+            return linha.state, linha.context
+
+        async def cenario():
+            estado, contexto = await turno("1")
+            assert estado == "data_sem_horarios"
+            assert contexto["expecting"] == "escolha_data" and "data_escolhida" not in contexto
+
+            estado, contexto = await turno("1")
+            assert estado == "escolhendo_data"
+            assert contexto["dias_ofertados"] == ["2030-01-11"]
+            assert "Escolha uma data" in manager.whatsapp.enviadas[-1]
+
+            return await turno("1")
+
+        estado, contexto = asyncio.run(cenario())
+        assert estado == "escolhendo_horario"
+        assert (contexto["data_escolhida"], contexto["expecting"]) == ("2030-01-11", "escolha_horario")
+        assert manager.dispatcher.out_of_context == 0
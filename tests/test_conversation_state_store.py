@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.database import Base, Conversation
+from app.models.conversation_repository import SyncConversationRepository
+from app.services.conversation_state_store import ConversationStateStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def banco():
+    """Banco SQLite em memória que conta COMMITs e UPDATEs"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    registro = {"commits": 0, "updates": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _sql(conn, cursor, statement, parameters, context, executemany):
+        if statement.upper().startswith("UPDATE"):
+            registro["updates"] += 1
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        registro["commits"] += 1
+
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield Session, registro
+    engine.dispose()
+
+def _estado_no_banco(Session, phone):
+    session = Session()
+    try:
+        conversa = session.query(Conversation).filter_by(phone=phone).first()
+        return (conversa.state, conversa.context) if conversa else None
+    finally:
+        session.close()
+
+class TestConversationStateStore:
+
+    def test_turno_grava_estado_no_commit_do_turno(self, banco):
+        """Testa criação, leitura da memória e gravação no mesmo COMMIT do turno"""
+        Session, registro = banco
+        store = ConversationStateStore()
+
+        async def cenario():
+            db = SyncConversationRepository(Session())
+            conversa = store.create("5531999990000")
+            conversa.state = "menu_principal"
+            assert await store.complete_turn(db, conversa)
+
+            db = SyncConversationRepository(Session())
+            conversa = store.get("5531999990000")
+            conversa.context["paciente"] = {"nome": "Maria"}
+            conversa.state = "aguardando_cpf"
+            assert await store.complete_turn(db, conversa)
+
+            # Turno sem mudanças: nenhum UPDATE nem COMMIT
+            db = SyncConversationRepository(Session())
+            assert await store.complete_turn(db, store.get("5531999990000"))
+
+        asyncio.run(cenario())
+
+        assert registro["commits"] == 2
+        assert registro["updates"] == 1
+        assert _estado_no_banco(Session, "5531999990000") == ("aguardando_cpf", {"paciente": {"nome": "Maria"}})
+        stats = store.get_stats()
+        assert stats["hits"] == 2
+        assert stats["dirty"] == 0
+
+    def test_write_behind_grava_em_lote(self, banco):
+        """Testa que o modo write-behind só grava no flush, em lote"""
+        Session, registro = banco
+        store = ConversationStateStore(flush_interval=5,
+                                       repository_factory=lambda: SyncConversationRepository(Session()))
+
+        async def cenario():
+            for i, phone in enumerate(["5531999990001", "5531999990002"]):
+                conversa = store.create(phone)
+                conversa.state = f"estado_{i}"
+                assert await store.complete_turn(SyncConversationRepository(Session()), conversa)
+            assert store.get_stats()["dirty"] == 2
+            assert _estado_no_banco(Session, "5531999990001") is None
+            return await store.flush()
+
+        assert asyncio.run(cenario()) == 2
+        assert registro["commits"] == 1
+        assert _estado_no_banco(Session, "5531999990002") == ("estado_1", {})
+        stats = store.get_stats()
+        assert stats["dirty"] == 0
+        assert stats["flushes"] == 1
+        assert stats["rows_flushed"] == 2
+
+    def test_falha_no_commit_mantem_memoria_igual_ao_banco(self, banco):
+        """Testa que turno desfeito não altera o estado em memória"""
+        Session, _ = banco
+        store = ConversationStateStore()
+
+        class RepositorioComFalha(SyncConversationRepository):
+            async def _commit(self):
+                raise RuntimeError("banco indisponível")
+
+        async def cenario():
+            conversa = store.create("5531999990000")
+            assert await store.complete_turn(SyncConversationRepository(Session()), conversa)
+            conversa = store.get("5531999990000")
+            conversa.state = "aguardando_cpf"
+            assert not await store.complete_turn(RepositorioComFalha(Session()), conversa)
+
+        asyncio.run(cenario())
+        assert store.get("5531999990000").state == "inicio"
+        assert _estado_no_banco(Session, "5531999990000") == ("inicio", {})
+
+    def test_despejo_preserva_entradas_sujas(self):
+        """Testa limite de tamanho e ociosidade sem perder entradas não gravadas"""
+        clock = FakeClock()
+        store = ConversationStateStore(max_entries=1, idle_ttl=60, flush_interval=5, clock=clock)
+        limpa = store.load(Conversation(id="c1", phone="5531999990001", state="menu_principal", context={}))
+        store.create("5531999990002")
+        store.create("5531999990003")
+
+        assert store.get(limpa.phone) is None
+        assert len(store) == 2
+        assert store.get_stats()["evictions"] == 1
+
+        clock.now = 120
+        assert store.evict_idle() == 0
+        assert store.get("5531999990002") is not None
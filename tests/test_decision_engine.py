@@ -0,0 +1,89 @@
+import itertools
+import json
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.patient_transaction import TransactionStage, ValidationResult
+from app.services import decision_engine
+from app.services.decision_engine import (
+    DECISION_TABLE_PATH, DecisionFactor, DecisionFactors, IntelligentDecisionEngine, _fingerprint_definitions
+)
+
+PACIENTES = [None, {"nome": "Maria"}, {"nome": "Maria", "cpf": "12345678901"},
+             {"nome": "Maria", "cpf": "12345678901", "telefone": "31999990000", "email": "m@example.com"}]
+
+def _cenarios():
+    for stage, paciente, validacao, acao, erros in itertools.product(
+            TransactionStage, PACIENTES, [None, ValidationResult.PASSOU, ValidationResult.FALHOU],
+            [None, "agendar", "visualizar", "cancelar"], [[], ["CPF inválido"]]):
+        yield dict(current_stage=stage, user_input="1", context={"acao": acao} if acao else {},
+                   patient_data=paciente, validation_result=validacao, errors=erros)
+
+def _resumo(result):
+    return (result.chosen_decision, result.confidence, result.reason, result.decision_path,
+            result.suggested_action, result.fallback_action,
+            [(alt.decision_type, alt.confidence_score, [f.name for f in alt.factors_supporting]) for alt in result.alternatives],
+            [(f.name, f.value, f.reason) for f in result.factors_used])
+
+class TestMotorDeDecisao:
+
+    def test_plano_memorizado_igual_a_avaliacao_completa(self):
+        """Testa todas as combinações de fatores com e sem memo"""
+        completo, memorizado = IntelligentDecisionEngine(memoize=False), IntelligentDecisionEngine(decision_table=None)
+        for _ in range(2):
+            for cenario in _cenarios():
+                assert _resumo(memorizado.analyze_and_decide(**cenario)) == _resumo(completo.analyze_and_decide(**cenario)), cenario
+        stats = memorizado.get_stats()
+        assert stats["plan_hits"] >= stats["decisions"] // 2
+        assert stats["plans"] <= len(TransactionStage) * 2 * 3 * 2 * 3
+
+    def test_razao_usa_os_fatores_da_chamada(self):
+        """Testa que o plano reaproveitado não vaza a completude/erro da decisão anterior"""
+        engine = IntelligentDecisionEngine(decision_table=None)
+        base = dict(current_stage=TransactionStage.VERIFICADO, user_input="sim", context={},
+                    validation_result=ValidationResult.PASSOU)
+        engine.analyze_and_decide(patient_data={"nome": "Maria", "cpf": "1", "telefone": "9"}, **base)
+        result = engine.analyze_and_decide(patient_data={"nome": "Maria", "cpf": "1", "email": "m@example.com", "endereco": "Rua"}, **base)
+        assert engine.get_stats()["plan_hits"] == 1
+        assert "90% completos" in result.reason
+
+    def test_tabela_em_disco_atualizada(self):
+        """Testa que decision_table.json foi gerada com as regras atuais (scripts/build_decision_table.py)"""
+        with open(DECISION_TABLE_PATH, encoding="utf-8") as table_file:
+            em_disco = json.load(table_file)
+        assert em_disco == IntelligentDecisionEngine(memoize=False, decision_table=None).compile_decision_table()
+
+    def test_fingerprint_ignora_comentarios_e_docstrings(self):
+        """Testa que editar comentário/docstring mantém a tabela válida e mudar uma regra a invalida"""
+        with open(decision_engine.__file__.replace(".pyc", ".py"), encoding="utf-8") as source:
+            codigo = source.read()
+        original = _fingerprint_definitions(codigo)
+
+        comentado = codigo.replace('        """Aplica bônus contextual baseado em regras específicas"""',
+                                   '        """Bônus contextual"""\n        # Ajuste fino por tipo de decisão', 1)
+        assert comentado != codigo and _fingerprint_definitions(comentado) == original
+        outro_modulo = codigo.replace('"""Constrói explicação da decisão"""', '"""Explicação"""', 1)
+        assert _fingerprint_definitions(outro_modulo + "\n# fim\n") == original
+
+        regra = codigo.replace("DecisionType.CONFIRMAR: 0.85,", "DecisionType.CONFIRMAR: 0.86,", 1)
+        assert regra != codigo and _fingerprint_definitions(regra) != original
+
+    def test_tabela_igual_ao_motor_interpretado_em_todo_o_espaco(self):
+        """Testa que toda decisão sai da tabela e bate com a avaliação interpretada"""
+        tabela, interpretado = IntelligentDecisionEngine(), IntelligentDecisionEngine(memoize=False, decision_table=None)
+        assert tabela.table_entries == len(TransactionStage) * 2 * 3 * 2 * 3
+        for cenario in _cenarios():
+            assert _resumo(tabela.analyze_and_decide(**cenario)) == _resumo(interpretado.analyze_and_decide(**cenario)), cenario
+        stats = tabela.get_stats()
+        assert stats["plan_hits"] == stats["decisions"] and stats["plans"] == tabela.table_entries
+
+    def test_fatores_indexados_por_nome(self):
+        """Testa acesso por nome e seleção na ordem de coleta"""
+        factors = DecisionFactors(DecisionFactor(name, value, 0.5, None, "") for name, value in
+                                  (("current_stage", "inicial"), ("patient_data_completeness", 0.9), ("intended_action", "agendar")))
+        assert factors.value("intended_action") == "agendar" and factors.value("has_errors") is None
+        assert [f.name for f in factors.select(("intended_action", "patient_data_completeness"))] == \
+            ["patient_data_completeness", "intended_action"]
+        assert not hasattr(factors.get("current_stage"), "__dict__")
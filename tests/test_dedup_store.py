@@ -0,0 +1,136 @@
+import asyncio
+
+from app.utils.dedup_store import MessageDedupStore, RedisDedupBackend
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+class _RedisFalso:
+    """SET key value [NX] EX e DEL: NX grava só se a chave não existe (ou expirou)"""
+
+    def __init__(self, relogio):
+        self.relogio = relogio
+        self.chaves = {}
+        self.falhar = False
+
+    async def set(self, key, value, nx=False, ex=None):
+        if self.falhar:
+            raise ConnectionError("redis fora do ar")
+        expira = self.chaves.get(key)
+        if nx and expira is not None and expira > self.relogio():
+            return None
+        self.chaves[key] = self.relogio() + ex if ex else float("inf")
+        return True
+
+    async def delete(self, key):
+        if self.falhar:
+            raise ConnectionError("redis fora do ar")
+        return 1 if self.chaves.pop(key, None) is not None else 0
+
+def _backend(redis):
+    backend = RedisDedupBackend("redis://falso")
+    backend._client = redis
+    return backend
+
+class TestMessageDedupStore:
+
+    def test_lru_com_ttl(self):
+        """Testa duplicado dentro do TTL, ID novo depois dele e despejo do menos recente"""
+        relogio = _Relogio()
+        store = MessageDedupStore(max_entries=2, ttl_seconds=60, clock=relogio)
+
+        async def cenario():
+            assert await store.claim("a") is False
+            await store.complete("a")
+            assert await store.claim("a") is True
+            relogio.agora = 61
+            assert await store.claim("a") is False  # Expirou: processa de novo
+            await store.complete("a")
+
+            assert await store.claim("b") is False
+            await store.complete("b")
+            assert await store.claim("a") is True   # "a" passa a ser o mais recente
+            assert await store.claim("c") is False  # Despeja "b"
+            await store.complete("c")
+            assert await store.claim("b") is False
+            assert await store.claim("") is False
+
+        asyncio.run(cenario())
+        stats = store.get_stats()
+        assert (stats["memory_hits"], stats["evictions"], stats["entries"]) == (2, 2, 2)
+
+    def test_em_andamento_expira_no_inflight_ttl(self):
+        """Testa que um evento perdido no meio do processamento volta a ser aceito"""
+        relogio = _Relogio()
+        store = MessageDedupStore(ttl_seconds=3600, inflight_ttl=30, clock=relogio)
+
+        async def cenario():
+            assert await store.claim("msg-1") is False
+            assert await store.claim("msg-1") is True   # Em andamento
+            relogio.agora = 31                          # Worker caiu sem complete()
+            assert await store.claim("msg-1") is False
+
+        asyncio.run(cenario())
+
+    def test_release_libera_a_redelivery(self):
+        """Testa que release() após falha deixa a redelivery ser processada"""
+        store = MessageDedupStore(clock=_Relogio())
+
+        async def cenario():
+            assert await store.claim("msg-1") is False
+            await store.release("msg-1")
+            assert await store.claim("msg-1") is False
+
+        asyncio.run(cenario())
+        assert store.get_stats()["released"] == 1
+
+    def test_set_nx_ex_entre_workers(self):
+        """Testa que a redelivery em outro worker é duplicada até o EX do Redis expirar"""
+        relogio = _Relogio()
+        redis = _RedisFalso(relogio)
+        worker_a = MessageDedupStore(ttl_seconds=60, inflight_ttl=10, backend=_backend(redis), clock=relogio)
+        worker_b = MessageDedupStore(ttl_seconds=60, inflight_ttl=10, backend=_backend(redis), clock=relogio)
+
+        async def cenario():
+            assert await worker_a.claim("msg-1") is False
+            assert redis.chaves["chatbot:msgid:msg-1"] == 10   # Em andamento
+            await worker_a.complete("msg-1")
+            assert await worker_b.claim("msg-1") is True
+            assert await worker_b.claim("msg-1") is True  # Agora na memória do worker b
+            relogio.agora = 61
+            assert await worker_b.claim("msg-1") is False
+
+        asyncio.run(cenario())
+        assert (worker_b.backend_hits, worker_b.memory_hits) == (1, 1)
+        assert redis.chaves["chatbot:msgid:msg-1"] == 71
+
+    def test_release_remove_a_chave_no_redis(self):
+        """Testa que a falha em um worker libera a redelivery que cair em outro"""
+        redis = _RedisFalso(_Relogio())
+        worker_a = MessageDedupStore(backend=_backend(redis), clock=_Relogio())
+        worker_b = MessageDedupStore(backend=_backend(redis), clock=_Relogio())
+
+        async def cenario():
+            assert await worker_a.claim("msg-1") is False
+            await worker_a.release("msg-1")
+            assert await worker_b.claim("msg-1") is False
+
+        asyncio.run(cenario())
+        assert "chatbot:msgid:msg-1" in redis.chaves  # Reivindicado pelo worker b
+
+    def test_redis_fora_do_ar_falha_aberta(self):
+        """Testa que sem Redis a camada em memória continua deduplicando"""
+        redis = _RedisFalso(_Relogio())
+        redis.falhar = True
+        store = MessageDedupStore(backend=_backend(redis), clock=_Relogio())
+
+        async def cenario():
+            assert await store.claim("msg-1") is False
+            assert await store.claim("msg-1") is True
+
+        asyncio.run(cenario())
+        assert store.get_stats()["backend_errors"] == 1
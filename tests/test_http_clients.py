@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+from app.utils.http_clients import HTTPClientPool
+
+class TestHTTPClientPool:
+
+    def test_mesmo_loop_reutiliza_o_cliente(self):
+        """Testa um cliente por upstream no mesmo event loop"""
+        pool = HTTPClientPool(http2=False)
+
+        async def cenario():
+            primeiro = pool.get_client("zapi")
+            assert pool.get_client("zapi") is primeiro
+            assert pool.get_client("gestaods") is not primeiro
+            await pool.aclose()
+            return primeiro
+
+        assert asyncio.run(cenario()).is_closed
+        assert pool.get_stats()["clients"] == {}
+
+    def test_troca_de_loop_fecha_o_antigo_no_proprio_loop(self):
+        """Testa que o cliente de um loop parado é fechado quando esse loop volta a rodar"""
+        pool = HTTPClientPool(http2=False)
+        loop_antigo = asyncio.new_event_loop()
+
+        async def obter():
+            return pool.get_client("zapi")
+
+        try:
+            antigo = loop_antigo.run_until_complete(obter())
+            novo = asyncio.run(obter())
+            assert novo is not antigo and not antigo.is_closed
+            loop_antigo.run_until_complete(asyncio.sleep(0))
+            assert antigo.is_closed
+        finally:
+            loop_antigo.close()
+        assert pool.get_stats()["clients"]["zapi"]["created"] == 2
+
+    def test_troca_de_loop_com_loop_antigo_rodando_em_outra_thread(self):
+        """Testa o fechamento agendado com run_coroutine_threadsafe"""
+        pool = HTTPClientPool(http2=False)
+        loop_antigo = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop_antigo.run_forever, daemon=True)
+        thread.start()
+
+        async def obter():
+            return pool.get_client("zapi")
+
+        async def esperar_fechar(cliente):
+            while not cliente.is_closed:
+                await asyncio.sleep(0.001)
+
+        try:
+            antigo = asyncio.run_coroutine_threadsafe(obter(), loop_antigo).result(timeout=1)
+            asyncio.run(obter())
+            asyncio.run_coroutine_threadsafe(esperar_fechar(antigo), loop_antigo).result(timeout=1)
+        finally:
+            loop_antigo.call_soon_threadsafe(loop_antigo.stop)
+            thread.join(timeout=1)
+            loop_antigo.close()
+        assert antigo.is_closed
+
+    def test_loop_antigo_encerrado_nao_quebra(self):
+        """Testa que asyncio.run em sequência (scripts) troca o cliente sem erro"""
+        pool = HTTPClientPool(http2=False)
+
+        async def obter():
+            return pool.get_client("zapi")
+
+        primeiro = asyncio.run(obter())
+        segundo = asyncio.run(obter())
+        assert segundo is not primeiro
+        assert pool.get_stats()["clients"]["zapi"] == {"open": True, "created": 2}
@@ -0,0 +1,86 @@
+import asyncio
+
+from app.utils.keyed_lock import KeyedLockRegistry
+
+class TestKeyedLockRegistry:
+
+    def test_mesma_chave_em_ordem_fifo(self):
+        """Testa que turnos do mesmo telefone rodam um por vez, na ordem de chegada"""
+        locks = KeyedLockRegistry()
+        ordem, dentro = [], []
+
+        async def turno(i):
+            async with locks.lock("5531999990000"):
+                dentro.append(i)
+                assert len(dentro) == 1
+                await asyncio.sleep(0.001)
+                ordem.append(i)
+                dentro.remove(i)
+
+        async def cenario():
+            tarefas = []
+            for i in range(10):
+                tarefas.append(asyncio.create_task(turno(i)))
+                await asyncio.sleep(0)  # Chegam em ordem
+            await asyncio.gather(*tarefas)
+
+        asyncio.run(cenario())
+        assert ordem == list(range(10))
+        stats = locks.get_stats()
+        assert (stats["acquisitions"], stats["contended"], stats["active_keys"]) == (10, 9, 0)
+
+    def test_chaves_diferentes_em_paralelo(self):
+        """Testa que telefones diferentes não esperam um pelo outro"""
+        locks = KeyedLockRegistry()
+        todos_dentro = asyncio.Event()
+        dentro = set()
+
+        async def turno(phone):
+            async with locks.lock(phone):
+                dentro.add(phone)
+                if len(dentro) == 3:
+                    todos_dentro.set()
+                await asyncio.wait_for(todos_dentro.wait(), timeout=1)
+
+        async def cenario():
+            await asyncio.gather(*(turno(f"55319999900{i:02d}") for i in range(3)))
+
+        asyncio.run(cenario())
+        assert locks.get_stats()["contended"] == 0
+        assert locks.get_stats()["max_active_keys"] == 3
+
+    def test_aguardando_cancelado_libera_a_entrada(self):
+        """Testa que cancelar quem espera não deixa a chave presa no registro"""
+        locks = KeyedLockRegistry()
+
+        async def cenario():
+            liberar = asyncio.Event()
+
+            async def detentor():
+                async with locks.lock("a"):
+                    await liberar.wait()
+
+            async def aguardando():
+                async with locks.lock("a"):
+                    pass
+
+            primeiro = asyncio.create_task(detentor())
+            await asyncio.sleep(0)
+            segundo = asyncio.create_task(aguardando())
+            await asyncio.sleep(0)
+            assert locks._entries["a"].refs == 2
+
+            segundo.cancel()
+            await asyncio.gather(segundo, return_exceptions=True)
+            assert locks._entries["a"].refs == 1
+
+            liberar.set()
+            await primeiro
+            assert locks._entries == {}
+
+            # A chave continua utilizável depois do cancelamento
+            async with locks.lock("a"):
+                pass
+
+        asyncio.run(cenario())
+        assert locks.get_stats()["active_keys"] == 0
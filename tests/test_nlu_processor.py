@@ -0,0 +1,128 @@
+import re
+
+from app.utils.nlu_processor import NLUProcessor
+from app.utils.pattern_matcher import PatternMatcher
+
+# Mensagens reais do fluxo + casos de borda (prefixos, sobreposição, acentos, dígitos)
+CORPUS = [
+    "1", "2", "0", "5", "12345678909", "123.456.789-09", "oi", "Olá!", "bom dia", "boa  tarde",
+    "e ai", "eai tudo bem", "hello", "quero agendar uma consulta", "preciso de marcar",
+    "tem vaga amanhã de manhã?", "tem horário na sexta às 14h", "ver meus agendamentos",
+    "quando é minha consulta", "qual meu agendamento", "tenho consulta hoje?", "quero cancelar",
+    "não vou poder ir", "nao vou conseguir comparecer", "desmarcar horario", "reagendar para outro dia",
+    "pode ser outra data?", "me avisa quando tiver vaga", "entrar na lista de espera",
+    "fila de espera", "aguardar", "ajuda", "como funciona?", "não entendi", "pode me ajudar",
+    "preciso de ajuda", "sim", "s", "ok", "okay", "certo", "isso mesmo", "exato", "não", "n",
+    "negativo", "errado", "tchau", "até logo", "sair", "encerrar", "falar com atendente",
+    "quero falar com uma pessoa", "alguém aí?", "urgente, estou com dor", "febre desde ontem",
+    "meu email é maria.silva@example.com", "telefone (31) 99999-0000", "31999990000",
+    "às 9 horas", "10:30", "sábado ou domingo", "terça de tarde", "simples", "sapato", "xyz",
+    "obrigado, ótimo atendimento", "péssimo, demora demais", "", "   ", "?", "okaysim", "nnn",
+]
+
+def _intent_legado(nlu, text):
+    """Algoritmo anterior: re.search em todos os padrões, na ordem"""
+    best_intent, best_confidence = None, 0.0
+    for intent, patterns in nlu.intents.items():
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                confidence = min(len(match.group()) / len(text) * 1.5, 1.0)
+                if confidence > best_confidence:
+                    best_intent, best_confidence = intent, confidence
+    if not best_intent:
+        best_intent, best_confidence = nlu._classify_by_context(text)
+    return best_intent, best_confidence
+
+def _entidades_legado(nlu, text):
+    extracted = {}
+    for entity_type, patterns in nlu.entities.items():
+        matches = []
+        for pattern in patterns:
+            matches.extend(re.findall(pattern, text, re.IGNORECASE))
+        if matches:
+            extracted[entity_type] = set(matches)
+    return extracted
+
+class TestNLUProcessor:
+
+    def test_equivalencia_com_busca_padrao_a_padrao(self):
+        """Testa que intenção, confiança e entidades são idênticas às do algoritmo anterior"""
+        nlu = NLUProcessor()
+        for message in CORPUS:
+            result = nlu.process_message(message)
+            text = result['normalized_message']
+            assert (result['intent'], result['confidence']) == _intent_legado(nlu, text), message
+            entidades = {tipo: set(valores) for tipo, valores in result['entities'].items()}
+            assert entidades == _entidades_legado(nlu, text), message
+            assert list(result['entities']) == list(_entidades_legado(nlu, text)), message
+
+    def test_pre_filtro_descarta_padroes_sem_literal(self):
+        """Testa que a mensagem '1' só verifica os padrões que podem casar"""
+        matcher = PatternMatcher({"a": [r"\b(sim|ok|1)\b"], "b": [r"\bagendar\b"], "c": [r"\b\d{11}\b"]})
+        assert matcher.candidates("1") == [0, 2]
+        assert matcher.candidates("quero agendar") == [1, 2]
+
+    def test_literal_prefixo_de_outro_na_mesma_posicao(self):
+        """Testa que 's' é encontrado mesmo quando 'sim' é o literal reportado"""
+        matcher = PatternMatcher({"sim": [r"\bsim\b"], "s": [r"^s"]})
+        assert matcher.candidates("sim") == [0, 1]
+        assert [nome for nome, _ in matcher.search("simples")] == ["s"]
+
+class TestNLUSobDemanda:
+
+    def test_calcula_so_o_que_foi_lido(self):
+        """Testa que o perfil vazio não analisa nada até o handler ler uma chave"""
+        nlu = NLUProcessor()
+        result = nlu.process_message("quero agendar", needs=(), state="aguardando_cpf")
+        assert result.computed() == {"original_message": "quero agendar"}
+
+        assert result["intent"] == "agendar"
+        assert set(result.computed()) == {"original_message", "normalized_message", "intent",
+                                          "confidence", "is_greeting", "is_farewell"}
+
+        stats = nlu.get_stats()["aguardando_cpf"]
+        assert stats["messages"] == 1
+        assert stats["features"] == {"normalized": 1, "intent": 1, "entities": 0, "sentiment": 0, "is_question": 0}
+
+    def test_resultado_sob_demanda_igual_ao_completo(self):
+        """Testa que ler todas as chaves dá o mesmo resultado da análise completa"""
+        nlu = NLUProcessor()
+        for message in CORPUS:
+            assert dict(nlu.process_message(message, needs=("entities",))) == dict(nlu.process_message(message)), message
+
+class TestMemoNLU:
+
+    def test_vocabulario_aquecido_e_hit_rate(self):
+        """Testa que '1' e 'oi' saem do memo já no primeiro turno"""
+        nlu = NLUProcessor(memo_size=64)
+        assert nlu.process_message("1")["intent"] == "confirmacao"
+        assert nlu.process_message("Oi")["intent"] == "saudacao"
+        stats = nlu.get_memo_stats()
+        assert (stats["hits"], stats["misses"]) == (2, 0)
+        assert nlu.get_stats()["sem_estado"]["features"]["intent"] == 0
+
+    def test_lru_limitado_e_resultado_isolado(self):
+        """Testa despejo do menos usado e que alterar o resultado não corrompe o memo"""
+        nlu = NLUProcessor(memo_size=2, memo_max_length=32)
+        nlu.process_message("amanha de manha")["entities"]["tempo"].append("x")
+        assert "x" not in nlu.process_message("amanha de manha")["entities"]["tempo"]
+        nlu.process_message("sexta")
+        nlu.process_message("sabado")
+        assert nlu.get_memo_stats()["entries"] == 2
+        assert nlu.get_memo_stats()["evictions"] >= 1
+
+        texto_longo = "quero agendar uma consulta para a semana que vem"
+        nlu.process_message(texto_longo)
+        assert texto_longo not in nlu._memo
+
+class TestNLUEmLote:
+
+    def test_lote_igual_ao_processamento_individual(self):
+        """Testa process_batch no processo e no pool, na ordem de entrada"""
+        nlu = NLUProcessor()
+        esperado = [dict(nlu.process_message(message)) for message in CORPUS]
+        assert list(nlu.process_batch(iter(CORPUS))) == esperado
+        assert list(nlu.process_batch(CORPUS, workers=2, chunk_size=16)) == esperado
+        assert list(nlu.process_batch(["1", "oi"], needs=())) == [{"original_message": "1"}, {"original_message": "oi"}]
+
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.patient_transaction import Base as AuditBase, PatientCache
+from app.services.patient_cache import TieredPatientCache
+
+CPF, PHONE = "12345678901", "5531999990000"
+PACIENTE = {"nome": "Maria Aparecida da Silva", "cpf": CPF}
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+def _sessao():
+    engine = sqlalchemy.create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    AuditBase.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+class TestTieredPatientCache:
+
+    def test_l1_na_frente_da_tabela_e_leitura_sem_update(self):
+        """Testa hits do L1/L2 e que linha expirada volta is_stale sem alterar a linha"""
+        Session = _sessao()
+        db = Session()
+        cache = TieredPatientCache(clock=_Relogio())
+
+        async def cenario():
+            assert await cache.get(CPF, PHONE, db) is None
+            await cache.refresh(CPF, PHONE, PACIENTE, db)
+
+            outro = TieredPatientCache()  # Outro worker: L1 vazio
+            assert (await outro.get(CPF, PHONE, db)).patient_data == PACIENTE
+            assert (await outro.get(CPF, PHONE, db)).patient_data == PACIENTE
+            stats = outro.get_stats()
+            assert (stats["l1"]["hits"], stats["l2"]["hits"], stats["l1"]["hit_rate"]) == (1, 1, 0.5)
+
+            entrada = await cache.get(CPF, PHONE, db)
+            entrada.patient_data["nome"] = "alterado"
+            assert (await cache.get(CPF, PHONE, db)).patient_data == PACIENTE
+
+            db.query(PatientCache).update({PatientCache.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+            expirado = await TieredPatientCache().get(CPF, PHONE, db)
+            assert expirado.is_stale
+            assert not db.new and not db.dirty
+
+        asyncio.run(cenario())
+        assert Session().query(PatientCache).one().is_stale is False
+
+    def test_refresh_sem_mudanca_nao_regrava(self):
+        """Testa que o mesmo data_hash não grava (ou só estende a validade perto de expirar)"""
+        db = _sessao()()
+        cache = TieredPatientCache()
+
+        async def cenario():
+            await cache.refresh(CPF, PHONE, PACIENTE, db)
+            await cache.refresh(CPF, PHONE, dict(reversed(list(PACIENTE.items()))), db)
+            assert db.query(PatientCache.validation_count).scalar() == 1
+
+            db.query(PatientCache).update({PatientCache.expires_at: datetime.utcnow() + timedelta(seconds=60)})
+            db.commit()
+            await cache.refresh(CPF, PHONE, PACIENTE, db)
+            await cache.refresh(CPF, PHONE, {**PACIENTE, "email": "maria@example.com"}, db)
+
+        asyncio.run(cenario())
+        assert cache.get_stats()["writes"] == {"inserts": 1, "updates": 1, "extends": 1, "unchanged_skips": 1}
+        linha = db.query(PatientCache).one()
+        assert linha.validation_count == 3 and linha.patient_data["email"] == "maria@example.com"
+        assert linha.expires_at > datetime.utcnow() + timedelta(seconds=290)
+
+    def test_atualizacao_de_outro_worker_pelo_data_hash(self):
+        """Testa que o L1 revalida pelo data_hash depois de l1_ttl e relê a linha alterada"""
+        db = _sessao()()
+        relogio = _Relogio()
+        a, b = TieredPatientCache(l1_ttl=30, clock=relogio), TieredPatientCache(l1_ttl=30, clock=relogio)
+        novo = {**PACIENTE, "telefone": "(31) 98888-0000"}
+
+        async def cenario():
+            await a.refresh(CPF, PHONE, PACIENTE, db)
+            assert (await b.get(CPF, PHONE, db)).patient_data == PACIENTE
+            relogio.agora = 31
+            assert (await b.get(CPF, PHONE, db)).patient_data == PACIENTE  # revalidado, hash igual
+            await a.refresh(CPF, PHONE, novo, db)
+            relogio.agora = 40
+            assert (await b.get(CPF, PHONE, db)).patient_data == PACIENTE  # dentro do l1_ttl
+            relogio.agora = 62
+            assert (await b.get(CPF, PHONE, db)).patient_data == novo
+
+        asyncio.run(cenario())
+        stats = b.get_stats()
+        assert (stats["l2"]["hits"], stats["l2"]["revalidated"], stats["l1"]["hits"]) == (2, 1, 1)
@@ -0,0 +1,74 @@
+import asyncio
+
+from app.utils.single_flight import SingleFlight
+
+class TestSingleFlight:
+
+    def test_chamadas_identicas_coalescem(self):
+        """Testa uma execução para chamadas concorrentes e cópia do resultado para os coalescidos"""
+        flights = SingleFlight()
+        execucoes = []
+
+        async def buscar():
+            execucoes.append(1)
+            await asyncio.sleep(0.01)
+            return {"nome": "Maria", "horarios": ["08:00"]}
+
+        async def cenario():
+            resultados = await asyncio.gather(*(flights.do("paciente", buscar, label="GET paciente")
+                                                for _ in range(5)))
+            resultados[1]["horarios"].append("09:00")
+            depois = await flights.do("paciente", buscar, label="GET paciente")
+            return resultados, depois
+
+        resultados, depois = asyncio.run(cenario())
+        assert len(execucoes) == 2
+        assert resultados[0] == resultados[2] == {"nome": "Maria", "horarios": ["08:00"]}
+        assert depois == {"nome": "Maria", "horarios": ["08:00"]}
+        stats = flights.get_stats()
+        assert stats["inflight"] == 0
+        assert stats["endpoints"]["GET paciente"] == {"calls": 6, "upstream": 2, "coalesced": 4,
+                                                      "coalescing_ratio": 0.6667}
+
+    def test_cancelar_um_chamador_nao_cancela_a_execucao(self):
+        """Testa que o timeout de um chamador não derruba os outros que aguardam a mesma chave"""
+        flights = SingleFlight()
+
+        async def cenario():
+            liberar = asyncio.Event()
+
+            async def buscar():
+                await liberar.wait()
+                return ["2026-10-20"]
+
+            primeiro = asyncio.create_task(flights.do("dias", buscar))
+            await asyncio.sleep(0)
+            segundo = asyncio.create_task(flights.do("dias", buscar))
+            await asyncio.sleep(0)
+
+            primeiro.cancel()
+            await asyncio.gather(primeiro, return_exceptions=True)
+            assert flights.get_stats()["inflight"] == 1
+
+            liberar.set()
+            return primeiro, await segundo
+
+        primeiro, resultado = asyncio.run(cenario())
+        assert primeiro.cancelled()
+        assert resultado == ["2026-10-20"]
+        assert flights.get_stats()["inflight"] == 0
+
+    def test_excecao_entregue_a_todos(self):
+        """Testa que a falha chega a todos os chamadores e a chave é liberada"""
+        flights = SingleFlight()
+
+        async def falhar():
+            await asyncio.sleep(0)
+            raise ConnectionError("GestãoDS fora do ar")
+
+        async def cenario():
+            return await asyncio.gather(*(flights.do("x", falhar) for _ in range(3)), return_exceptions=True)
+
+        resultados = asyncio.run(cenario())
+        assert all(isinstance(r, ConnectionError) for r in resultados)
+        assert flights.get_stats()["inflight"] == 0
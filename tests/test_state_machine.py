@@ -0,0 +1,38 @@
+import pytest
+
+from app.services.state_machine import STATE_GRAPH, COMPILED_STATES, compile_state_graph
+from app.services.state_manager import StateManager
+from app.utils.context_validator import ContextValidator
+
+class TestGrafoDeEstados:
+
+    def test_handlers_existem_no_manager(self):
+        """Testa que todo handler do grafo é um método do ConversationManager"""
+        pytest.importorskip("sqlalchemy")
+        from app.services.conversation import ConversationManager
+        for estado, spec in STATE_GRAPH.items():
+            if spec.get("handler"):
+                assert callable(getattr(ConversationManager, spec["handler"], None)), estado
+
+    def test_transicao_para_estado_inexistente_falha_na_compilacao(self):
+        """Testa que o grafo é validado ao compilar"""
+        with pytest.raises(ValueError):
+            compile_state_graph({"inicio": {"transitions": ["menu_principal"]}})
+
+    def test_entrada_expecting_e_transicao(self):
+        """Testa as checagens O(1) da entrada compilada"""
+        cpf = COMPILED_STATES["aguardando_cpf"]
+        assert cpf.accepts_expecting(None) and cpf.accepts_expecting("menu_option")
+        assert not cpf.accepts_expecting("escolha_data")
+        assert cpf.accepts_input("123.456.789-01") and not cpf.accepts_input("abc")
+        assert cpf.can_transition_to("confirmando_paciente")
+        assert cpf.can_transition_to("aguardando_cpf")
+        assert not cpf.can_transition_to("confirmando_agendamento")
+
+    def test_visoes_derivadas_do_grafo(self):
+        """Testa que StateManager e ContextValidator usam o mesmo grafo"""
+        manager = StateManager()
+        validator = ContextValidator()
+        assert set(manager.states) == set(STATE_GRAPH) == validator.valid_states
+        assert manager.can_transition_to("menu_principal", "aguardando_cpf") == (True, "")
+        assert validator.state_validation_patterns["menu_principal"]["valid_inputs"] == ["1", "2", "3", "4", "5", "0"]
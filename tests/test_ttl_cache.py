@@ -0,0 +1,65 @@
+from app.utils.ttl_cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTTLCache:
+
+    def test_set_e_lookup(self):
+        """Testa armazenamento e leitura de valor"""
+        cache = TTLCache(default_ttl=60)
+        cache.set("paciente_1", {"nome": "Maria"})
+        assert cache.lookup("paciente_1") == (True, {"nome": "Maria"})
+        assert cache.lookup("paciente_2") == (False, None)
+
+    def test_expiracao_por_ttl(self):
+        """Testa expiração com TTL por chave"""
+        clock = FakeClock()
+        cache = TTLCache(default_ttl=60, clock=clock)
+        cache.set("curto", 1, ttl=5)
+        cache.set("longo", 2)
+        clock.now = 10
+        assert cache.get("curto") is None
+        assert cache.get("longo") == 2
+        assert cache.get_stats()["expirations"] == 1
+        assert len(cache) == 1
+
+    def test_cache_negativo(self):
+        """Testa cache de CPF não encontrado"""
+        clock = FakeClock()
+        cache = TTLCache(negative_ttl=30, clock=clock)
+        cache.set_negative("paciente_000")
+        assert cache.lookup("paciente_000") == (True, None)
+        clock.now = 31
+        assert cache.lookup("paciente_000") == (False, None)
+        stats = cache.get_stats()
+        assert stats["negative_hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_despejo_lru_por_quantidade(self):
+        """Testa despejo da entrada menos usada recentemente"""
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_teto_de_memoria(self):
+        """Testa despejo ao exceder o teto de bytes"""
+        cache = TTLCache(max_entries=100, max_bytes=50)
+        cache.set("a", "x" * 30)
+        cache.set("b", "y" * 30)
+        assert cache.get("a") is None
+        assert cache.get("b") == "y" * 30
+        assert cache.get_stats()["bytes"] <= 50
+
+        cache.set("grande", "z" * 100)
+        assert cache.get("grande") is None
@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+
+from app.services.webhook_queue import WebhookIngestionQueue
+
+def _evento(i):
+    return {"type": "ReceivedCallback", "messageId": f"msg-{i}", "phone": "5531999990000",
+            "fromMe": False, "text": {"message": str(i)}}
+
+class _ProcessadorFalso:
+    """Registra os eventos; segura cada um até liberar ser setado"""
+
+    def __init__(self, falhar_em=None):
+        self.processados = []
+        self.liberar = asyncio.Event()
+        self.falhar_em = falhar_em
+
+    async def __call__(self, data):
+        await self.liberar.wait()
+        if data["messageId"] == self.falhar_em:
+            raise RuntimeError("falha no turno")
+        self.processados.append(data["messageId"])
+
+class TestWebhookIngestionQueue:
+
+    def test_fila_cheia_rejeita_sem_bloquear(self):
+        """Testa que com workers ocupados e fila cheia o enqueue retorna False na hora"""
+        async def cenario():
+            processador = _ProcessadorFalso()
+            fila = WebhookIngestionQueue(processador, workers=1, maxsize=2)
+            assert fila.enqueue(_evento(0))
+            await asyncio.sleep(0)  # Worker pega o primeiro e fica preso
+            assert fila.enqueue(_evento(1)) and fila.enqueue(_evento(2))
+            assert fila.enqueue(_evento(3)) is False
+
+            processador.liberar.set()
+            await fila.stop()
+            return processador, fila
+
+        processador, fila = asyncio.run(cenario())
+        assert processador.processados == ["msg-0", "msg-1", "msg-2"]
+        stats = fila.get_stats()
+        assert (stats["enqueued"], stats["rejected"], stats["processed"]) == (3, 1, 3)
+
+    def test_stop_drena_e_encerra_os_workers(self):
+        """Testa que stop() processa o que está na fila, conta falhas e cancela os workers"""
+        async def cenario():
+            processador = _ProcessadorFalso(falhar_em="msg-2")
+            processador.liberar.set()
+            fila = WebhookIngestionQueue(processador, workers=2, maxsize=100)
+            for i in range(10):
+                assert fila.enqueue(_evento(i))
+            workers = list(fila._workers)
+            await fila.stop()
+            assert all(worker.done() for worker in workers)
+            return processador, fila
+
+        processador, fila = asyncio.run(cenario())
+        assert sorted(processador.processados) == sorted(f"msg-{i}" for i in range(10) if i != 2)
+        stats = fila.get_stats()
+        assert (stats["processed"], stats["failed"], stats["running"], stats["depth"]) == (9, 1, False, 0)
+
+    def test_stop_com_timeout_de_drenagem(self):
+        """Testa que um evento travado não segura o shutdown além do drain_timeout"""
+        async def cenario():
+            processador = _ProcessadorFalso()
+            fila = WebhookIngestionQueue(processador, workers=1, maxsize=10)
+            fila.enqueue(_evento(0))
+            fila.enqueue(_evento(1))
+            await asyncio.wait_for(fila.stop(drain_timeout=0.05), timeout=1)
+            return processador, fila
+
+        processador, fila = asyncio.run(cenario())
+        assert processador.processados == []
+        assert fila.running is False
+
+class TestIngestaoInline:
+
+    @pytest.fixture
+    def webhook(self, monkeypatch):
+        pytest.importorskip("fastapi")
+        from app.handlers import webhook
+        from app.utils.dedup_store import MessageDedupStore
+
+        monkeypatch.setattr(webhook, "_dedup_store", MessageDedupStore())
+        monkeypatch.setattr(webhook, "get_db", lambda: None)
+        monkeypatch.setattr(webhook, "INLINE_PROCESSING_TIMEOUT", 0.05)
+        return webhook
+
+    def test_fila_cheia_cai_no_processamento_inline_com_timeout(self, webhook, monkeypatch):
+        """Testa o fallback inline quando a fila rejeita e o timeout que libera o messageId"""
+        inline = []
+
+        async def processamento_lento(data, db):
+            inline.append(data["messageId"])
+            await asyncio.sleep(1)
+
+        monkeypatch.setattr(webhook, "process_message_event", processamento_lento)
+        monkeypatch.setattr(webhook.settings, "webhook_async_ingestion", True)
+
+        async def cenario():
+            fila = WebhookIngestionQueue(_ProcessadorFalso(), workers=1, maxsize=1)
+            monkeypatch.setattr(webhook, "_webhook_queue", fila)
+            fila.enqueue(_evento(0))
+            await asyncio.sleep(0)
+            fila.enqueue(_evento(1))
+
+            resultado = await webhook._ingest_received_callback(_evento(2))
+            redelivery = await webhook._ingest_received_callback(_evento(2))
+            fila._queue = asyncio.Queue()  # Descarta os eventos presos antes do stop
+            await fila.stop(drain_timeout=0)
+            return resultado, redelivery
+
+        resultado, redelivery = asyncio.run(cenario())
+        assert resultado["status"] == "timeout"
+        assert redelivery["status"] == "timeout"
+        assert inline == ["msg-2", "msg-2"]
+
+    def test_sem_fila_processa_inline(self, webhook, monkeypatch):
+        """Testa que com a ingestão assíncrona desligada o evento é processado na requisição"""
+        inline = []
+
+        async def processamento(data, db):
+            inline.append(data["messageId"])
+
+        monkeypatch.setattr(webhook, "process_message_event", processamento)
+        monkeypatch.setattr(webhook.settings, "webhook_async_ingestion", False)
+
+        async def cenario():
+            resultado = await webhook._ingest_received_callback(_evento(0))
+            redelivery = await webhook._ingest_received_callback(_evento(0))
+            return resultado, redelivery
+
+        resultado, redelivery = asyncio.run(cenario())
+        assert resultado["status"] == "success"
+        assert redelivery["status"] == "duplicate"
+        assert inline == ["msg-0"]
+
+    def test_falha_no_processamento_libera_o_message_id(self, webhook, monkeypatch):
+        """Testa que uma exceção no turno libera o ID para a redelivery da Z-API"""
+        tentativas = []
+
+        async def processamento(data, db):
+            tentativas.append(data["messageId"])
+            if len(tentativas) == 1:
+                raise RuntimeError("falha no turno")
+
+        monkeypatch.setattr(webhook, "process_message_event", processamento)
+        monkeypatch.setattr(webhook.settings, "webhook_async_ingestion", False)
+
+        async def cenario():
+            with pytest.raises(RuntimeError):
+                await webhook._ingest_received_callback(_evento(0))
+            return await webhook._ingest_received_callback(_evento(0))
+
+        assert asyncio.run(cenario())["status"] == "success"
+        assert tentativas == ["msg-0", "msg-0"]
+
+    def test_timeout_do_worker_libera_a_redelivery(self, webhook, monkeypatch):
+        """Testa que o job_timeout da fila libera o messageId e o sucesso o marca como processado"""
+        tentativas = []
+
+        async def processamento(data, db):
+            tentativas.append(data["messageId"])
+            if data["messageId"] == "msg-0" and tentativas.count("msg-0") == 1:
+                await asyncio.sleep(1)
+
+        monkeypatch.setattr(webhook, "process_message_event", processamento)
+        monkeypatch.setattr(webhook.settings, "webhook_async_ingestion", True)
+
+        async def cenario():
+            fila = WebhookIngestionQueue(webhook._process_queued_event, workers=1, maxsize=10, job_timeout=0.05)
+            monkeypatch.setattr(webhook, "_webhook_queue", fila)
+            respostas = [(await webhook._ingest_received_callback(_evento(0)))["status"]]
+            await fila.stop(drain_timeout=1)
+            for _ in range(2):  # Redelivery após o timeout e outra após o sucesso
+                respostas.append((await webhook._ingest_received_callback(_evento(0)))["status"])
+                await fila.stop(drain_timeout=1)
+            return respostas, fila
+
+        respostas, fila = asyncio.run(cenario())
+        assert respostas == ["queued", "queued", "duplicate"]
+        assert tentativas == ["msg-0", "msg-0"]
+        assert fila.timeouts == 1